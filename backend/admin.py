@@ -1,6 +1,7 @@
 """SQLAdmin panel configuration with enhanced UX."""
 
 import uuid
+from urllib.parse import urlencode
 from markupsafe import Markup
 from sqladmin import Admin, ModelView
 from sqladmin.authentication import AuthenticationBackend
@@ -48,8 +49,10 @@ ITEM_EFFECT_TYPE_CHOICES = [
 ]
 
 from config.settings import settings
-from models import User, Attribute, Item, ActiveEffect, Perk, UserPerk, Trader, Transaction
+from models import User, Attribute, Item, ActiveEffect, ExpiredEffect, Perk, UserPerk, Trader, Transaction, LoginEvent
 from models.base import sync_engine
+from services.catalog_cache import catalog_cache
+from services.image_store import thumbnail_url
 
 
 class AdminAuth(AuthenticationBackend):
@@ -75,9 +78,12 @@ def generate_uuid():
 
 
 def format_image(url):
-    """Format image URL as thumbnail."""
+    """Format image URL as thumbnail; stored images use their 128px WebP."""
     if url:
-        return Markup(f'<img src="{url}" style="max-width:60px;max-height:60px;border-radius:4px;" />')
+        return Markup(
+            f'<img src="{thumbnail_url(url, 128)}" loading="lazy" '
+            f'style="max-width:60px;max-height:60px;border-radius:4px;" />'
+        )
     return "-"
 
 
@@ -85,7 +91,7 @@ def format_qr(entity_type, entity_id):
     """Format QR code image."""
     if entity_id:
         qr_data = f"{entity_type}:{entity_id}"
-        qr_url = f"https://api.qrserver.com/v1/create-qr-code/?size=80x80&data={qr_data}"
+        qr_url = "/api/qr/image?" + urlencode({"data": qr_data, "box_size": 2})
         return Markup(f'<img src="{qr_url}" style="width:60px;height:60px;" title="{qr_data}" />')
     return "-"
 
@@ -162,6 +168,12 @@ class AttributeAdmin(ModelView, model=Attribute):
         "description": "Описание",
     }
 
+    async def after_model_change(self, data, model, is_created, request):
+        catalog_cache.invalidate("attributes")
+
+    async def after_model_delete(self, model, request):
+        catalog_cache.invalidate("attributes")
+
 
 class ItemAdmin(ModelView, model=Item):
     name = "Товар"
@@ -216,6 +228,12 @@ class ItemAdmin(ModelView, model=Item):
         if data.get("item_id"):
             data["item_id"] = data["item_id"].upper()
 
+    async def after_model_change(self, data, model, is_created, request):
+        catalog_cache.invalidate("items")
+
+    async def after_model_delete(self, model, request):
+        catalog_cache.invalidate("items")
+
 
 class PerkAdmin(ModelView, model=Perk):
     name = "Перк"
@@ -269,6 +287,12 @@ class PerkAdmin(ModelView, model=Perk):
         if data.get("perk_id"):
             data["perk_id"] = data["perk_id"].upper()
 
+    async def after_model_change(self, data, model, is_created, request):
+        catalog_cache.invalidate("perks")
+
+    async def after_model_delete(self, model, request):
+        catalog_cache.invalidate("perks")
+
 
 class UserPerkAdmin(ModelView, model=UserPerk):
     name = "Перк игрока"
@@ -307,6 +331,31 @@ class ActiveEffectAdmin(ModelView, model=ActiveEffect):
     }
 
 
+class ExpiredEffectAdmin(ModelView, model=ExpiredEffect):
+    name = "Истёкший эффект"
+    name_plural = "Истёкшие эффекты"
+    icon = "fa-solid fa-hourglass-end"
+
+    column_list = ["id", "user_id", "item_id", "effect_type", "effect_value", "applied_at", "expires_at", "expired_at"]
+    column_sortable_list = ["id", "expires_at", "expired_at"]
+    column_default_sort = [("expired_at", True)]
+
+    column_labels = {
+        "id": "ID",
+        "user_id": "ID игрока",
+        "item_id": "ID товара",
+        "effect_type": "Тип эффекта",
+        "effect_value": "Значение",
+        "applied_at": "Применён",
+        "expires_at": "Истёк",
+        "expired_at": "Архивирован",
+    }
+
+    can_create = False
+    can_edit = False
+    can_delete = False
+
+
 class TraderAdmin(ModelView, model=Trader):
     name = "Торговец"
     name_plural = "Торговцы"
@@ -345,6 +394,13 @@ class TraderAdmin(ModelView, model=Trader):
         if data.get("trader_id"):
             data["trader_id"] = data["trader_id"].upper()
 
+    async def after_model_change(self, data, model, is_created, request):
+        # items embed their trader's trader_id
+        catalog_cache.invalidate("traders", "items")
+
+    async def after_model_delete(self, model, request):
+        catalog_cache.invalidate("traders", "items")
+
 
 class TransactionAdmin(ModelView, model=Transaction):
     name = "Транзакция"
@@ -382,6 +438,29 @@ class TransactionAdmin(ModelView, model=Transaction):
     }
 
 
+class LoginEventAdmin(ModelView, model=LoginEvent):
+    name = "Вход"
+    name_plural = "Входы"
+    icon = "fa-solid fa-right-to-bracket"
+
+    column_list = ["id", "timestamp", "player_uuid", "telegram_id", "description"]
+    column_searchable_list = ["player_uuid"]
+    column_sortable_list = ["id", "timestamp"]
+    column_default_sort = [("timestamp", True)]
+
+    column_labels = {
+        "id": "ID",
+        "timestamp": "Время",
+        "player_uuid": "UUID",
+        "telegram_id": "Telegram ID",
+        "description": "Описание",
+    }
+
+    can_create = False
+    can_edit = False
+    can_delete = False
+
+
 def setup_admin(app):
     """Setup SQLAdmin with all models."""
     authentication_backend = AdminAuth(secret_key=settings.secret_key)
@@ -400,7 +479,9 @@ def setup_admin(app):
     admin.add_view(TraderAdmin)
     admin.add_view(UserPerkAdmin)
     admin.add_view(ActiveEffectAdmin)
+    admin.add_view(ExpiredEffectAdmin)
     admin.add_view(TransactionAdmin)
+    admin.add_view(LoginEventAdmin)
     admin.add_view(AttributeAdmin)
 
     return admin
@@ -1,14 +1,28 @@
 """Admin API endpoints."""
 
+import asyncio
 import base64
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form
-from pydantic import BaseModel
+import csv
+import io
+import json
+import tempfile
+from fastapi import APIRouter, HTTPException, Query, UploadFile, File, Form
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from typing import Optional
 
 from config.settings import settings
+from services.broadcast import broadcaster
+from services.catalog_cache import catalog_cache
 from services.database import db_service
-from services.imagegen import generate_image, upload_to_catbox
-from models import async_session, Attribute, Trader, Item, Perk, User
+from services.image_store import ImageStoreError
+from services.imagegen import image_jobs, store_image
+from services.importer import KINDS, Importer, read_csv, xlsx_sheets
+from services.qr_sheets import QR_KINDS, build_sheet, collect_codes
+from services.sheets_sync import sheets_sync
+from utils.metrics import metrics
+from models import async_session, engine, sync_engine, Attribute, Trader, Item, Perk, User
+from models.pool import pool_status
 from sqlalchemy import select
 
 router = APIRouter()
@@ -85,9 +99,47 @@ async def seed_database(request: VerifyRequest):
 
         await session.commit()
 
+    catalog_cache.invalidate()
     return {"success": True, "message": "Database seeded with test data"}
 
 
+@router.post("/import")
+async def import_data(
+    file: UploadFile = File(...),
+    password: str = Form(...),
+    kind: Optional[str] = Form(None),
+    dry_run: bool = Form(False),
+):
+    """
+    Import a CSV (one kind) or XLSX (a worksheet per kind) file. Requires admin password.
+
+    Rows are upserted by their id column (player_uuid, item_id, perk_id, ...);
+    the response has per-kind counts, rows per second and the first row errors.
+    """
+    if password != settings.admin_password:
+        raise HTTPException(status_code=401, detail="Неверный пароль")
+
+    filename = file.filename or ""
+    importer = Importer()
+    if filename.lower().endswith(".xlsx"):
+        try:
+            sheets = await asyncio.to_thread(xlsx_sheets, file.file)
+        except ImportError:
+            raise HTTPException(status_code=400, detail="XLSX import needs openpyxl installed")
+        except Exception:
+            raise HTTPException(status_code=400, detail="Cannot read XLSX file")
+        if not sheets:
+            raise HTTPException(status_code=400, detail=f"No worksheet named after a kind: {', '.join(KINDS)}")
+        reports = await importer.import_sheets(sheets, dry_run=dry_run)
+    else:
+        kind = kind or filename.rsplit(".", 1)[0].lower()
+        if kind not in KINDS:
+            raise HTTPException(status_code=400, detail=f"Unknown kind, expected one of: {', '.join(KINDS)}")
+        reports = [await importer.import_rows(kind, read_csv(file.file), dry_run=dry_run)]
+
+    return {"success": True, "dry_run": dry_run, "reports": [r.to_dict() for r in reports]}
+
+
 @router.get("/users")
 async def get_all_users():
     """Get all users for admin."""
@@ -117,10 +169,170 @@ async def get_all_traders():
 
 
 @router.get("/transactions")
-async def get_transactions(limit: int = 100):
-    """Get recent transactions."""
-    transactions = await db_service.get_transactions(limit)
-    return {"transactions": transactions}
+async def get_transactions(limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None):
+    """Get transactions newest-first; pass next_cursor back to get the next page."""
+    try:
+        transactions, next_cursor = await db_service.get_transactions_page(limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"transactions": transactions, "next_cursor": next_cursor}
+
+
+EXPORT_FIELDS = ["id", "timestamp", "from_type", "from_id", "to_type", "to_id", "amount", "tx_type", "description"]
+
+
+@router.get("/transactions/export")
+async def export_transactions(format: str = Query("ndjson", pattern="^(ndjson|csv)$")):
+    """Stream the whole ledger as NDJSON or CSV without loading it in memory."""
+
+    async def ndjson_rows():
+        async for tx in db_service.stream_transactions():
+            yield json.dumps(tx, ensure_ascii=False) + "\n"
+
+    async def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+        writer.writeheader()
+        rows = 0
+        async for tx in db_service.stream_transactions():
+            writer.writerow(tx)
+            rows += 1
+            if rows % 500 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    if format == "csv":
+        return StreamingResponse(
+            csv_rows(),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": 'attachment; filename="transactions.csv"'},
+        )
+    return StreamingResponse(
+        ndjson_rows(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="transactions.ndjson"'},
+    )
+
+
+QR_SHEET_MEDIA = {
+    "pdf": ("application/pdf", "qr_sheets.pdf"),
+    "png": ("application/zip", "qr_sheets_png.zip"),
+    "zip": ("application/zip", "qr_codes.zip"),
+}
+
+
+class QRSheetsRequest(BaseModel):
+    password: str
+    kinds: str = "login,pay,perk"  # comma-separated: login, send, pay, perk
+    format: str = Field("pdf", pattern="^(pdf|png|zip)$")
+    columns: int = Field(4, ge=1, le=8)
+
+
+@router.post("/qr-sheets")
+async def get_qr_sheets(request: QRSheetsRequest):
+    """Printable QR codes for every player, item and perk. Requires admin password."""
+    if request.password != settings.admin_password:
+        raise HTTPException(status_code=401, detail="Неверный пароль")
+    requested = [kind.strip().lower() for kind in request.kinds.split(",") if kind.strip()]
+    unknown = [kind for kind in requested if kind not in QR_KINDS]
+    if unknown or not requested:
+        raise HTTPException(status_code=400, detail=f"Unknown QR kinds: {', '.join(unknown) or request.kinds}")
+
+    codes = await collect_codes(requested)
+    # rendering and layout are CPU-bound, keep them off the event loop; pages go
+    # to a temporary file one at a time
+    out = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    try:
+        await asyncio.get_running_loop().run_in_executor(
+            None, build_sheet, codes, out, request.format, request.columns,
+        )
+    except Exception:
+        out.close()
+        raise
+    out.seek(0)
+
+    def chunks():
+        with out:
+            while chunk := out.read(256 * 1024):
+                yield chunk
+
+    media_type, filename = QR_SHEET_MEDIA[request.format]
+    return StreamingResponse(
+        chunks(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Get in-process counters and histograms."""
+    return metrics.snapshot()
+
+
+@router.get("/cache")
+async def get_cache_status():
+    """Catalog cache versions and hit/miss counters."""
+    counters = metrics.snapshot()["counters"]
+    return {
+        **catalog_cache.stats(),
+        "counters": {k: v for k, v in counters.items() if k.startswith("catalog_cache.")},
+    }
+
+
+@router.get("/pool")
+async def get_pool_status():
+    """Connection pool telemetry for the API and admin engines."""
+    return {
+        "engine": pool_status(engine.pool),
+        "sync_engine": pool_status(sync_engine.pool),
+    }
+
+
+@router.get("/sheets-sync")
+async def get_sheets_sync_status():
+    """Postgres -> Sheets export: cursors per worksheet, last run and last error."""
+    return sheets_sync.status()
+
+
+class BroadcastRequest(BaseModel):
+    password: str
+    text: str = Field(min_length=1, max_length=4096)
+
+
+@router.post("/broadcasts")
+async def create_broadcast(request: BroadcastRequest):
+    """Send a bot message to every player with a linked Telegram account. Requires admin password."""
+    if request.password != settings.admin_password:
+        raise HTTPException(status_code=401, detail="Неверный пароль")
+    broadcast = await broadcaster.create(request.text)
+    return {"success": True, "broadcast": broadcast}
+
+
+@router.get("/broadcasts")
+async def get_broadcasts(limit: int = Query(20, ge=1, le=100)):
+    """Recent broadcasts with progress, messages per second and ETA."""
+    return {"broadcasts": await broadcaster.get_status(limit=limit)}
+
+
+@router.get("/broadcasts/{broadcast_id}")
+async def get_broadcast(broadcast_id: int):
+    rows = await broadcaster.get_status(broadcast_id)
+    if not rows:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    return rows[0]
+
+
+@router.post("/broadcasts/{broadcast_id}/cancel")
+async def cancel_broadcast(broadcast_id: int, request: VerifyRequest):
+    """Stop a pending or running broadcast; messages already sent stay sent."""
+    if request.password != settings.admin_password:
+        raise HTTPException(status_code=401, detail="Неверный пароль")
+    if not await broadcaster.cancel(broadcast_id):
+        raise HTTPException(status_code=404, detail="No active broadcast with this id")
+    return {"success": True}
 
 
 class GenerateImageRequest(BaseModel):
@@ -129,9 +341,20 @@ class GenerateImageRequest(BaseModel):
     prompt: str
 
 
+def _require_image_jobs():
+    if not image_jobs.running:
+        # the job registry is per process; another worker's jobs would 404 here
+        raise HTTPException(status_code=503, detail="Image jobs run in another uvicorn worker; run a single worker")
+
+
 @router.post("/generate-image")
 async def generate_entity_image(request: GenerateImageRequest):
-    """Generate image for item or perk and save URL to database."""
+    """
+    Queue image generation for an item or perk.
+
+    Returns a job at once; poll GET /api/admin/image-jobs/{id} until it is
+    done, when the URL has been saved to the entity.
+    """
     if not settings.openrouter_api_key:
         raise HTTPException(status_code=400, detail="OpenRouter API key not configured")
 
@@ -147,30 +370,57 @@ async def generate_entity_image(request: GenerateImageRequest):
     else:
         raise HTTPException(status_code=400, detail="Invalid entity type")
 
-    # generate image
-    image_url = await generate_image(request.prompt)
-    if not image_url:
-        raise HTTPException(status_code=500, detail="Failed to generate image")
+    _require_image_jobs()
+    job = image_jobs.submit(request.entity_type, request.entity_id, request.prompt)
+    return {"success": True, "job": job.to_dict()}
 
-    # save URL to database
-    success = await db_service.update_entity_image(
-        request.entity_type,
-        request.entity_id,
-        image_url
-    )
 
-    if not success:
-        raise HTTPException(status_code=500, detail="Failed to save image URL")
+class GenerateMissingImagesRequest(BaseModel):
+    password: str
+    entity_type: Optional[str] = None  # "item", "perk" or both
 
-    return {
-        "success": True,
-        "image_url": image_url
-    }
+
+@router.post("/generate-missing-images")
+async def generate_missing_images(request: GenerateMissingImagesRequest):
+    """Queue image generation for every item/perk without an image. Requires admin password."""
+    if request.password != settings.admin_password:
+        raise HTTPException(status_code=401, detail="Неверный пароль")
+    if not settings.openrouter_api_key:
+        raise HTTPException(status_code=400, detail="OpenRouter API key not configured")
+    if request.entity_type not in (None, "item", "perk"):
+        raise HTTPException(status_code=400, detail="Invalid entity type")
+
+    _require_image_jobs()
+    jobs = await image_jobs.submit_missing((request.entity_type,) if request.entity_type else ("item", "perk"))
+    return {"success": True, "queued": len(jobs), "jobs": [job.id for job in jobs]}
+
+
+@router.get("/image-jobs")
+async def get_image_jobs(limit: int = Query(50, ge=1, le=1000)):
+    """Recent image jobs, newest first, with queue and cache counters."""
+    _require_image_jobs()
+    return {**image_jobs.stats(), "recent": image_jobs.recent(limit)}
+
+
+@router.get("/image-jobs/{job_id}")
+async def get_image_job(job_id: str):
+    _require_image_jobs()
+    job = image_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+async def _store_image(image_bytes: bytes):
+    try:
+        return await store_image(image_bytes)
+    except ImageStoreError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/upload-image")
 async def upload_image(file: UploadFile = File(...)):
-    """Upload image file and return hosted URL."""
+    """Upload image file to the image store and return its URL."""
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
@@ -179,12 +429,8 @@ async def upload_image(file: UploadFile = File(...)):
     if len(content) > 10 * 1024 * 1024:  # 10MB limit
         raise HTTPException(status_code=400, detail="File too large (max 10MB)")
 
-    # upload to catbox
-    url = await upload_to_catbox(content)
-    if not url:
-        raise HTTPException(status_code=500, detail="Failed to upload image")
-
-    return {"success": True, "url": url}
+    stored, mirror_url = await _store_image(content)
+    return {"success": True, **stored.to_dict(), "mirror_url": mirror_url}
 
 
 class Base64ImageRequest(BaseModel):
@@ -212,22 +458,19 @@ async def upload_image_base64(request: Base64ImageRequest):
     if len(image_bytes) > 10 * 1024 * 1024:  # 10MB limit
         raise HTTPException(status_code=400, detail="Image too large (max 10MB)")
 
-    # upload to catbox
-    url = await upload_to_catbox(image_bytes)
-    if not url:
-        raise HTTPException(status_code=500, detail="Failed to upload image")
+    stored, mirror_url = await _store_image(image_bytes)
 
     # if entity specified, save to database
     if request.entity_type and request.entity_id:
         success = await db_service.update_entity_image(
             request.entity_type,
             request.entity_id,
-            url
+            stored.url
         )
         if not success:
             raise HTTPException(status_code=500, detail="Failed to save image URL")
 
-    return {"success": True, "url": url}
+    return {"success": True, **stored.to_dict(), "mirror_url": mirror_url}
 
 
 class SetImageUrlRequest(BaseModel):
@@ -1,14 +1,14 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
 from typing import Optional
-import hashlib
-import hmac
-import urllib.parse
 
 from config.settings import settings
-from services.database import db_service
+from services.audit import audit_log
+from services.database import db_service, request_session
+from services.session_tokens import issue_token
+from services.webapp_auth import webapp_auth
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(request_session)])
 
 
 class LoginRequest(BaseModel):
@@ -23,54 +23,7 @@ class LoginResponse(BaseModel):
     balance: int
     profession: str
     band: str
-
-
-def validate_webapp_data(init_data: str) -> Optional[dict]:
-    """Validate Telegram WebApp initData."""
-    try:
-        parsed = dict(urllib.parse.parse_qsl(init_data))
-        received_hash = parsed.pop("hash", None)
-
-        if not received_hash:
-            return None
-
-        # Sort and create data check string
-        data_check_string = "\n".join(
-            f"{k}={v}" for k, v in sorted(parsed.items())
-        )
-
-        # Create secret key
-        secret_key = hmac.new(
-            b"WebAppData",
-            settings.bot_token.encode(),
-            hashlib.sha256,
-        ).digest()
-
-        # Calculate hash
-        calculated_hash = hmac.new(
-            secret_key,
-            data_check_string.encode(),
-            hashlib.sha256,
-        ).hexdigest()
-
-        if calculated_hash == received_hash:
-            return parsed
-        return None
-    except Exception:
-        return None
-
-
-def parse_user_from_init_data(parsed_data: dict) -> Optional[int]:
-    """Extract user_id from parsed initData."""
-    import json
-    try:
-        user_str = parsed_data.get("user")
-        if user_str:
-            user_data = json.loads(user_str)
-            return user_data.get("id")
-    except Exception:
-        pass
-    return None
+    token: str  # send as Authorization: Bearer on player endpoints
 
 
 @router.post("/login", response_model=LoginResponse)
@@ -80,9 +33,9 @@ async def login(request: LoginRequest):
 
     # extract telegram user_id if init_data provided
     if request.init_data:
-        parsed_data = validate_webapp_data(request.init_data)
-        if parsed_data:
-            telegram_id = parse_user_from_init_data(parsed_data)
+        webapp_user = webapp_auth.validate(request.init_data)
+        if webapp_user:
+            telegram_id = webapp_user.telegram_id
 
     # Option 1: UUID-based login (primary)
     if request.player_uuid:
@@ -103,16 +56,8 @@ async def login(request: LoginRequest):
         if not request.password or request.password != settings.app_password:
             raise HTTPException(401, "Invalid password")
 
-    # log login transaction
-    await db_service.log_transaction(
-        from_type="system",
-        from_id="LOGIN",
-        to_type="player",
-        to_id=user["player_uuid"],
-        amount=0,
-        tx_type="login",
-        description=f"Вход: {user['name']}"
-    )
+    # queued, written in batches by the audit log writer
+    audit_log.log_login(user["player_uuid"], user["name"], telegram_id)
 
     return LoginResponse(
         player_uuid=user["player_uuid"],
@@ -120,4 +65,5 @@ async def login(request: LoginRequest):
         balance=user["balance"],
         profession=user.get("profession", ""),
         band=user.get("band", ""),
+        token=issue_token(user["id"], user["player_uuid"]),
     )
@@ -0,0 +1,51 @@
+"""Item and perk pictures from the local image store."""
+
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Path as PathParam, Request, Response
+from fastapi.responses import FileResponse
+
+from services.image_store import MEDIA_TYPES, THUMB_SIZES, image_store
+
+router = APIRouter()
+
+DIGEST = PathParam(..., pattern="^[0-9a-f]{64}$")
+# content-addressed: a URL always names the same bytes
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+
+def _not_modified(request: Request, etag: str) -> bool:
+    tags = request.headers.get("if-none-match", "")
+    return tags.strip() == "*" or etag in (tag.strip() for tag in tags.split(","))
+
+
+@router.get("/{digest}/{size}.webp")
+async def get_thumbnail(request: Request, size: int, digest: str = DIGEST):
+    """WebP thumbnail fitting size x size."""
+    if size not in THUMB_SIZES:
+        raise HTTPException(status_code=404, detail=f"Sizes: {', '.join(map(str, THUMB_SIZES))}")
+    etag = f'"{digest}-{size}"'
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=_headers(etag))
+    path = await asyncio.to_thread(image_store.find_thumbnail, digest, size)
+    if not path:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type="image/webp", headers=_headers(etag))
+
+
+@router.get("/{digest}.{ext}")
+async def get_image(request: Request, ext: str, digest: str = DIGEST):
+    """The image as uploaded."""
+    if ext not in MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="Image not found")
+    etag = f'"{digest}"'
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=_headers(etag))
+    path = image_store.find(digest, ext)
+    if not path:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type=MEDIA_TYPES[ext], headers=_headers(etag))
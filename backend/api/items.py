@@ -1,16 +1,19 @@
 """Items API endpoints."""
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from pydantic import BaseModel, Field
+from typing import Optional
 
-from services.database import db_service
+from services.database import db_service, request_session
+from services.session_tokens import SessionPlayer, current_player
+from services.webapp_auth import telegram_user
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(telegram_user), Depends(request_session)])
 
 
 class PurchaseRequest(BaseModel):
-    player_uuid: str
     item_id: str
+    idempotency_key: Optional[str] = Field(None, max_length=100)
 
 
 @router.get("/")
@@ -29,53 +32,36 @@ async def get_item(item_id: str):
     return item
 
 
-@router.post("/purchase")
-async def purchase_item(request: PurchaseRequest):
-    """Purchase an item (deduct balance, credit trader)."""
-    user = await db_service.get_user_by_uuid(request.player_uuid)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    item = await db_service.get_item_by_id(request.item_id)
-    if not item:
-        raise HTTPException(status_code=404, detail="Item not found")
+PURCHASE_ERRORS = {
+    "user_not_found": (404, "User not found"),
+    "item_not_found": (404, "Item not found"),
+    "insufficient_funds": (400, "Insufficient funds"),
+    "key_reused": (422, "Idempotency key was already used for a different purchase"),
+}
 
-    price = int(item.get("price", 0))
-    if user["balance"] < price:
-        raise HTTPException(status_code=400, detail="Insufficient funds")
 
-    # deduct from player
-    new_balance = user["balance"] - price
-    await db_service.update_balance(request.player_uuid, new_balance)
-
-    # credit trader if exists
-    trader_id = item.get("trader_id")
-    if trader_id:
-        trader = await db_service.get_trader_by_id(trader_id)
-        if trader:
-            new_trader_balance = int(trader.get("balance", 0)) + price
-            await db_service.update_trader_balance(trader_id, new_trader_balance)
-
-    # log transaction
-    await db_service.log_transaction(
-        from_type="player",
-        from_id=request.player_uuid,
-        to_type="trader" if trader_id else "system",
-        to_id=trader_id or "SYSTEM",
-        amount=price,
-        tx_type="purchase",
-        description=f"Покупка: {item.get('name', request.item_id)}"
+@router.post("/purchase")
+async def purchase_item(
+    request: PurchaseRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, max_length=100),
+    player: SessionPlayer = Depends(current_player),
+):
+    """
+    Purchase an item (deduct balance, credit trader, apply effect) atomically.
+
+    Send an Idempotency-Key header (or idempotency_key field) to make retries
+    safe: a repeated key returns the first result instead of charging again.
+    """
+    result, error, replayed = await db_service.purchase_item(
+        player.player_uuid,
+        request.item_id,
+        idempotency_key=idempotency_key or request.idempotency_key,
     )
+    if error:
+        status_code, detail = PURCHASE_ERRORS.get(error, (400, "Purchase failed"))
+        raise HTTPException(status_code=status_code, detail=detail)
 
-    # apply temporary effect if item has one
-    effect_applied = False
-    if item.get("effect_type") and item.get("effect_duration"):
-        effect_applied = await db_service.apply_item_effect(request.player_uuid, request.item_id)
-
-    return {
-        "success": True,
-        "item": item,
-        "paid": price,
-        "new_balance": new_balance,
-        "effect_applied": effect_applied
-    }
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
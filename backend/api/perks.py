@@ -1,15 +1,16 @@
 """Perks API endpoints."""
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
-from services.database import db_service
+from services.database import db_service, request_session
+from services.session_tokens import SessionPlayer, current_player
+from services.webapp_auth import telegram_user
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(telegram_user), Depends(request_session)])
 
 
 class ApplyPerkRequest(BaseModel):
-    player_uuid: str
     perk_id: str
 
 
@@ -29,29 +30,21 @@ async def get_perk(perk_id: str):
     return perk
 
 
-@router.get("/user/{player_uuid}")
-async def get_user_perks(player_uuid: str):
-    """Get all perks applied to user."""
-    user = await db_service.get_user_by_uuid(player_uuid)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    perks = await db_service.get_user_perks(player_uuid)
+@router.get("/user/me")
+async def get_user_perks(player: SessionPlayer = Depends(current_player)):
+    """Get all perks applied to the logged-in player."""
+    perks = await db_service.get_user_perks(user_id=player.id)
     return {"perks": perks}
 
 
 @router.post("/apply")
-async def apply_perk(request: ApplyPerkRequest):
-    """Apply a perk to user."""
-    user = await db_service.get_user_by_uuid(request.player_uuid)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
+async def apply_perk(request: ApplyPerkRequest, player: SessionPlayer = Depends(current_player)):
+    """Apply a perk to the logged-in player."""
     perk = await db_service.get_perk_by_id(request.perk_id)
     if not perk:
         raise HTTPException(status_code=404, detail="Perk not found")
 
-    success, error = await db_service.apply_perk(request.player_uuid, request.perk_id)
+    success, error = await db_service.apply_perk(player.player_uuid, request.perk_id)
     if not success:
         error_messages = {
             "already_applied": "Перк уже применён",
@@ -66,14 +59,14 @@ async def apply_perk(request: ApplyPerkRequest):
         from_type="system",
         from_id="PERK",
         to_type="player",
-        to_id=request.player_uuid,
+        to_id=player.player_uuid,
         amount=0,
         tx_type="perk",
         description=f"Перк: {perk.get('name', request.perk_id)}"
     )
 
     # get updated user stats
-    updated_user = await db_service.get_user_by_uuid(request.player_uuid)
+    updated_user = await db_service.get_user_by_id(player.id)
 
     return {
         "success": True,
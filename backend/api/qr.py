@@ -1,17 +1,76 @@
 """QR code parsing API."""
 
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, Response, UploadFile
+from pydantic import BaseModel, Field
+from typing import Optional
 
-from services.database import db_service
+from services.database import request_session
+from services.qr_decoder import decode_qr_async
+from services.qr_resolver import QRResolveError, resolve_payloads
+from services.qr import BACK_COLOR, FRONT_COLOR, qr_etag, render_qr_async
+from services.qr_sheets import PRINT_BACK, PRINT_FRONT, QR_KINDS
+from services.session_tokens import SessionPlayer, optional_player
+from services.webapp_auth import telegram_user
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(request_session)])
 
 
 class QRParseRequest(BaseModel):
     data: str
 
 
+class QRResolveRequest(BaseModel):
+    data: Optional[str] = None
+    payloads: Optional[list[str]] = Field(None, max_length=100)
+
+
+# PREFIX:id as the app prints them; ids are at most 50 characters
+QR_PAYLOAD = rf"^({'|'.join(QR_KINDS.values())}):\S{{1,50}}$"
+
+QR_THEMES = {
+    "terminal": (FRONT_COLOR, BACK_COLOR),
+    "print": (PRINT_FRONT, PRINT_BACK),
+}
+
+
+@router.get("/image")
+async def get_qr_image(
+    request: Request,
+    data: str = Query(..., pattern=QR_PAYLOAD),
+    box_size: int = Query(4, ge=1, le=20),
+    theme: str = Query("print", pattern="^(terminal|print)$"),
+):
+    """Render a game QR payload as PNG, cached in memory and by the browser."""
+    front_color, back_color = QR_THEMES[theme]
+    render_args = {"box_size": box_size, "front_color": front_color, "back_color": back_color}
+    etag = qr_etag(data, **render_args)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    # public: arbitrary ids must not fill up the on-disk store
+    image_bytes = await render_qr_async(data, persist=False, **render_args)
+    return Response(content=image_bytes, media_type="image/png", headers=headers)
+
+
+MAX_PHOTO_BYTES = 15 * 1024 * 1024
+
+
+@router.post("/decode-image")
+async def decode_qr_image(file: UploadFile = File(...)):
+    """Decode a QR code from an uploaded photo."""
+    image_bytes = await file.read(MAX_PHOTO_BYTES + 1)
+    if len(image_bytes) > MAX_PHOTO_BYTES:
+        raise HTTPException(status_code=413, detail="Image too large")
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="Empty image")
+
+    data, strategy = await decode_qr_async(image_bytes)
+    if not data:
+        raise HTTPException(status_code=422, detail="QR code not found")
+    return {"data": data, "strategy": strategy}
+
+
 @router.post("/parse")
 async def parse_qr(request: QRParseRequest):
     """
@@ -23,63 +82,35 @@ async def parse_qr(request: QRParseRequest):
     - SEND:UUID - send money to user
     - PERK:PERK_ID - apply perk
     """
-    data = request.data.strip()
-
-    if ":" not in data:
-        # legacy format - just UUID for login
-        user = await db_service.get_user_by_uuid(data.upper())
-        if user:
-            return {
-                "type": "login",
-                "data": {"player_uuid": data.upper(), "name": user["name"]}
-            }
-        raise HTTPException(status_code=400, detail="Invalid QR code")
-
-    parts = data.split(":", 1)
-    qr_type = parts[0].upper()
-    qr_value = parts[1].strip()
-
-    if qr_type == "LOGIN":
-        user = await db_service.get_user_by_uuid(qr_value.upper())
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        return {
-            "type": "login",
-            "data": {
-                "player_uuid": user["player_uuid"],
-                "name": user["name"]
-            }
-        }
-
-    elif qr_type == "PAY":
-        item = await db_service.get_item_by_id(qr_value)
-        if not item:
-            raise HTTPException(status_code=404, detail="Item not found")
-        return {
-            "type": "pay",
-            "data": item
-        }
-
-    elif qr_type == "SEND":
-        user = await db_service.get_user_by_uuid(qr_value.upper())
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        return {
-            "type": "send",
-            "data": {
-                "player_uuid": user["player_uuid"],
-                "name": user["name"]
-            }
-        }
-
-    elif qr_type == "PERK":
-        perk = await db_service.get_perk_by_id(qr_value)
-        if not perk:
-            raise HTTPException(status_code=404, detail="Perk not found")
-        return {
-            "type": "perk",
-            "data": perk
-        }
-
-    else:
-        raise HTTPException(status_code=400, detail=f"Unknown QR type: {qr_type}")
+    result, = await resolve_payloads([request.data])
+    if "detail" in result:
+        raise HTTPException(status_code=result["status_code"], detail=result["detail"])
+    return {"type": result["type"], "data": result["data"]}
+
+
+@router.post("/resolve", dependencies=[Depends(telegram_user)])
+async def resolve_qr(request: QRResolveRequest, player: Optional[SessionPlayer] = Depends(optional_player)):
+    """
+    Resolve scans with everything the confirm screen needs, in one DB round trip.
+
+    With a session token, pay scans also carry the player's balance and whether the
+    item's effect is already active, perk scans whether the perk is already
+    applied or taken. Send "payloads" instead of "data" to resolve a batch.
+    """
+    if request.payloads is None and request.data is None:
+        raise HTTPException(status_code=400, detail="data or payloads required")
+
+    try:
+        results = await resolve_payloads(
+            request.payloads if request.payloads is not None else [request.data],
+            player.player_uuid if player else None,
+        )
+    except QRResolveError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    if request.payloads is not None:
+        return {"results": results}
+    result, = results
+    if "detail" in result:
+        raise HTTPException(status_code=result["status_code"], detail=result["detail"])
+    return result
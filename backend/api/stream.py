@@ -0,0 +1,51 @@
+"""Push stream of player events (Server-Sent Events)."""
+
+import asyncio
+import json
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+
+from config.settings import settings
+from services.events import event_bus
+from services.session_tokens import SessionPlayer, current_player
+from services.webapp_auth import telegram_user
+
+# no request_session dependency: a stream must not hold a DB session open,
+# and the session token already names the player
+router = APIRouter(dependencies=[Depends(telegram_user)])
+
+
+@router.get("/")
+async def stream_player_events(request: Request, player: SessionPlayer = Depends(current_player)):
+    """
+    Balance, perk and effect changes for the logged-in player, as Server-Sent Events.
+
+    Events: balance {balance, received?, from_name?}, perk {perk_id, balance},
+    effect {action: added|expired, ...}. A comment is sent every
+    sse_keepalive seconds so proxies keep the connection open. EventSource
+    cannot send headers, so the session token may come as ?token=.
+    """
+    player_uuid = player.player_uuid
+
+    async def event_stream():
+        queue = event_bus.subscribe(player_uuid)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), settings.sse_keepalive)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            event_bus.unsubscribe(player_uuid, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
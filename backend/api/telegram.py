@@ -0,0 +1,30 @@
+"""Telegram webhook endpoint (BOT_MODE=webhook)."""
+
+import hmac
+
+from aiogram.types import Update
+from fastapi import APIRouter, Header, HTTPException, Request
+
+from config.settings import settings
+from bot.dispatcher import bot, dp, webhook_secret
+
+router = APIRouter()
+
+
+@router.post("/webhook")
+async def telegram_webhook(
+    request: Request,
+    x_telegram_bot_api_secret_token: str = Header(default=""),
+):
+    """Receive an update from Telegram and run it through the dispatcher."""
+    if settings.bot_mode != "webhook":
+        raise HTTPException(status_code=404, detail="Webhook disabled")
+    if not hmac.compare_digest(x_telegram_bot_api_secret_token, webhook_secret()):
+        raise HTTPException(status_code=403, detail="Invalid secret token")
+
+    update = Update.model_validate(await request.json(), context={"bot": bot})
+    # handlers slower than Telegram's timeout carry on in the background
+    method = await dp.feed_webhook_update(bot, update)
+    if method is not None:
+        await bot(method)
+    return {"ok": True}
@@ -1,13 +1,14 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
 
-from services.database import db_service
+from services.database import db_service, request_session
+from services.session_tokens import SessionPlayer, current_player
+from services.webapp_auth import telegram_user
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(telegram_user), Depends(request_session)])
 
 
 class TransferRequest(BaseModel):
-    from_uuid: str
     to_uuid: str
     amount: int
 
@@ -20,47 +21,29 @@ class TransferResponse(BaseModel):
 
 
 @router.post("/send", response_model=TransferResponse)
-async def send_money(request: TransferRequest):
+async def send_money(request: TransferRequest, player: SessionPlayer = Depends(current_player)):
     if request.amount <= 0:
         raise HTTPException(400, "Amount must be positive")
 
-    from_uuid = request.from_uuid.upper()
+    from_uuid = player.player_uuid
     to_uuid = request.to_uuid.upper()
 
     if from_uuid == to_uuid:
         raise HTTPException(400, "Cannot send to yourself")
 
-    sender = await db_service.get_user_by_uuid(from_uuid)
-    receiver = await db_service.get_user_by_uuid(to_uuid)
-
-    if not sender:
-        raise HTTPException(404, "Sender not found")
-    if not receiver:
-        raise HTTPException(404, "Receiver not found")
-    if sender["balance"] < request.amount:
-        raise HTTPException(400, "Insufficient funds")
-
-    # Execute transfer
-    new_sender_balance = sender["balance"] - request.amount
-    new_receiver_balance = receiver["balance"] + request.amount
-
-    await db_service.update_balance(from_uuid, new_sender_balance)
-    await db_service.update_balance(to_uuid, new_receiver_balance)
-
-    # log transaction
-    await db_service.log_transaction(
-        from_type="player",
-        from_id=from_uuid,
-        to_type="player",
-        to_id=to_uuid,
-        amount=request.amount,
-        tx_type="transfer",
-        description=f"{sender['name']} -> {receiver['name']}"
-    )
+    result, error = await db_service.transfer(from_uuid, to_uuid, request.amount)
+    if not result:
+        error_responses = {
+            "sender_not_found": (404, "Sender not found"),
+            "receiver_not_found": (404, "Receiver not found"),
+            "insufficient_funds": (400, "Insufficient funds"),
+        }
+        status_code, detail = error_responses.get(error, (400, "Transfer failed"))
+        raise HTTPException(status_code, detail)
 
     return TransferResponse(
         success=True,
-        new_balance=new_sender_balance,
-        transferred=request.amount,
-        to_name=receiver["name"],
+        new_balance=result["new_balance"],
+        transferred=result["transferred"],
+        to_name=result["to_name"],
     )
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, HTTPException, Query
+import base64
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import Response
 from pydantic import BaseModel
+from typing import Optional
 
-from services.database import db_service
-from services.qr import generate_qr_code, generate_qr_image
+from services.database import db_service, request_session
+from services.qr import qr_etag, render_qr_async
+from services.session_tokens import SessionPlayer, current_player
+from services.webapp_auth import telegram_user
 
-router = APIRouter()
+router = APIRouter(dependencies=[Depends(telegram_user), Depends(request_session)])
 
 
 class UserResponse(BaseModel):
@@ -47,8 +52,8 @@ class QRResponse(BaseModel):
 
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user(player_uuid: str = Query(...)):
-    user = await db_service.get_user_by_uuid(player_uuid.upper())
+async def get_current_user(player: SessionPlayer = Depends(current_player)):
+    user = await db_service.get_user_by_id(player.id)
     if not user:
         raise HTTPException(404, "User not found")
 
@@ -62,8 +67,8 @@ async def get_current_user(player_uuid: str = Query(...)):
 
 
 @router.get("/stats", response_model=StatsResponse)
-async def get_user_stats(player_uuid: str = Query(...)):
-    stats = await db_service.get_user_stats(player_uuid.upper())
+async def get_user_stats(player: SessionPlayer = Depends(current_player)):
+    stats = await db_service.get_user_stats(user_id=player.id)
     if not stats:
         raise HTTPException(404, "User not found")
 
@@ -71,18 +76,41 @@ async def get_user_stats(player_uuid: str = Query(...)):
 
 
 @router.get("/qr")
-async def get_user_qr(player_uuid: str = Query(...), format: str = Query("base64")):
-    """Get QR code for player UUID."""
-    user = await db_service.get_user_by_uuid(player_uuid.upper())
-    if not user:
-        raise HTTPException(404, "User not found")
-
+async def get_user_qr(
+    request: Request,
+    response: Response,
+    format: str = Query("base64"),
+    player: SessionPlayer = Depends(current_player),
+):
+    """Get the player's login QR code; no DB query, the token names the player."""
+    # the image never changes for a player, let the client revalidate cheaply
+    etag = qr_etag(player.player_uuid, variant=format)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    image_bytes = await render_qr_async(player.player_uuid)
     if format == "image":
-        image_bytes = generate_qr_image(player_uuid.upper())
-        return Response(content=image_bytes, media_type="image/png")
-
-    qr_base64 = generate_qr_code(player_uuid.upper())
-    return QRResponse(qr_base64=qr_base64)
+        return Response(content=image_bytes, media_type="image/png", headers=headers)
+
+    response.headers.update(headers)
+    return QRResponse(qr_base64=base64.b64encode(image_bytes).decode())
+
+
+@router.get("/transactions")
+async def get_user_transactions(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    player: SessionPlayer = Depends(current_player),
+):
+    """Player transaction history, newest first, keyset-paginated."""
+    try:
+        transactions, next_cursor = await db_service.get_user_transactions_page(
+            player.player_uuid, limit, cursor
+        )
+    except ValueError:
+        raise HTTPException(400, "Invalid cursor")
+    return {"transactions": transactions, "next_cursor": next_cursor}
 
 
 @router.get("/lookup", response_model=UserResponse)
@@ -0,0 +1,29 @@
+"""Standalone bot runner for BOT_MODE=external.
+
+Usage: python -m bot  (from backend/, same environment as the API)
+"""
+
+import asyncio
+import logging
+
+from config.settings import settings
+from bot.dispatcher import bot, dp, run_polling
+from models import init_db
+
+logging.basicConfig(
+    level=getattr(logging, settings.log_level),
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+)
+
+
+async def main():
+    await init_db()
+    try:
+        await run_polling(handle_signals=True)
+    finally:
+        await dp.storage.close()  # writes FSM states still waiting in the write-behind buffer
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,60 @@
+"""Bot and dispatcher shared by the API process and the standalone runner.
+
+settings.bot_mode picks who consumes updates:
+- "polling": the API process long-polls (single uvicorn worker only)
+- "webhook": Telegram posts to /api/telegram/webhook, any number of workers
+- "external": the API only sends messages; `python -m bot` polls elsewhere
+"""
+
+import hashlib
+import logging
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config.settings import settings
+from bot.handlers import main_router
+from bot.storage import DatabaseStorage
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_PATH = "/api/telegram/webhook"
+
+if settings.bot_api_url:
+    bot = Bot(token=settings.bot_token, session=AiohttpSession(api=TelegramAPIServer.from_base(settings.bot_api_url)))
+else:
+    bot = Bot(token=settings.bot_token)
+if settings.bot_fsm_storage == "database":
+    storage = DatabaseStorage(settings.bot_fsm_flush_interval, settings.bot_fsm_state_ttl)
+else:
+    storage = MemoryStorage()
+dp = Dispatcher(storage=storage)
+dp.include_router(main_router)
+
+
+def webhook_url() -> str:
+    return settings.bot_webhook_url or settings.webapp_url.rstrip("/") + WEBHOOK_PATH
+
+
+def webhook_secret() -> str:
+    """Secret Telegram echoes in X-Telegram-Bot-Api-Secret-Token."""
+    if settings.bot_webhook_secret:
+        return settings.bot_webhook_secret
+    # Telegram allows [A-Za-z0-9_-]; a hex digest of secret_key fits
+    return hashlib.sha256(f"telegram-webhook:{settings.secret_key}".encode()).hexdigest()
+
+
+async def setup_webhook():
+    """Register the webhook; every worker may call this, it is idempotent."""
+    url = webhook_url()
+    await bot.set_webhook(url, secret_token=webhook_secret(), allowed_updates=dp.resolve_used_update_types())
+    logger.info(f"Telegram webhook set to {url}")
+
+
+async def run_polling(handle_signals: bool = False):
+    """Long-poll until stopped; drops any webhook first, Telegram rejects both."""
+    logger.info("Starting Telegram bot polling...")
+    await bot.delete_webhook()
+    await dp.start_polling(bot, handle_signals=handle_signals, close_bot_session=False)
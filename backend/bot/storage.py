@@ -0,0 +1,169 @@
+"""Postgres-backed FSM storage for the bot dispatcher.
+
+States are read through an in-memory cache and written behind: changes are
+marked dirty and a background task upserts them every
+bot_fsm_flush_interval seconds, so a conversation step costs no DB write of
+its own. Cleared keys are deleted on flush; states idle for longer than
+bot_fsm_state_ttl are evicted from the cache and purged from the table.
+
+The cache belongs to one process. With several webhook workers sharing
+conversations set bot_fsm_flush_interval = 0: every change is written at
+once and every read goes to the database.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import async_session, BotState
+from models.base import now_local
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    used: float = field(default_factory=time.monotonic)
+
+
+def _key(key: StorageKey) -> str:
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+class DatabaseStorage(BaseStorage):
+    def __init__(self, flush_interval: float, state_ttl: int):
+        self.flush_interval = flush_interval
+        self.state_ttl = state_ttl
+        self.purge_interval = min(state_ttl, 300)
+        self._cache: dict[str, _Entry] = {}
+        self._dirty: set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        await self._changed(_key(key), entry)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._entry(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        entry = await self._entry(key)
+        entry.data = data.copy()
+        await self._changed(_key(key), entry)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return (await self._entry(key)).data.copy()
+
+    async def close(self) -> None:
+        """Stop the background task and write out pending changes."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _entry(self, key: StorageKey) -> _Entry:
+        k = _key(key)
+        entry = self._cache.get(k)
+        if entry is not None and self.flush_interval > 0:
+            entry.used = time.monotonic()
+            metrics.incr("bot_fsm.cache_hits")
+            return entry
+
+        metrics.incr("bot_fsm.loads")
+        async with async_session() as session:
+            row = (await session.execute(
+                select(BotState.state, BotState.data, BotState.updated_at).where(BotState.key == k)
+            )).first()
+        loaded = _Entry()
+        if row and row.updated_at >= now_local() - timedelta(seconds=self.state_ttl):
+            loaded = _Entry(state=row.state, data=row.data or {})
+        if self.flush_interval <= 0:
+            return loaded
+        # a concurrent load of the same key may have won meanwhile
+        return self._cache.setdefault(k, loaded)
+
+    async def _changed(self, k: str, entry: _Entry):
+        self._cache[k] = entry
+        self._dirty.add(k)
+        if self.flush_interval <= 0:
+            await self.flush()
+            if k not in self._dirty:
+                self._cache.pop(k, None)
+        elif self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        next_purge = time.monotonic() + self.purge_interval
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+            if time.monotonic() >= next_purge:
+                await self._purge()
+                next_purge = time.monotonic() + self.purge_interval
+
+    async def flush(self):
+        """Write dirty keys: upsert live states, delete cleared ones."""
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        now = now_local()
+        for k in keys:
+            entry = self._cache.get(k)
+            if entry is None or (entry.state is None and not entry.data):
+                deletes.append(k)
+            else:
+                upserts.append({"key": k, "state": entry.state, "data": entry.data, "updated_at": now})
+
+        try:
+            async with async_session() as session:
+                if upserts:
+                    stmt = pg_insert(BotState).values(upserts)
+                    await session.execute(stmt.on_conflict_do_update(
+                        index_elements=[BotState.key],
+                        set_={
+                            "state": stmt.excluded.state,
+                            "data": stmt.excluded.data,
+                            "updated_at": stmt.excluded.updated_at,
+                        },
+                    ))
+                if deletes:
+                    await session.execute(delete(BotState).where(BotState.key.in_(deletes)))
+                await session.commit()
+            metrics.incr("bot_fsm.flushed", len(keys))
+        except Exception as e:
+            # keep them dirty; the next flush retries
+            self._dirty |= keys
+            metrics.incr("bot_fsm.flush_failed")
+            logger.error(f"Bot FSM flush error ({len(keys)} keys pending): {e}")
+
+    async def _purge(self):
+        idle_since = time.monotonic() - self.state_ttl
+        for k in [k for k, e in self._cache.items() if e.used < idle_since and k not in self._dirty]:
+            del self._cache[k]
+        try:
+            async with async_session() as session:
+                result = await session.execute(
+                    delete(BotState).where(BotState.updated_at < now_local() - timedelta(seconds=self.state_ttl))
+                )
+                await session.commit()
+            metrics.incr("bot_fsm.expired", result.rowcount)
+        except Exception as e:
+            logger.error(f"Bot FSM purge error: {e}")
+        metrics.set_gauge("bot_fsm.cached", len(self._cache))
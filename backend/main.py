@@ -1,21 +1,30 @@
 import asyncio
 import logging
 from contextlib import asynccontextmanager
+from datetime import timedelta
 from pathlib import Path
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
 from starlette.middleware.sessions import SessionMiddleware
-from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from config.settings import settings
-from bot.handlers import main_router
-from api import auth, users, transfer, items, perks, qr, admin as admin_api
+from bot.dispatcher import bot, dp, run_polling, setup_webhook
+from api import auth, users, transfer, items, perks, qr, images, stream, telegram, admin as admin_api
 from models import init_db
+from services.audit import audit_log
+from services.broadcast import broadcaster
+from services.database import db_service
+from services.effects import effect_expiry
+from services.events import event_bus
+from services.imagegen import image_jobs
+from services.qr_decoder import shutdown_decoder
+from services.qr_sheets import shutdown_renderer
+from services.sheets_sync import sheets_sync
 from admin import setup_admin
+from utils.metrics import COUNT_BUCKETS, metrics, start_request_counters
 
 # Setup logging
 logging.basicConfig(
@@ -24,38 +33,71 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Bot setup
-bot = Bot(token=settings.bot_token)
-dp = Dispatcher(storage=MemoryStorage())
-dp.include_router(main_router)
-
 
 async def start_bot():
     """Start bot polling in background."""
-    logger.info("Starting Telegram bot...")
     try:
-        await dp.start_polling(bot)
+        await run_polling()
     except Exception as e:
         logger.error(f"Bot polling error: {e}")
 
 
+async def purge_idempotency_keys():
+    """Drop purchase idempotency keys past their TTL, once an hour."""
+    while True:
+        try:
+            purged = await db_service.purge_idempotency_keys(timedelta(hours=settings.idempotency_key_ttl_hours))
+            if purged:
+                logger.info(f"Purged {purged} expired idempotency keys")
+        except Exception as e:
+            logger.error(f"Idempotency key purge error: {e}")
+        await asyncio.sleep(3600)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize database
     logger.info("Initializing database...")
     await init_db()
-
-    # Start bot polling in background task
-    bot_task = asyncio.create_task(start_bot())
-    logger.info("Application started")
+    purge_task = asyncio.create_task(purge_idempotency_keys())
+    audit_log.start()
+    await event_bus.start()
+    effect_expiry.start(notify=bot.send_message if settings.effect_notify else None)
+    broadcaster.start(send=bot.send_message)
+    sheets_sync.start()
+    if await image_jobs.claim():
+        image_jobs.start(save=db_service.update_entity_image)
+
+    # Telegram updates: poll here, take them by webhook, or leave them to `python -m bot`
+    bot_task = None
+    if settings.bot_mode == "polling":
+        bot_task = asyncio.create_task(start_bot())
+    elif settings.bot_mode == "webhook":
+        try:
+            await setup_webhook()
+        except Exception as e:
+            logger.error(f"Bot webhook setup error: {e}")
+    logger.info(f"Application started (bot mode: {settings.bot_mode})")
     yield
     # Cleanup
-    await dp.stop_polling()
-    bot_task.cancel()
-    try:
-        await bot_task
-    except asyncio.CancelledError:
-        pass
+    if bot_task:
+        await dp.stop_polling()
+        bot_task.cancel()
+        try:
+            await bot_task
+        except asyncio.CancelledError:
+            pass
+    purge_task.cancel()
+    await image_jobs.stop()
+    await sheets_sync.stop()
+    await broadcaster.stop()
+    await effect_expiry.stop()
+    await event_bus.stop()
+    await audit_log.stop()
+    shutdown_decoder()
+    shutdown_renderer()
+    await dp.storage.close()
+    await bot.session.close()
     logger.info("Application stopped")
 
 
@@ -78,6 +120,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def db_request_metrics(request: Request, call_next):
+    """Count pool checkouts and commits per API request."""
+    counters = start_request_counters()
+    response = await call_next(request)
+    if request.url.path.startswith("/api/"):
+        route = request.scope.get("route")
+        path = getattr(route, "path", request.url.path)
+        checkouts = counters.get("db.checkouts", 0)
+        commits = counters.get("db.commits", 0)
+        metrics.observe(f"db.checkouts_per_request {request.method} {path}", checkouts, COUNT_BUCKETS)
+        metrics.observe(f"db.commits_per_request {request.method} {path}", commits, COUNT_BUCKETS)
+        response.headers["X-DB-Checkouts"] = str(checkouts)
+        response.headers["X-DB-Commits"] = str(commits)
+    return response
+
+
 # Setup admin panel at /admin
 setup_admin(app)
 
@@ -88,6 +148,9 @@ app.include_router(transfer.router, prefix="/api/transfer", tags=["transfer"])
 app.include_router(items.router, prefix="/api/items", tags=["items"])
 app.include_router(perks.router, prefix="/api/perks", tags=["perks"])
 app.include_router(qr.router, prefix="/api/qr", tags=["qr"])
+app.include_router(images.router, prefix="/api/images", tags=["images"])
+app.include_router(stream.router, prefix="/api/stream", tags=["stream"])
+app.include_router(telegram.router, prefix="/api/telegram", tags=["telegram"])
 app.include_router(admin_api.router, prefix="/api/admin", tags=["admin"])
 
 
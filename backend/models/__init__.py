@@ -4,9 +4,13 @@ from .base import Base, async_session, engine, sync_engine, get_session, init_db
 from .user import User
 from .attribute import Attribute
 from .trader import Trader
-from .item import Item, ActiveEffect
+from .item import Item, ActiveEffect, ExpiredEffect
 from .perk import Perk, UserPerk
 from .transaction import Transaction
+from .login_event import LoginEvent
+from .idempotency import IdempotencyKey
+from .bot_state import BotState
+from .broadcast import Broadcast, BroadcastRecipient
 
 __all__ = [
     "Base",
@@ -20,7 +24,13 @@ __all__ = [
     "Trader",
     "Item",
     "ActiveEffect",
+    "ExpiredEffect",
     "Perk",
     "UserPerk",
     "Transaction",
+    "LoginEvent",
+    "IdempotencyKey",
+    "BotState",
+    "Broadcast",
+    "BroadcastRecipient",
 ]
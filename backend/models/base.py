@@ -7,6 +7,7 @@ from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_asyn
 from sqlalchemy.orm import DeclarativeBase
 
 from config.settings import settings
+from .pool import InstrumentedAsyncPool, InstrumentedQueuePool
 
 
 # App timezone (UTC+1)
@@ -38,11 +39,30 @@ def get_sync_url(url: str) -> str:
 
 # async engine for API operations
 async_url = get_async_url(settings.database_url)
-engine = create_async_engine(async_url, echo=settings.log_level == "DEBUG")
+engine = create_async_engine(
+    async_url,
+    echo=settings.log_level == "DEBUG",
+    poolclass=InstrumentedAsyncPool,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+    connect_args={"statement_cache_size": settings.db_statement_cache_size},
+)
 
 # sync engine for SQLAdmin
 sync_url = get_sync_url(settings.database_url)
-sync_engine = create_engine(sync_url, echo=settings.log_level == "DEBUG")
+sync_engine = create_engine(
+    sync_url,
+    echo=settings.log_level == "DEBUG",
+    poolclass=InstrumentedQueuePool,
+    pool_size=settings.admin_db_pool_size,
+    max_overflow=settings.admin_db_max_overflow,
+    pool_timeout=settings.db_pool_timeout,
+    pool_recycle=settings.db_pool_recycle,
+    pool_pre_ping=settings.db_pool_pre_ping,
+)
 
 async_session = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
@@ -63,6 +83,31 @@ async def init_db():
             "ALTER TABLE items ADD COLUMN IF NOT EXISTS effect_type VARCHAR(50)",
             "ALTER TABLE items ADD COLUMN IF NOT EXISTS effect_value INTEGER",
             "ALTER TABLE items ADD COLUMN IF NOT EXISTS effect_duration INTEGER",
+            "ALTER TABLE users ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP",
+            "UPDATE users SET updated_at = COALESCE(created_at, now()) WHERE updated_at IS NULL",
+            "ALTER TABLE traders ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP",
+            "UPDATE traders SET updated_at = now() WHERE updated_at IS NULL",
+            # archived effects no longer block deleting their item
+            "ALTER TABLE expired_effects ALTER COLUMN item_id DROP NOT NULL",
+            """
+            DO $$ BEGIN
+                IF EXISTS (SELECT 1 FROM pg_constraint
+                           WHERE conname = 'expired_effects_item_id_fkey' AND confdeltype <> 'n') THEN
+                    ALTER TABLE expired_effects DROP CONSTRAINT expired_effects_item_id_fkey;
+                    ALTER TABLE expired_effects ADD CONSTRAINT expired_effects_item_id_fkey
+                        FOREIGN KEY (item_id) REFERENCES items(id) ON DELETE SET NULL;
+                END IF;
+            END $$
+            """,
         ]
         for sql in migrations:
             await conn.execute(text(sql))
+
+        # create_all skips indexes of tables that already exist
+        await conn.run_sync(_create_missing_indexes)
+
+
+def _create_missing_indexes(sync_conn):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
@@ -0,0 +1,16 @@
+"""Telegram bot conversation state (aiogram FSM)."""
+
+from sqlalchemy import JSON, DateTime, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base, now_local
+
+
+class BotState(Base):
+    """FSM state and data of one bot/chat/user key."""
+    __tablename__ = "bot_states"
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str] = mapped_column(String(255), nullable=True)
+    data = mapped_column(JSON, nullable=False, default=dict)
+    updated_at = mapped_column(DateTime, default=now_local, index=True)
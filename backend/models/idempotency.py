@@ -0,0 +1,21 @@
+"""Idempotency key model."""
+
+from sqlalchemy import JSON, DateTime, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base, now_local
+
+
+class IdempotencyKey(Base):
+    """Outcome of a client request, replayed when the same key is retried."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("scope", "key", name="uq_idempotency_keys_scope_key"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    scope: Mapped[str] = mapped_column(String(50), nullable=False)  # player uuid
+    key: Mapped[str] = mapped_column(String(100), nullable=False)
+    request_hash: Mapped[str] = mapped_column(String(64), nullable=False)
+    response = mapped_column(JSON, nullable=True)
+    created_at = mapped_column(DateTime, default=now_local, index=True)
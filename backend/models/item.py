@@ -2,7 +2,7 @@
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import DateTime, ForeignKey, Index, Integer, String, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base, now_local
@@ -49,6 +49,11 @@ class Item(Base):
 class ActiveEffect(Base):
     """Tracks active temporary effects on users."""
     __tablename__ = "active_effects"
+    __table_args__ = (
+        Index("ix_active_effects_user_item_expires", "user_id", "item_id", "expires_at"),
+        # expiry sweep
+        Index("ix_active_effects_expires_at", "expires_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
@@ -60,3 +65,19 @@ class ActiveEffect(Base):
 
     user: Mapped["User"] = relationship("User", back_populates="active_effects")
     item: Mapped["Item"] = relationship("Item")
+
+
+class ExpiredEffect(Base):
+    """Archive of effects removed from active_effects by the expiry sweep."""
+    __tablename__ = "expired_effects"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    effect_id: Mapped[int] = mapped_column(Integer, nullable=False)  # former active_effects.id
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    # the archive must not stop an item from being deleted
+    item_id: Mapped[int | None] = mapped_column(Integer, ForeignKey("items.id", ondelete="SET NULL"), nullable=True)
+    effect_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    effect_value: Mapped[int] = mapped_column(Integer, nullable=False)
+    applied_at = mapped_column(DateTime)
+    expires_at = mapped_column(DateTime, nullable=False)
+    expired_at = mapped_column(DateTime, default=now_local, index=True)  # retention purge
@@ -0,0 +1,25 @@
+"""Login audit event model."""
+
+from sqlalchemy import BigInteger, DateTime, Integer, String, Text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base, now_local
+
+
+class LoginEvent(Base):
+    """Login audit row, used when logins are kept out of the money ledger."""
+    __tablename__ = "login_events"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    timestamp = mapped_column(DateTime, default=now_local, index=True)
+    player_uuid: Mapped[str] = mapped_column(String(50), nullable=False, index=True)
+    telegram_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    description: Mapped[str | None] = mapped_column(Text, nullable=True)
+
+    def to_dict(self) -> dict:
+        return {
+            "timestamp": self.timestamp.isoformat(),
+            "player_uuid": self.player_uuid,
+            "telegram_id": self.telegram_id,
+            "description": self.description or "",
+        }
@@ -2,7 +2,7 @@
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Boolean, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy import Boolean, DateTime, ForeignKey, Index, Integer, String, Text, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .base import Base, now_local
@@ -42,7 +42,11 @@ class Perk(Base):
 
 class UserPerk(Base):
     __tablename__ = "user_perks"
-    __table_args__ = (UniqueConstraint("user_id", "perk_id", name="uq_user_perk"),)
+    __table_args__ = (
+        UniqueConstraint("user_id", "perk_id", name="uq_user_perk"),
+        # is_perk_taken looks up by perk alone
+        Index("ix_user_perks_perk_id", "perk_id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
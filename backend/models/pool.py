@@ -0,0 +1,48 @@
+"""Connection pools instrumented with checkout wait time and timeouts."""
+
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from utils.metrics import metrics
+
+
+class _PoolTelemetryMixin:
+    """Records how long each checkout waits for a connection."""
+
+    telemetry_name = "pool"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            metrics.incr(f"db.pool.{self.telemetry_name}.timeouts")
+            raise
+        finally:
+            wait_ms = (time.perf_counter() - started) * 1000
+            metrics.observe(f"db.pool.{self.telemetry_name}.wait_ms", wait_ms)
+
+
+class InstrumentedAsyncPool(_PoolTelemetryMixin, AsyncAdaptedQueuePool):
+    telemetry_name = "engine"
+
+
+class InstrumentedQueuePool(_PoolTelemetryMixin, QueuePool):
+    telemetry_name = "sync_engine"
+
+
+def pool_status(pool) -> dict:
+    """Current pool occupancy plus recorded wait times and timeouts."""
+    name = getattr(pool, "telemetry_name", "pool")
+    return {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "max_overflow": pool._max_overflow,
+        "timeout": pool.timeout(),
+        "timeouts": metrics.counter(f"db.pool.{name}.timeouts"),
+        "wait_ms": metrics.histogram(f"db.pool.{name}.wait_ms"),
+    }
@@ -2,10 +2,10 @@
 
 from typing import TYPE_CHECKING
 
-from sqlalchemy import Integer, String
+from sqlalchemy import DateTime, Integer, String
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from .base import Base
+from .base import Base, now_local
 
 if TYPE_CHECKING:
     from .item import Item
@@ -18,6 +18,7 @@ class Trader(Base):
     trader_id: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
     balance: Mapped[int] = mapped_column(Integer, default=0)
+    updated_at = mapped_column(DateTime, default=now_local, onupdate=now_local, index=True)  # Sheets sync cursor
 
     items: Mapped[list["Item"]] = relationship("Item", back_populates="trader")
 
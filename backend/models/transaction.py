@@ -1,6 +1,6 @@
 """Transaction model."""
 
-from sqlalchemy import DateTime, Integer, String, Text
+from sqlalchemy import DateTime, Index, Integer, String, Text, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from .base import Base, now_local
@@ -8,6 +8,19 @@ from .base import Base, now_local
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # ledger newest-first, id breaks timestamp ties
+        Index("ix_transactions_timestamp_id", "timestamp", "id"),
+        # player history; partial, so system/trader rows (e.g. LOGIN) stay out
+        Index(
+            "ix_transactions_player_from", "from_id", "timestamp", "id",
+            postgresql_where=text("from_type = 'player'"),
+        ),
+        Index(
+            "ix_transactions_player_to", "to_id", "timestamp", "id",
+            postgresql_where=text("to_type = 'player'"),
+        ),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     timestamp = mapped_column(DateTime, default=now_local)
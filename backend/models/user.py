@@ -25,6 +25,7 @@ class User(Base):
     band: Mapped[str | None] = mapped_column(String(100), nullable=True)
     attributes: Mapped[dict] = mapped_column(JSONB, default=dict)
     created_at = mapped_column(DateTime, default=now_local)
+    updated_at = mapped_column(DateTime, default=now_local, onupdate=now_local, index=True)  # Sheets sync cursor
 
     user_perks: Mapped[list["UserPerk"]] = relationship("UserPerk", back_populates="user")
     active_effects: Mapped[list["ActiveEffect"]] = relationship("ActiveEffect", back_populates="user")
@@ -34,6 +35,7 @@ class User(Base):
 
     def to_dict(self) -> dict:
         return {
+            "id": self.id,
             "user_id": self.telegram_id,
             "player_uuid": self.player_uuid,
             "name": self.name,
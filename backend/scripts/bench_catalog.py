@@ -0,0 +1,69 @@
+"""Benchmark GET /api/items/ with the catalog cache disabled and enabled.
+
+Requests go through the ASGI app in-process (no network, no bot), so the
+difference is the database work saved by the cache.
+
+Usage: python scripts/bench_catalog.py [--requests 2000] [--concurrency 50]
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+from main import app
+from services.catalog_cache import catalog_cache
+
+
+async def run(client: httpx.AsyncClient, requests: int, concurrency: int) -> list[float]:
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.get("/api/items/")
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return latencies
+
+
+def report(label: str, latencies: list[float], elapsed: float):
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{label:>10}: {len(latencies) / elapsed:8.1f} req/s  "
+        f"p50 {statistics.median(latencies):6.2f} ms  p99 {p99:6.2f} ms"
+    )
+
+
+async def main(requests: int, concurrency: int):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        ttl = catalog_cache.ttl
+        for label, cache_ttl in (("no cache", 0), ("cache", ttl or 300)):
+            catalog_cache.ttl = cache_ttl
+            catalog_cache.invalidate()
+            await run(client, 20, concurrency)  # warm up pool (and cache)
+            started = time.perf_counter()
+            latencies = await run(client, requests, concurrency)
+            report(label, latencies, time.perf_counter() - started)
+        catalog_cache.ttl = ttl
+
+    print(catalog_cache.stats())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
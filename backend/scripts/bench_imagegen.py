@@ -0,0 +1,62 @@
+"""Run image jobs against scripts/fake_image_api.py and report throughput.
+
+Submits --jobs jobs (one per fake entity) spread over --prompts distinct
+prompts, so most are deduplicated, and waits for all of them. Results are
+not written to the database. Start the stand-in first:
+
+    python scripts/fake_image_api.py --latency-ms 500 &
+    python scripts/bench_imagegen.py [--jobs 200] [--prompts 20] [--concurrency 3]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("OPENROUTER_API_URL", "http://127.0.0.1:8082/api/v1")
+os.environ.setdefault("CATBOX_API_URL", "http://127.0.0.1:8082/catbox")
+os.environ.setdefault("OPENROUTER_API_KEY", "fake")
+os.environ.setdefault("IMAGE_STORE_DIR", tempfile.mkdtemp(prefix="bench_imagegen_"))
+
+import httpx
+
+from services.imagegen import ImageJobQueue
+
+
+async def save(entity_type: str, entity_id: str, url: str) -> bool:
+    return True
+
+
+async def main(args):
+    queue = ImageJobQueue(concurrency=args.concurrency, cache_size=1000)
+    queue.start(save=save)
+    started = time.perf_counter()
+    jobs = [
+        queue.submit("item", f"ITEM{i:05d}", f"retro game item icon number {i % args.prompts}")
+        for i in range(args.jobs)
+    ]
+    while any(job.status in ("queued", "running") for job in jobs):
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    await queue.stop()
+
+    done = sum(job.status == "done" for job in jobs)
+    deduplicated = sum(job.deduplicated for job in jobs)
+    async with httpx.AsyncClient() as client:
+        server = (await client.get(os.environ["OPENROUTER_API_URL"].rsplit("/api/", 1)[0] + "/stats")).json()
+    print(f"{args.jobs} jobs, {args.prompts} prompts, {args.concurrency} workers: {elapsed:.2f}s")
+    print(f"  done {done}, failed {args.jobs - done}, deduplicated {deduplicated}")
+    print(f"  stand-in: {server}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jobs", type=int, default=200)
+    parser.add_argument("--prompts", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=3)
+    asyncio.run(main(parser.parse_args()))
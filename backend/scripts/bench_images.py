@@ -0,0 +1,78 @@
+"""Measure the local image store: storing, thumbnails and cached serving.
+
+Stores --images generated pictures (1024x1024 PNG, like the image model
+returns) in a temporary store, stores them all again to check dedup, then
+fetches the admin list's thumbnails through /api/images twice, the second
+time with the ETags from the first (as a browser revalidating would).
+
+Usage: python scripts/bench_images.py [--images 50]
+"""
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("BOT_TOKEN", "1:bench")
+os.environ["IMAGE_STORE_DIR"] = tempfile.mkdtemp(prefix="bench_images_")
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image, ImageDraw
+
+from api import images
+from services.image_store import image_store, thumbnail_url
+
+
+def picture(seed: int) -> bytes:
+    """An icon-like picture: shapes on black, with some noise so PNG cannot flatten it."""
+    rng = random.Random(seed)
+    image = Image.effect_noise((1024, 1024), 24).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for _ in range(12):
+        box = sorted(rng.sample(range(1024), 2)), sorted(rng.sample(range(1024), 2))
+        colour = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        draw.ellipse((box[0][0], box[1][0], box[0][1], box[1][1]), outline=colour, width=8)
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def main(args):
+    pictures = [picture(i) for i in range(args.images)]
+
+    started = time.perf_counter()
+    stored = [image_store.put(data) for data in pictures]
+    put_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    again = [image_store.put(data) for data in pictures]
+    dedup_seconds = time.perf_counter() - started
+
+    app = FastAPI()
+    app.include_router(images.router, prefix="/api/images")
+    client = TestClient(app)
+
+    original_bytes = sum(image.size for image in stored)
+    thumbs = [thumbnail_url(image.url, 128) for image in stored]
+    responses = [client.get(url) for url in thumbs]
+    thumb_bytes = sum(len(r.content) for r in responses)
+    revalidated = [client.get(url, headers={"If-None-Match": r.headers["etag"]}) for url, r in zip(thumbs, responses)]
+
+    print(f"stored {len(stored)} images in {put_seconds:.2f}s ({put_seconds / len(stored) * 1000:.0f} ms each, "
+          f"with thumbnails), again in {dedup_seconds:.2f}s ({sum(not i.created for i in again)} deduplicated)")
+    print(f"admin list: {original_bytes / 1024:.0f} KB of originals -> {thumb_bytes / 1024:.0f} KB "
+          f"of 128px WebP ({original_bytes / max(thumb_bytes, 1):.0f}x less)")
+    print(f"revalidation: {sum(r.status_code == 304 for r in revalidated)}/{len(revalidated)} answered 304, "
+          f"Cache-Control: {responses[0].headers['cache-control']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", type=int, default=50)
+    main(parser.parse_args())
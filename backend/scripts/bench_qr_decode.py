@@ -0,0 +1,124 @@
+"""QR photo decode benchmark: decode rate and ms per image.
+
+Runs every image in --corpus (jpg/jpeg/png/webp) through the sequential
+decoder and through the parallel race, and prints the decode rate and
+p50/p95 latency of each. If a file is named after its payload (e.g.
+"PAY_STIMPAK.jpg" for "PAY:STIMPAK"), the decoded text is checked too.
+
+Without --corpus a synthetic corpus is generated: terminal-colored codes
+pasted into large noisy frames with rotation, blur, glare and JPEG
+compression, roughly like phone photos of a screen or a print.
+
+Usage: python scripts/bench_qr_decode.py [--corpus photos/] [--synthetic 40]
+"""
+
+import argparse
+import asyncio
+import io
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from services.qr import render_qr
+from services.qr_decoder import decode_qr_async, decode_qr_from_bytes, shutdown_decoder
+
+PHOTO_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+
+def load_corpus(corpus: Path) -> list[tuple[str, bytes, str]]:
+    """(name, image bytes, expected payload or "") for every photo in the directory."""
+    samples = []
+    for path in sorted(corpus.iterdir()):
+        if path.suffix.lower() in PHOTO_SUFFIXES:
+            stem = path.stem
+            expected = stem.replace("_", ":", 1) if stem.split("_", 1)[0] in {"LOGIN", "PAY", "SEND", "PERK"} else ""
+            samples.append((path.name, path.read_bytes(), expected))
+    return samples
+
+
+def synthetic_photo(payload: str, rng: random.Random) -> bytes:
+    code = Image.open(io.BytesIO(render_qr(payload, box_size=rng.randint(6, 14)))).convert("RGB")
+    frame = Image.new("RGB", (3024, 4032), tuple(rng.randint(60, 200) for _ in range(3)))
+    draw = ImageDraw.Draw(frame)
+    for _ in range(40):
+        x, y = rng.randint(0, 3000), rng.randint(0, 4000)
+        draw.rectangle((x, y, x + rng.randint(20, 400), y + rng.randint(20, 400)),
+                       fill=tuple(rng.randint(0, 255) for _ in range(3)))
+
+    side = rng.randint(500, 1400)
+    code = code.resize((side, side), Image.BILINEAR).rotate(rng.uniform(-12, 12), expand=True, fillcolor=(10, 10, 10))
+    frame.paste(code, (rng.randint(0, 3024 - code.width), rng.randint(0, 4032 - code.height)))
+
+    # glare: a bright translucent blob across part of the frame
+    glare = Image.new("L", frame.size, 0)
+    x, y = rng.randint(0, 2500), rng.randint(0, 3500)
+    ImageDraw.Draw(glare).ellipse((x, y, x + 900, y + 900), fill=rng.randint(40, 110))
+    frame = Image.composite(Image.new("RGB", frame.size, (255, 255, 255)), frame, glare.filter(ImageFilter.GaussianBlur(120)))
+    frame = frame.filter(ImageFilter.GaussianBlur(rng.uniform(0.5, 2.5)))
+
+    buffer = io.BytesIO()
+    frame.save(buffer, format="JPEG", quality=rng.randint(55, 85))
+    return buffer.getvalue()
+
+
+def synthetic_corpus(count: int) -> list[tuple[str, bytes, str]]:
+    rng = random.Random(42)
+    samples = []
+    for n in range(count):
+        payload = f"{rng.choice(['LOGIN', 'PAY', 'SEND', 'PERK'])}:BENCH{n:04d}"
+        samples.append((f"synthetic_{n:03d}.jpg", synthetic_photo(payload, rng), payload))
+    return samples
+
+
+def report(label: str, results: list[tuple[float, bool]]):
+    latencies = sorted(ms for ms, _ in results)
+    decoded = sum(ok for _, ok in results)
+    p95 = latencies[max(0, int(len(latencies) * 0.95) - 1)]
+    print(
+        f"{label:<10} decoded {decoded}/{len(results)} ({decoded / len(results):.0%})  "
+        f"p50 {statistics.median(latencies):.0f} ms  p95 {p95:.0f} ms"
+    )
+
+
+def matches(result, expected: str) -> bool:
+    return bool(result) and (not expected or result == expected)
+
+
+async def main(corpus: Path | None, synthetic: int):
+    samples = load_corpus(corpus) if corpus else synthetic_corpus(synthetic)
+    if not samples:
+        print("No images found")
+        return
+    print(f"{len(samples)} images")
+
+    sequential = []
+    for _, image_bytes, expected in samples:
+        started = time.perf_counter()
+        result = decode_qr_from_bytes(image_bytes)
+        sequential.append(((time.perf_counter() - started) * 1000, matches(result, expected)))
+
+    # first call pays for spawning the workers
+    await decode_qr_async(samples[0][1])
+    parallel = []
+    for _, image_bytes, expected in samples:
+        started = time.perf_counter()
+        result, _ = await decode_qr_async(image_bytes)
+        parallel.append(((time.perf_counter() - started) * 1000, matches(result, expected)))
+    shutdown_decoder()
+
+    report("sequential", sequential)
+    report("race", parallel)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", type=Path, help="directory of photos")
+    parser.add_argument("--synthetic", type=int, default=40, help="synthetic images when no corpus is given")
+    args = parser.parse_args()
+    asyncio.run(main(args.corpus, args.synthetic))
@@ -0,0 +1,114 @@
+"""Benchmark SheetsService against the in-memory gspread stand-in.
+
+Runs the same mix of lookups and writes twice: once with the cache and
+batching effectively off (full reload on every access, flush on every
+write, like the old get_all_records/update_cell code) and once with the
+configured cache settings. Reports Sheets API calls and wall time; with
+--latency-ms every call costs about what a real round trip does.
+
+Usage: python scripts/bench_sheets.py [--players 500] [--ops 2000]
+       [--latency-ms 0] [--quota 0]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from scripts.fake_gspread import FakeClient
+from services.sheets import SheetsService
+
+HEADERS = {
+    "Users": ["user_id", "player_uuid", "name", "profession", "balance", "band", "attributes_json"],
+    "Attributes": ["attribute_name", "display_name", "max_value", "description"],
+    "Items": ["item_id", "name", "description", "price", "image_url"],
+    "Perks": ["perk_id", "name", "description", "effect_type", "effect_value", "one_time", "image_url"],
+    "UserPerks": ["player_uuid", "perk_id", "applied_at"],
+    "Traders": ["trader_id", "name", "balance"],
+    "Transactions": ["timestamp", "from_type", "from_id", "to_type", "to_id", "amount", "tx_type", "description"],
+}
+
+
+def make_client(players: int, latency_ms: float, quota: int) -> FakeClient:
+    client = FakeClient(latency_ms=latency_ms, quota_per_minute=quota)
+    sheets = client.spreadsheet
+    sheets.seed_worksheet("Users", HEADERS["Users"], [
+        [1000 + i, f"P{i:07d}", f"Player {i}", "", 100, "", '{"strength": 5}'] for i in range(players)
+    ])
+    sheets.seed_worksheet("Attributes", HEADERS["Attributes"], [["strength", "Сила", 10, ""]])
+    sheets.seed_worksheet("Items", HEADERS["Items"], [
+        [f"ITEM{i:03d}", f"Item {i}", "", 10 + i, ""] for i in range(50)
+    ])
+    sheets.seed_worksheet("Perks", HEADERS["Perks"], [
+        [f"PERK{i:03d}", f"Perk {i}", "", "attr_strength", 1, "", ""] for i in range(20)
+    ])
+    sheets.seed_worksheet("UserPerks", HEADERS["UserPerks"])
+    sheets.seed_worksheet("Traders", HEADERS["Traders"], [[f"T{i}", f"Trader {i}", 1000] for i in range(5)])
+    sheets.seed_worksheet("Transactions", HEADERS["Transactions"])
+    return client
+
+
+def workload(service: SheetsService, players: int, ops: int, seed: int = 1):
+    rng = random.Random(seed)
+    for _ in range(ops):
+        player = f"P{rng.randrange(players):07d}"
+        roll = rng.random()
+        if roll < 0.4:
+            service.get_user_by_uuid(player)
+        elif roll < 0.6:
+            service.get_item_by_id(f"ITEM{rng.randrange(50):03d}")
+        elif roll < 0.7:
+            service.get_user_stats(player)
+        elif roll < 0.9:
+            user = service.get_user_by_uuid(player)
+            service.update_balance(player, user["balance"] - 1)
+            service.log_transaction("player", player, "trader", "T0", 1, "purchase", "bench")
+        else:
+            service.apply_perk(player, f"PERK{rng.randrange(20):03d}")
+    service.flush()
+
+
+def run(label: str, args, **overrides) -> FakeClient:
+    client = make_client(args.players, args.latency_ms, args.quota)
+    service = SheetsService(client=client)
+    for name, value in overrides.items():
+        setattr(service, name, value)
+    started = time.perf_counter()
+    workload(service, args.players, args.ops)
+    elapsed = time.perf_counter() - started
+    calls = ", ".join(f"{name}={count}" for name, count in sorted(client.calls.items()))
+    print(f"{label:>9}: {client.total_calls:6d} API calls  {elapsed:8.2f}s  ({calls})")
+    return client
+
+
+def check(a: FakeClient, b: FakeClient):
+    """Both runs must leave the same data in the sheet (timestamps aside)."""
+    for title, sheet in a.spreadsheet.worksheets.items():
+        other = b.spreadsheet.worksheets[title].values
+        if title in ("Transactions", "UserPerks"):
+            same = len(sheet.values) == len(other)
+        else:
+            same = sheet.values == other
+        if not same:
+            print(f"MISMATCH in {title}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--players", type=int, default=500)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--quota", type=int, default=0, help="API calls per minute, 0 for unlimited")
+    args = parser.parse_args()
+
+    print(f"{args.ops} operations on {args.players} players, {args.latency_ms}ms per API call")
+    uncached = run("uncached", args, cache_ttl=0, full_refresh=0, batch_size=1)
+    cached = run("cached", args)
+    check(uncached, cached)
+
+
+if __name__ == "__main__":
+    main()
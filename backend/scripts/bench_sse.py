@@ -0,0 +1,131 @@
+"""Load test for the /api/stream push channel: idle connections and memory.
+
+Starts the app under uvicorn in a subprocess (EVENTS_BACKEND=postgres),
+seeds one bench player, opens --connections idle SSE streams to it and
+reports the server's RSS growth per connection. Then publishes one event
+with NOTIFY and measures how long it takes to reach every stream.
+
+Usage: python scripts/bench_sse.py [--connections 2000] [--port 8765]
+"""
+
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import asyncpg
+import httpx
+from sqlalchemy import delete
+
+from config.settings import settings
+from models import async_session, init_db, User
+from models.base import get_sync_url
+from services.events import CHANNEL
+from services.session_tokens import issue_token
+
+PLAYER_UUID = "SSEBENCH"
+
+
+def rss_kb(pid: int) -> int:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1])
+    return 0
+
+
+async def wait_ready(client: httpx.AsyncClient, base_url: str):
+    for _ in range(100):
+        try:
+            await client.get(f"{base_url}/api/health")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def open_stream(client: httpx.AsyncClient, url: str, received: asyncio.Queue, opened: asyncio.Queue):
+    async with client.stream("GET", url) as response:
+        opened.put_nowait(response.status_code)
+        async for line in response.aiter_lines():
+            if line.startswith("data:"):
+                received.put_nowait(time.perf_counter())
+
+
+async def main(connections: int, port: int):
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if hard < connections * 2 + 100:
+        print(f"warning: open file limit {hard} is low for {connections} connections")
+
+    await init_db()
+    async with async_session() as session:
+        await session.execute(delete(User).where(User.player_uuid == PLAYER_UUID))
+        user = User(player_uuid=PLAYER_UUID, name="SSE Bench", balance=0, attributes={})
+        session.add(user)
+        await session.commit()
+        token = issue_token(user.id, PLAYER_UUID)
+
+    env = {**os.environ, "EVENTS_BACKEND": "postgres", "SSE_KEEPALIVE": "60"}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=Path(__file__).resolve().parent.parent,
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    received: asyncio.Queue = asyncio.Queue()
+    opened: asyncio.Queue = asyncio.Queue()
+    tasks = []
+    try:
+        async with httpx.AsyncClient(limits=limits, timeout=None) as client:
+            await wait_ready(client, base_url)
+            await asyncio.sleep(1)
+            baseline = rss_kb(server.pid)
+
+            started = time.perf_counter()
+            url = f"{base_url}/api/stream/?token={token}"
+            tasks = [asyncio.create_task(open_stream(client, url, received, opened)) for _ in range(connections)]
+            statuses = [await opened.get() for _ in range(connections)]
+            elapsed = time.perf_counter() - started
+            ok = statuses.count(200)
+            await asyncio.sleep(2)
+            loaded = rss_kb(server.pid)
+
+            print(f"{ok}/{connections} streams open in {elapsed:.1f}s")
+            print(f"server RSS {baseline / 1024:.1f} MB -> {loaded / 1024:.1f} MB, "
+                  f"{(loaded - baseline) / max(ok, 1):.1f} KB per connection")
+
+            conn = await asyncpg.connect(get_sync_url(settings.database_url))
+            try:
+                sent = time.perf_counter()
+                await conn.execute(
+                    "SELECT pg_notify($1, $2)", CHANNEL,
+                    f'{{"player_uuid": "{PLAYER_UUID}", "event": {{"type": "balance", "balance": 1}}}}',
+                )
+            finally:
+                await conn.close()
+            arrivals = [await asyncio.wait_for(received.get(), 30) for _ in range(ok)]
+            print(f"fan-out to {ok} streams: last delivery after {(max(arrivals) - sent) * 1000:.0f} ms")
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        server.terminate()
+        server.wait()
+        async with async_session() as session:
+            await session.execute(delete(User).where(User.player_uuid == PLAYER_UUID))
+            await session.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(main(args.connections, args.port))
@@ -0,0 +1,98 @@
+"""Latency benchmark for DatabaseService.get_user_stats.
+
+Seeds --players bench players with a few active effects each, then fires
+one stats read per player concurrently (several rounds) and prints p50/p99.
+Bench rows are removed afterwards.
+
+Usage: python scripts/bench_stats.py [--players 1000] [--rounds 3]
+"""
+
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import delete, select
+
+from models import async_session, init_db, ActiveEffect, Item, User
+from models.base import now_local
+from services.database import db_service
+
+PREFIX = "BS"
+ITEM_ID = "BENCH_STATS_ITEM"
+
+
+async def seed(players: int) -> list[str]:
+    uuids = [f"{PREFIX}{i:06d}" for i in range(players)]
+    async with async_session() as session:
+        await cleanup(session)
+        item = Item(item_id=ITEM_ID, name="Bench Buff", price=1,
+                    effect_type="attr_strength", effect_value=1, effect_duration=60)
+        session.add(item)
+        users = [
+            User(player_uuid=uuid, name=f"Bench {uuid}", balance=100,
+                 attributes={"strength": 5, "luck": 5})
+            for uuid in uuids
+        ]
+        session.add_all(users)
+        await session.flush()
+
+        expires_at = now_local() + timedelta(hours=1)
+        session.add_all([
+            ActiveEffect(user_id=user.id, item_id=item.id, effect_type=effect_type,
+                         effect_value=1, expires_at=expires_at)
+            for user in users
+            for effect_type in ("attr_strength", "attr_strength", "attr_luck")
+        ])
+        await session.commit()
+    return uuids
+
+
+async def cleanup(session):
+    bench_users = select(User.id).where(User.player_uuid.like(f"{PREFIX}%"))
+    await session.execute(delete(ActiveEffect).where(ActiveEffect.user_id.in_(bench_users)))
+    await session.execute(delete(User).where(User.player_uuid.like(f"{PREFIX}%")))
+    await session.execute(delete(Item).where(Item.item_id == ITEM_ID))
+    await session.commit()
+
+
+async def timed_stats(uuid: str) -> float:
+    started = time.perf_counter()
+    stats = await db_service.get_user_stats(uuid)
+    elapsed = (time.perf_counter() - started) * 1000
+    assert stats and stats["attributes"] is not None
+    return elapsed
+
+
+async def main(players: int, rounds: int):
+    await init_db()
+    print(f"Seeding {players} players...")
+    uuids = await seed(players)
+    await db_service.get_attribute_config()  # warm catalog cache
+
+    try:
+        for round_no in range(1, rounds + 1):
+            started = time.perf_counter()
+            latencies = sorted(await asyncio.gather(*(timed_stats(uuid) for uuid in uuids)))
+            elapsed = time.perf_counter() - started
+            p99 = latencies[int(len(latencies) * 0.99) - 1]
+            print(
+                f"round {round_no}: {len(latencies)} concurrent reads in {elapsed:.2f}s  "
+                f"p50 {statistics.median(latencies):.1f} ms  p99 {p99:.1f} ms"
+            )
+    finally:
+        async with async_session() as session:
+            await cleanup(session)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.players, args.rounds))
@@ -0,0 +1,102 @@
+"""Concurrency benchmark for DatabaseService.transfer.
+
+Runs N coroutines that hammer the same pair of players with transfers in
+both directions, then checks that no update was lost: the total balance is
+unchanged, each player's balance matches the ledger, and the ledger has one
+row per successful transfer.
+
+Usage: python scripts/bench_transfer.py [--workers 50] [--transfers 20]
+"""
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import delete, func, select
+
+from models import async_session, init_db, User, Transaction
+from services.database import db_service
+
+PLAYER_A = "BENCH_A"
+PLAYER_B = "BENCH_B"
+START_BALANCE = 1000
+
+
+async def reset_players():
+    async with async_session() as session:
+        await session.execute(delete(Transaction).where(
+            Transaction.from_id.in_([PLAYER_A, PLAYER_B])
+        ))
+        await session.execute(delete(User).where(User.player_uuid.in_([PLAYER_A, PLAYER_B])))
+        session.add_all([
+            User(player_uuid=PLAYER_A, name="Bench A", balance=START_BALANCE, attributes={}),
+            User(player_uuid=PLAYER_B, name="Bench B", balance=START_BALANCE, attributes={}),
+        ])
+        await session.commit()
+
+
+async def worker(transfers: int, stats: dict):
+    for _ in range(transfers):
+        from_uuid, to_uuid = random.choice([(PLAYER_A, PLAYER_B), (PLAYER_B, PLAYER_A)])
+        amount = random.randint(1, 50)
+        result, error = await db_service.transfer(from_uuid, to_uuid, amount)
+        if result:
+            stats["ok"] += 1
+            stats["net"][from_uuid] -= amount
+            stats["net"][to_uuid] += amount
+        else:
+            stats["errors"][error] = stats["errors"].get(error, 0) + 1
+
+
+async def main(workers: int, transfers: int):
+    await init_db()
+    await reset_players()
+
+    stats = {"ok": 0, "errors": {}, "net": {PLAYER_A: 0, PLAYER_B: 0}}
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(transfers, stats) for _ in range(workers)))
+    elapsed = time.perf_counter() - started
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(User.player_uuid, User.balance).where(User.player_uuid.in_([PLAYER_A, PLAYER_B]))
+        )
+        balances = dict(result.all())
+        ledger_rows = await session.scalar(
+            select(func.count()).select_from(Transaction).where(
+                Transaction.tx_type == "transfer",
+                Transaction.from_id.in_([PLAYER_A, PLAYER_B]),
+            )
+        )
+
+    total = workers * transfers
+    print(f"Transfers attempted: {total}")
+    print(f"Succeeded: {stats['ok']}  rejected: {stats['errors'] or 0}")
+    print(f"Elapsed: {elapsed:.2f}s  throughput: {total / elapsed:.1f} transfers/s")
+    print(f"Balances: {balances}")
+
+    lost = [
+        uuid for uuid in (PLAYER_A, PLAYER_B)
+        if balances[uuid] != START_BALANCE + stats["net"][uuid]
+    ]
+    checks = {
+        "total balance conserved": sum(balances.values()) == 2 * START_BALANCE,
+        "no lost updates": not lost,
+        "one ledger row per transfer": ledger_rows == stats["ok"],
+    }
+    for name, passed in checks.items():
+        print(f"[{'OK' if passed else 'FAIL'}] {name}")
+    return all(checks.values())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=50)
+    parser.add_argument("--transfers", type=int, default=20)
+    args = parser.parse_args()
+    sys.exit(0 if asyncio.run(main(args.workers, args.transfers)) else 1)
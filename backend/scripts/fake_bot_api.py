@@ -0,0 +1,106 @@
+"""Stand-in Telegram Bot API server for broadcast load tests.
+
+Answers sendMessage like Telegram does, including flood control: more than
+--global-rate messages in a second, or more than one message per second to
+the same chat, gets a 429 with parameters.retry_after. A share of chats can
+be "blocked" (403) and a share of requests can fail with 500. getMe,
+getUpdates and the webhook methods answer just enough for the bot to start.
+
+Point the app at it with BOT_API_URL=http://127.0.0.1:8081 (any BOT_TOKEN),
+create a broadcast via POST /api/admin/broadcasts, and watch
+GET http://127.0.0.1:8081/stats.
+
+Usage: python scripts/fake_bot_api.py [--port 8081] [--global-rate 30]
+       [--latency-ms 40] [--blocked 0.02] [--errors 0.01]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter, deque
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+app = FastAPI()
+options = argparse.Namespace(global_rate=30, latency_ms=40, blocked=0.02, errors=0.01, retry_after=2)
+stats = Counter()
+recent: deque = deque()  # send times in the last second
+last_by_chat: dict[int, float] = {}
+started = time.monotonic()
+
+
+def ok(result) -> JSONResponse:
+    return JSONResponse({"ok": True, "result": result})
+
+
+def error(code: int, description: str, **parameters) -> JSONResponse:
+    body = {"ok": False, "error_code": code, "description": description}
+    if parameters:
+        body["parameters"] = parameters
+    return JSONResponse(body, status_code=code)
+
+
+async def send_message(params: dict) -> JSONResponse:
+    chat_id = int(params["chat_id"])
+    now = time.monotonic()
+    while recent and now - recent[0] > 1:
+        recent.popleft()
+
+    if len(recent) >= options.global_rate or now - last_by_chat.get(chat_id, -10) < 1:
+        stats["429"] += 1
+        return error(429, f"Too Many Requests: retry after {options.retry_after}", retry_after=options.retry_after)
+    if random.Random(chat_id).random() < options.blocked:
+        stats["403"] += 1
+        return error(403, "Forbidden: bot was blocked by the user")
+    if random.random() < options.errors:
+        stats["500"] += 1
+        return error(500, "Internal Server Error")
+
+    recent.append(now)
+    last_by_chat[chat_id] = now
+    stats["sent"] += 1
+    stats["peak_per_sec"] = max(stats["peak_per_sec"], len(recent))
+    return ok({
+        "message_id": stats["sent"],
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "text": params.get("text", ""),
+    })
+
+
+@app.post("/bot{token}/{method}")
+async def bot_method(token: str, method: str, request: Request):
+    params = dict(await request.form())
+    await asyncio.sleep(options.latency_ms / 1000)
+    method = method.lower()
+    if method == "sendmessage":
+        return await send_message(params)
+    if method == "getme":
+        return ok({"id": 1, "is_bot": True, "first_name": "Fake Bot", "username": "fake_bot"})
+    if method == "getupdates":
+        await asyncio.sleep(min(float(params.get("timeout", 0)), 10))
+        return ok([])
+    if method in ("setwebhook", "deletewebhook"):
+        return ok(True)
+    return error(404, f"Not Found: method {method} is not faked")
+
+
+@app.get("/stats")
+async def get_stats():
+    elapsed = time.monotonic() - started
+    return {**stats, "elapsed_sec": round(elapsed, 1), "avg_per_sec": round(stats["sent"] / elapsed, 2)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--global-rate", type=int, default=30)
+    parser.add_argument("--latency-ms", type=int, default=40)
+    parser.add_argument("--blocked", type=float, default=0.02, help="share of chats that blocked the bot")
+    parser.add_argument("--errors", type=float, default=0.01, help="share of requests answered with 500")
+    parser.add_argument("--retry-after", type=int, default=2)
+    options = parser.parse_args(namespace=options)
+    uvicorn.run(app, host="127.0.0.1", port=options.port, log_level="warning")
@@ -0,0 +1,132 @@
+"""In-memory stand-in for a gspread client, for offline Sheets benchmarks.
+
+Covers the calls services/sheets.py and services/sheets_sync.py make
+(open_by_key, worksheet, add_worksheet, get_all_values, get, col_values,
+append_rows, values_batch_update) and counts each one as an API request.
+Optional latency per request and a per-minute quota
+(gspread.exceptions.APIError 429 past it) mimic the real Sheets API.
+
+    from scripts.fake_gspread import FakeClient
+    client = FakeClient(latency_ms=80)
+    client.spreadsheet.seed_worksheet("Users", ["user_id", "player_uuid", ...])
+    service = SheetsService(client=client)
+"""
+
+import re
+import time
+from collections import Counter, deque
+
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol
+
+
+class _Response:
+    """Enough of a requests.Response for gspread's APIError."""
+
+    status_code = 429
+    text = "Quota exceeded"
+
+    def json(self):
+        return {"error": {"code": 429, "message": self.text, "status": "RESOURCE_EXHAUSTED"}}
+
+
+class FakeClient:
+    def __init__(self, latency_ms: float = 0, quota_per_minute: int = 0):
+        self.latency = latency_ms / 1000
+        self.quota = quota_per_minute
+        self.calls: Counter = Counter()
+        self._recent: deque = deque()
+        self.spreadsheet = FakeSpreadsheet(self)
+
+    def request(self, name: str):
+        """Account for one API call: count it, enforce the quota, sleep."""
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] > 60:
+            self._recent.popleft()
+        if self.quota and len(self._recent) >= self.quota:
+            self.calls["429"] += 1
+            raise APIError(_Response())
+        self._recent.append(now)
+        self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def total_calls(self) -> int:
+        return sum(count for name, count in self.calls.items() if name != "429")
+
+    def open_by_key(self, key: str) -> "FakeSpreadsheet":
+        self.request("open_by_key")
+        return self.spreadsheet
+
+
+class FakeSpreadsheet:
+    def __init__(self, client: FakeClient):
+        self.client = client
+        self.worksheets: dict[str, FakeWorksheet] = {}
+
+    def seed_worksheet(self, title: str, headers: list[str], rows: list[list] = ()) -> "FakeWorksheet":
+        """Set up a worksheet's contents without counting API calls."""
+        sheet = self.worksheets[title] = FakeWorksheet(self.client, title)
+        sheet.values = [list(headers)] + [[_cell(v) for v in row] for row in rows]
+        return sheet
+
+    def add_worksheet(self, title: str, rows: int = 100, cols: int = 26) -> "FakeWorksheet":
+        self.client.request("add_worksheet")
+        self.worksheets[title] = FakeWorksheet(self.client, title)
+        return self.worksheets[title]
+
+    def worksheet(self, title: str) -> "FakeWorksheet":
+        self.client.request("worksheet")
+        if title not in self.worksheets:
+            raise WorksheetNotFound(title)
+        return self.worksheets[title]
+
+    def values_batch_update(self, body: dict) -> dict:
+        self.client.request("values_batch_update")
+        for entry in body["data"]:
+            title, cells = entry["range"].rsplit("!", 1)
+            top, left = a1_to_rowcol(cells.split(":")[0])
+            for r, line in enumerate(entry["values"]):
+                for c, value in enumerate(line):
+                    self.worksheets[title.strip("'")].set_cell(top + r, left + c, value)
+        return {"totalUpdatedCells": len(body["data"])}
+
+
+class FakeWorksheet:
+    def __init__(self, client: FakeClient, title: str):
+        self.client = client
+        self.title = title
+        self.values: list[list[str]] = []
+
+    def set_cell(self, row: int, col: int, value):
+        while len(self.values) < row:
+            self.values.append([])
+        line = self.values[row - 1]
+        line.extend([""] * (col - len(line)))
+        line[col - 1] = _cell(value)
+
+    def get_all_values(self) -> list[list[str]]:
+        self.client.request("get_all_values")
+        return [list(row) for row in self.values]
+
+    def get(self, range_name: str) -> list[list[str]]:
+        """Only the open-ended "A<row>:<col>" form the service uses."""
+        self.client.request("get")
+        first = int(re.match(r"[A-Z]+(\d+)", range_name).group(1))
+        return [list(row) for row in self.values[first - 1:]]
+
+    def col_values(self, col: int) -> list[str]:
+        self.client.request("col_values")
+        return [row[col - 1] if len(row) >= col else "" for row in self.values]
+
+    def append_rows(self, values: list[list], value_input_option: str = "RAW", **kwargs) -> dict:
+        self.client.request("append_rows")
+        first = len(self.values) + 1
+        self.values.extend([_cell(v) for v in row] for row in values)
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:Z{len(self.values)}"}}
+
+
+def _cell(value) -> str:
+    """Sheets hands every value back as its displayed string."""
+    return "" if value is None else str(value)
@@ -0,0 +1,98 @@
+"""Stand-in OpenRouter and catbox.moe server for image generation tests.
+
+POST /api/v1/chat/completions answers like an OpenRouter image model: after
+--latency-ms it returns a small PNG as a data URL in message.images. A share
+of requests (--errors) fail with 500. POST /catbox stores the upload and
+answers with an https URL, like catbox.moe. GET /stats counts generations,
+uploads and the peak number of generations running at once.
+
+Point the app at it with
+    OPENROUTER_API_URL=http://127.0.0.1:8082/api/v1
+    CATBOX_API_URL=http://127.0.0.1:8082/catbox
+    OPENROUTER_API_KEY=anything
+then use /api/admin/generate-image or /api/admin/generate-missing-images.
+
+Usage: python scripts/fake_image_api.py [--port 8082] [--latency-ms 2000]
+       [--errors 0.0]
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import io
+import random
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse
+from PIL import Image
+
+app = FastAPI()
+options = argparse.Namespace(latency_ms=2000, errors=0.0)
+stats = Counter()
+prompts: set = set()
+running = 0
+
+
+def png(prompt: str) -> bytes:
+    """A 64x64 image whose colour depends on the prompt."""
+    colour = tuple(hashlib.sha256(prompt.encode()).digest()[:3])
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), colour).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@app.post("/api/v1/chat/completions")
+async def chat_completions(request: Request):
+    global running
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    stats["generations"] += 1
+    prompts.add(prompt)
+    stats["distinct_prompts"] = len(prompts)
+    running += 1
+    stats["peak_running"] = max(stats["peak_running"], running)
+    try:
+        await asyncio.sleep(options.latency_ms / 1000)
+    finally:
+        running -= 1
+    if random.random() < options.errors:
+        stats["500"] += 1
+        return JSONResponse({"error": {"message": "Internal Server Error", "code": 500}}, status_code=500)
+
+    data_url = "data:image/png;base64," + base64.b64encode(png(prompt)).decode()
+    return {
+        "id": f"gen-{stats['generations']}",
+        "model": body.get("model"),
+        "choices": [{
+            "message": {
+                "role": "assistant",
+                "content": "",
+                "images": [{"type": "image_url", "image_url": {"url": data_url}}],
+            },
+        }],
+    }
+
+
+@app.post("/catbox")
+async def catbox(fileToUpload: UploadFile):
+    content = await fileToUpload.read()
+    stats["uploads"] += 1
+    name = hashlib.sha256(content).hexdigest()[:12]
+    return PlainTextResponse(f"https://files.fake-catbox.test/{name}.png")
+
+
+@app.get("/stats")
+async def get_stats():
+    return dict(stats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--latency-ms", type=int, default=2000)
+    parser.add_argument("--errors", type=float, default=0.0, help="share of generations answered with 500")
+    options = parser.parse_args(namespace=options)
+    uvicorn.run(app, host="127.0.0.1", port=options.port, log_level="warning")
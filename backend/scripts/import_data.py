@@ -0,0 +1,73 @@
+"""Import players, items, perks, traders or attributes from spreadsheets.
+
+A CSV file holds one kind, named by --kind or by the file name
+(items.csv, users.csv, ...). An XLSX workbook may hold several, one
+worksheet per kind (Users, Items, ...). --sheet reads worksheets of the
+Google Sheet in GOOGLE_SHEET_ID instead of a file.
+
+Usage: python scripts/import_data.py items.csv [--kind items]
+       python scripts/import_data.py event.xlsx [--dry-run]
+       python scripts/import_data.py --sheet Users --sheet Items
+       [--chunk-size 1000]
+"""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from models import init_db
+from services.importer import KINDS, Importer, read_csv, read_worksheet, xlsx_sheets
+
+
+def print_report(report):
+    data = report.to_dict()
+    print(
+        f"{data['kind']:>10}: {data['rows']} rows, {data['inserted']} inserted, {data['updated']} updated, "
+        f"{data['invalid']} invalid, {data['failed']} failed in {data['seconds']}s "
+        f"({data['rows_per_sec'] or 0} rows/s)"
+    )
+    for error in data["errors"]:
+        print(f"            {error}")
+
+
+async def run(args) -> bool:
+    await init_db()
+    importer = Importer(chunk_size=args.chunk_size)
+    if args.sheet:
+        sheets = {title.strip().lower(): read_worksheet(title) for title in args.sheet}
+        reports = await importer.import_sheets(sheets, dry_run=args.dry_run)
+    elif args.file.suffix.lower() == ".xlsx":
+        with args.file.open("rb") as f:
+            reports = await importer.import_sheets(xlsx_sheets(f), dry_run=args.dry_run)
+    else:
+        kind = args.kind or args.file.stem.lower()
+        if kind not in KINDS:
+            raise SystemExit(f"Cannot tell what {args.file.name} holds, pass --kind ({', '.join(KINDS)})")
+        with args.file.open("rb") as f:
+            reports = [await importer.import_rows(kind, read_csv(f), dry_run=args.dry_run)]
+
+    for report in reports:
+        print_report(report)
+    return all(not r.errors for r in reports)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("file", nargs="?", type=Path)
+    parser.add_argument("--kind", choices=list(KINDS))
+    parser.add_argument("--sheet", action="append", help="Google Sheet worksheet to import, repeatable")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true", help="validate only, write nothing")
+    args = parser.parse_args()
+    if not args.file and not args.sheet:
+        parser.error("give a file or --sheet")
+
+    ok = asyncio.run(run(args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
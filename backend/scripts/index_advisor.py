@@ -0,0 +1,237 @@
+"""Index advisor: EXPLAIN ANALYZE every DatabaseService query on a large dataset.
+
+Seeds bench players, effects, perks and a few hundred thousand ledger rows
+(mostly logins, like a real event), runs each DatabaseService read method
+while capturing the SQL it sends, and re-runs every captured SELECT under
+EXPLAIN (ANALYZE, FORMAT JSON). Sequential scans on tables larger than
+--min-rows are flagged; the exit code is 1 if any were found.
+
+Usage: python scripts/index_advisor.py [--players 2000] [--transactions 300000] [--keep]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import delete, event, insert, or_, select, text
+
+from models import (
+    async_session, engine, init_db,
+    ActiveEffect, Item, Perk, Trader, Transaction, User, UserPerk,
+)
+from models.base import now_local
+from services.catalog_cache import catalog_cache
+from services.database import db_service
+
+PREFIX = "ADV"
+CHUNK = 10000
+
+
+async def seed(players: int, transactions: int) -> dict:
+    async with async_session() as session:
+        await cleanup(session)
+
+        trader = Trader(trader_id=f"{PREFIX}_TRADER", name="Advisor Trader", balance=0)
+        session.add(trader)
+        await session.flush()
+        items = [
+            Item(item_id=f"{PREFIX}_ITEM_{i}", name=f"Advisor Item {i}", price=10,
+                 trader_id=trader.id, effect_type="attr_luck", effect_value=1, effect_duration=30)
+            for i in range(20)
+        ]
+        perks = [
+            Perk(perk_id=f"{PREFIX}_PERK_{i}", name=f"Advisor Perk {i}",
+                 one_time=i % 2 == 0, effect_type="balance", effect_value=5)
+            for i in range(20)
+        ]
+        session.add_all(items + perks)
+        await session.flush()
+
+        uuids = [f"{PREFIX}{i:05d}" for i in range(players)]
+        for start in range(0, players, CHUNK):
+            await session.execute(insert(User), [
+                {"player_uuid": uuid, "name": f"Advisor {uuid}", "balance": 100,
+                 "attributes": {"luck": 5}, "telegram_id": 9_000_000_000 + i}
+                for i, uuid in enumerate(uuids[start:start + CHUNK], start)
+            ])
+        user_ids = list((await session.execute(
+            select(User.id).where(User.player_uuid.like(f"{PREFIX}%"))
+        )).scalars())
+
+        # as the app allows: one effect per (user, item), each one-time perk on one user
+        now = now_local()
+        await session.execute(insert(ActiveEffect), [
+            {"user_id": user_id, "item_id": item.id, "effect_type": "attr_luck",
+             "effect_value": 1, "expires_at": now + timedelta(minutes=random.randint(-600, 60))}
+            for user_id in user_ids for item in random.sample(items, 5)
+        ])
+        shared = [perk for perk in perks if not perk.one_time]
+        await session.execute(insert(UserPerk), [
+            {"user_id": user_id, "perk_id": perk.id}
+            for user_id in user_ids for perk in random.sample(shared, 3)
+        ] + [
+            {"user_id": user_id, "perk_id": perk.id}
+            for user_id, perk in zip(user_ids, [perk for perk in perks if perk.one_time])
+        ])
+
+        for start in range(0, transactions, CHUNK):
+            rows = []
+            for n in range(start, min(start + CHUNK, transactions)):
+                player = random.choice(uuids)
+                kind = random.random()
+                if kind < 0.6:
+                    row = ("system", "LOGIN", "player", player, 0, "login")
+                elif kind < 0.85:
+                    row = ("player", player, "player", random.choice(uuids), 5, "transfer")
+                else:
+                    row = ("player", player, "trader", trader.trader_id, 10, "purchase")
+                from_type, from_id, to_type, to_id, amount, tx_type = row
+                rows.append({
+                    "timestamp": now - timedelta(seconds=transactions - n),
+                    "from_type": from_type, "from_id": from_id,
+                    "to_type": to_type, "to_id": to_id,
+                    "amount": amount, "tx_type": tx_type, "description": "advisor",
+                })
+            await session.execute(insert(Transaction), rows)
+        await session.commit()
+
+    async with engine.connect() as conn:
+        await conn.execute(text("ANALYZE"))
+
+    return {
+        "player_uuid": uuids[0],
+        "telegram_id": 9_000_000_000,
+        "item_id": items[0].item_id,
+        "perk_id": perks[0].perk_id,
+        "trader_id": trader.trader_id,
+    }
+
+
+async def cleanup(session):
+    await session.execute(delete(Transaction).where(or_(
+        Transaction.from_id.like(f"{PREFIX}%"), Transaction.to_id.like(f"{PREFIX}%"),
+    )))
+    bench_users = select(User.id).where(User.player_uuid.like(f"{PREFIX}%"))
+    await session.execute(delete(ActiveEffect).where(ActiveEffect.user_id.in_(bench_users)))
+    await session.execute(delete(UserPerk).where(UserPerk.user_id.in_(bench_users)))
+    await session.execute(delete(User).where(User.player_uuid.like(f"{PREFIX}%")))
+    await session.execute(delete(Item).where(Item.item_id.like(f"{PREFIX}%")))
+    await session.execute(delete(Perk).where(Perk.perk_id.like(f"{PREFIX}%")))
+    await session.execute(delete(Trader).where(Trader.trader_id.like(f"{PREFIX}%")))
+    await session.commit()
+
+
+def read_queries(sample: dict) -> dict:
+    """DatabaseService read methods to analyze, with sample arguments."""
+    uuid = sample["player_uuid"]
+    return {
+        "get_user_by_telegram_id": lambda: db_service.get_user_by_telegram_id(sample["telegram_id"]),
+        "get_user_by_uuid": lambda: db_service.get_user_by_uuid(uuid),
+        "get_attribute_config": lambda: db_service.get_attribute_config(),
+        "get_user_stats": lambda: db_service.get_user_stats(uuid),
+        "get_all_items": lambda: db_service.get_all_items(),
+        "has_active_effect": lambda: db_service.has_active_effect(uuid, sample["item_id"]),
+        "get_user_active_effects": lambda: db_service.get_user_active_effects(uuid),
+        "get_all_perks": lambda: db_service.get_all_perks(),
+        "has_user_perk": lambda: db_service.has_user_perk(uuid, sample["perk_id"]),
+        "is_perk_taken": lambda: db_service.is_perk_taken(sample["perk_id"]),
+        "get_user_perks": lambda: db_service.get_user_perks(uuid),
+        "get_trader_by_id": lambda: db_service.get_trader_by_id(sample["trader_id"]),
+        "get_all_traders": lambda: db_service.get_all_traders(),
+        "get_transactions": lambda: db_service.get_transactions(100),
+        "get_user_transactions": lambda: db_service.get_user_transactions(uuid),
+        "get_scan_context": lambda: db_service.get_scan_context(
+            uuid, [uuid], [sample["item_id"]], [sample["perk_id"]]
+        ),
+    }
+
+
+async def capture_statements(queries: dict) -> list[tuple[str, str, tuple]]:
+    """Run each query and record the SELECTs it sends to the driver."""
+    captured = []
+    current = {"name": None}
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((current["name"], statement, tuple(parameters or ())))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", on_execute)
+    try:
+        for name, call in queries.items():
+            current["name"] = name
+            await call()
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", on_execute)
+    return captured
+
+
+def seq_scans(node: dict) -> list[dict]:
+    found = []
+    if node.get("Node Type") == "Seq Scan":
+        found.append(node)
+    for child in node.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+async def main(players: int, transactions: int, min_rows: int, keep: bool) -> bool:
+    await init_db()
+    print(f"Seeding {players} players and {transactions} transactions...")
+    sample = await seed(players, transactions)
+
+    # every call must reach the database
+    catalog_cache.ttl = 0
+    catalog_cache.invalidate()
+
+    flagged = 0
+    try:
+        captured = await capture_statements(read_queries(sample))
+        async with engine.connect() as conn:
+            table_rows = dict((await conn.execute(text(
+                "SELECT relname, reltuples::bigint FROM pg_class WHERE relkind = 'r'"
+            ))).all())
+            for name, statement, parameters in captured:
+                result = await conn.exec_driver_sql(
+                    f"EXPLAIN (ANALYZE, FORMAT JSON) {statement}", parameters
+                )
+                plan = result.scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                root = plan[0]
+                problems = [
+                    scan for scan in seq_scans(root["Plan"])
+                    if table_rows.get(scan["Relation Name"], 0) >= min_rows
+                ]
+                status = "SEQ SCAN" if problems else "ok"
+                print(f"[{status:>8}] {name:<26} {root['Execution Time']:8.2f} ms")
+                for scan in problems:
+                    flagged += 1
+                    print(
+                        f"           seq scan on {scan['Relation Name']} "
+                        f"(~{table_rows[scan['Relation Name']]} rows, "
+                        f"filter: {scan.get('Filter', '-')})"
+                    )
+    finally:
+        if not keep:
+            async with async_session() as session:
+                await cleanup(session)
+
+    print(f"\n{flagged} sequential scan(s) on tables with >= {min_rows} rows")
+    return flagged == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=2000)
+    parser.add_argument("--transactions", type=int, default=300000)
+    parser.add_argument("--min-rows", type=int, default=1000)
+    parser.add_argument("--keep", action="store_true", help="keep seeded rows")
+    args = parser.parse_args()
+    ok = asyncio.run(main(args.players, args.transactions, args.min_rows, args.keep))
+    sys.exit(0 if ok else 1)
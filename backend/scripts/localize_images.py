@@ -0,0 +1,66 @@
+"""Copy item and perk images hosted elsewhere (catbox.moe, ...) into the local image store.
+
+Every item/perk whose image_url is an external http(s) URL gets the image
+downloaded, stored with its thumbnails, and image_url switched to the
+stored copy. Images that fail to download keep their URL.
+
+Usage: python scripts/localize_images.py [--dry-run] [--concurrency 4]
+"""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+
+from models import init_db
+from services.database import db_service
+from services.image_store import ImageStoreError, image_store
+
+
+async def localize(client, semaphore, entity_type, entity_id, url, dry_run) -> bool:
+    async with semaphore:
+        try:
+            response = await client.get(url)
+            response.raise_for_status()
+            stored = await image_store.put_async(response.content)
+        except (httpx.HTTPError, ImageStoreError) as e:
+            print(f"  {entity_type} {entity_id}: {url}: {e}")
+            return False
+    if not dry_run:
+        await db_service.update_entity_image(entity_type, entity_id, stored.url)
+    print(f"  {entity_type} {entity_id}: {url} -> {stored.url} ({stored.size // 1024} KB)")
+    return True
+
+
+async def run(args) -> bool:
+    await init_db()
+    entities = [("item", item["item_id"], item["image_url"]) for item in await db_service.get_all_items()]
+    entities += [("perk", perk["perk_id"], perk["image_url"]) for perk in await db_service.get_all_perks()]
+    remote = [e for e in entities if (e[2] or "").startswith(("http://", "https://"))]
+    print(f"{len(remote)} of {len(entities)} images are hosted elsewhere")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(timeout=60.0, follow_redirects=True) as client:
+        results = await asyncio.gather(*(
+            localize(client, semaphore, entity_type, entity_id, url, args.dry_run)
+            for entity_type, entity_id, url in remote
+        ))
+    print(f"{sum(results)} stored, {len(results) - sum(results)} failed")
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true", help="download and store, but keep the URLs")
+    args = parser.parse_args()
+    ok = asyncio.run(run(args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,9 @@
 
 import asyncio
 import sys
-sys.path.insert(0, '/home/karmanov/projects/rpg-app/backend')
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
 
 from models import async_session, init_db, User, Attribute, Item, Perk, Trader
 
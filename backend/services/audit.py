@@ -0,0 +1,134 @@
+"""Batched, asynchronous login audit log.
+
+Logins are queued in memory and a background task bulk-inserts them every
+audit_flush_interval_ms or every audit_batch_size rows, whichever comes
+first. The queue is bounded: when the database falls behind, new events are
+dropped (and counted) instead of slowing logins down.
+"""
+
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy import insert
+
+from config.settings import settings
+from models import async_session, LoginEvent, Transaction
+from models.base import now_local
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class AuditLogWriter:
+    def __init__(self, flush_interval_ms: int, batch_size: int, queue_size: int, table: str):
+        self.flush_interval = flush_interval_ms / 1000
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.model = LoginEvent if table == "login_events" else Transaction
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Audit log writer started (table: {self.model.__tablename__})")
+
+    async def stop(self, timeout: float = 10.0):
+        """Flush everything queued so far and stop the writer."""
+        if not self._task:
+            return
+        try:
+            await asyncio.wait_for(self._queue.put(_STOP), timeout)
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Audit log flush timed out, {self._queue.qsize()} events lost")
+            self._task.cancel()
+        self._task = None
+
+    def log_login(self, player_uuid: str, name: str, telegram_id: Optional[int] = None):
+        """Queue a login event without waiting for the database."""
+        if self._queue is None:
+            logger.warning("Audit log writer not started, login event dropped")
+            metrics.incr("audit.dropped")
+            return
+
+        description = f"Вход: {name}"
+        if self.model is LoginEvent:
+            row = {
+                "timestamp": now_local(),
+                "player_uuid": player_uuid,
+                "telegram_id": telegram_id,
+                "description": description,
+            }
+        else:
+            row = {
+                "timestamp": now_local(),
+                "from_type": "system",
+                "from_id": "LOGIN",
+                "to_type": "player",
+                "to_id": player_uuid,
+                "amount": 0,
+                "tx_type": "login",
+                "description": description,
+            }
+
+        try:
+            self._queue.put_nowait(row)
+            metrics.incr("audit.queued")
+        except asyncio.QueueFull:
+            metrics.incr("audit.dropped")
+            logger.warning("Audit log queue full, login event dropped")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+        # drain whatever is still queued
+        batch = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                batch.append(item)
+        for start in range(0, len(batch), self.batch_size):
+            await self._write(batch[start:start + self.batch_size])
+
+    async def _write(self, batch: list[dict]):
+        try:
+            async with async_session() as session:
+                await session.execute(insert(self.model).values(batch))
+                await session.commit()
+            metrics.incr("audit.written", len(batch))
+            metrics.observe("audit.batch_size", len(batch), (1, 5, 10, 25, 50, 100, 200, 500))
+        except Exception as e:
+            metrics.incr("audit.failed", len(batch))
+            logger.error(f"Audit log write error ({len(batch)} events lost): {e}")
+
+
+audit_log = AuditLogWriter(
+    flush_interval_ms=settings.audit_flush_interval_ms,
+    batch_size=settings.audit_batch_size,
+    queue_size=settings.audit_queue_size,
+    table=settings.audit_log_table,
+)
@@ -0,0 +1,323 @@
+"""Bot broadcasts: one message to every player with a linked Telegram account.
+
+Creating a broadcast stores one pending row per chat. A background task
+sends them with broadcast_concurrency workers, throttled by a global token
+bucket (broadcast_rate messages per second) and a minimum interval per
+chat. A 429 pauses every worker for the retry_after Telegram asks for;
+blocked chats and bad requests fail at once, other errors are retried up to
+broadcast_max_attempts times.
+
+Results are written back in batches about once a second, so a restart
+resumes from the pending rows: only the last unflushed batch can be sent
+twice. One process sends at a time (a Postgres advisory lock), which keeps
+the global rate valid with several uvicorn workers.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import func, insert, literal, select, update
+
+from config.settings import settings
+from models import async_session, engine, Broadcast, BroadcastRecipient, User
+from models.base import now_local
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Send = Callable[[int, str], Awaitable]
+
+SENDER_LOCK = 0x62726F61  # pg advisory lock key held by the sending process
+ACTIVE = ("pending", "running")
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Broadcaster:
+    def __init__(self, rate: float, chat_interval: float, concurrency: int, max_attempts: int,
+                 page_size: int = 500, flush_interval: float = 1.0, poll_interval: float = 30.0):
+        self.rate = rate
+        self.chat_interval = chat_interval
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.page_size = page_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self._send: Optional[Send] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._bucket = TokenBucket(rate, capacity=1)  # no bursts: Telegram counts per second
+        self._chat_next: dict[int, float] = {}
+        self._resume_at = 0.0
+        self._results: dict[int, list[dict]] = {}  # broadcast id -> sends not written yet
+        self._current: Optional[int] = None
+        self._cancelled = False
+
+    def start(self, send: Send):
+        """Start the sender; send(chat_id, text) delivers one message."""
+        self._send = send
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Broadcaster started ({self.rate}/s, {self.concurrency} workers)")
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def create(self, text: str) -> dict:
+        """Queue a broadcast to every linked player."""
+        async with async_session() as session:
+            broadcast = Broadcast(text=text)
+            session.add(broadcast)
+            await session.flush()
+            result = await session.execute(
+                insert(BroadcastRecipient).from_select(
+                    ["broadcast_id", "telegram_id"],
+                    select(literal(broadcast.id), User.telegram_id)
+                    .where(User.telegram_id.isnot(None))
+                    .order_by(User.id),
+                )
+            )
+            broadcast.total = result.rowcount
+            await session.commit()
+            data = broadcast.to_dict()
+        if self._wake:
+            self._wake.set()
+        return data
+
+    async def cancel(self, broadcast_id: int) -> bool:
+        async with async_session() as session:
+            result = await session.execute(
+                update(Broadcast)
+                .where(Broadcast.id == broadcast_id, Broadcast.status.in_(ACTIVE))
+                .values(status="cancelled", finished_at=now_local())
+            )
+            await session.commit()
+        if self._current == broadcast_id:
+            self._cancelled = True
+        return result.rowcount > 0
+
+    async def get_status(self, broadcast_id: Optional[int] = None, limit: int = 20) -> list[dict]:
+        """Broadcasts, newest first, with progress, throughput and ETA."""
+        async with async_session() as session:
+            query = select(Broadcast).order_by(Broadcast.id.desc()).limit(limit)
+            if broadcast_id is not None:
+                query = query.where(Broadcast.id == broadcast_id)
+            broadcasts = (await session.execute(query)).scalars().all()
+
+        now = now_local()
+        rows = []
+        for b in broadcasts:
+            data = b.to_dict()
+            done = b.sent + b.failed
+            data["pending"] = b.total - done
+            data["progress"] = round(done / b.total, 4) if b.total else 1.0
+            rate = None
+            if b.started_at:
+                elapsed = ((b.finished_at or now) - b.started_at).total_seconds()
+                rate = round(done / elapsed, 2) if elapsed > 0 else None
+            data["messages_per_sec"] = rate
+            data["eta_seconds"] = round(data["pending"] / rate) if rate and b.status == "running" else None
+            rows.append(data)
+        return rows
+
+    async def _run(self):
+        while True:
+            try:
+                delivered = await self._deliver_next()
+                if not delivered:
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Broadcast error: {e}")
+                await asyncio.sleep(5)
+
+    async def _deliver_next(self) -> bool:
+        async with async_session() as session:
+            broadcast_id = await session.scalar(
+                select(Broadcast.id).where(Broadcast.status.in_(ACTIVE)).order_by(Broadcast.id).limit(1)
+            )
+        if broadcast_id is None:
+            return False
+
+        async with engine.connect() as lock_conn:
+            if not await lock_conn.scalar(select(func.pg_try_advisory_lock(SENDER_LOCK))):
+                return False  # another process is sending
+            await lock_conn.commit()  # session-level lock, no transaction held open
+            try:
+                await self._deliver(broadcast_id)
+            finally:
+                await lock_conn.scalar(select(func.pg_advisory_unlock(SENDER_LOCK)))
+                await lock_conn.commit()
+        return True
+
+    async def _deliver(self, broadcast_id: int):
+        async with async_session() as session:
+            broadcast = await session.get(Broadcast, broadcast_id)
+            if broadcast is None or broadcast.status not in ACTIVE:
+                return
+            text = broadcast.text
+            broadcast.status = "running"
+            broadcast.started_at = broadcast.started_at or now_local()
+            await session.commit()
+
+        logger.info(f"Broadcast {broadcast_id} running")
+        self._current, self._cancelled = broadcast_id, False
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        workers = [asyncio.create_task(self._worker(broadcast_id, text, queue)) for _ in range(self.concurrency)]
+        flusher = asyncio.create_task(self._flush_loop(broadcast_id))
+        try:
+            last_id = 0
+            while not self._cancelled:
+                async with async_session() as session:
+                    page = (await session.execute(
+                        select(BroadcastRecipient.id, BroadcastRecipient.telegram_id, BroadcastRecipient.attempts)
+                        .where(
+                            BroadcastRecipient.broadcast_id == broadcast_id,
+                            BroadcastRecipient.status == "pending",
+                            BroadcastRecipient.id > last_id,
+                        )
+                        .order_by(BroadcastRecipient.id)
+                        .limit(self.page_size)
+                    )).all()
+                if not page:
+                    break
+                for row in page:
+                    await queue.put(row)
+                last_id = page[-1].id
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+            flusher.cancel()
+            await asyncio.gather(*workers, flusher, return_exceptions=True)
+            # unwritten results would be sent again: keep the sender lock until they are stored
+            while not await self._flush(broadcast_id):
+                await asyncio.sleep(5)
+            self._current = None
+            self._chat_next.clear()
+
+        if not self._cancelled:
+            async with async_session() as session:
+                await session.execute(
+                    update(Broadcast)
+                    .where(Broadcast.id == broadcast_id, Broadcast.status == "running")
+                    .values(status="done", finished_at=now_local())
+                )
+                await session.commit()
+        logger.info(f"Broadcast {broadcast_id} {'cancelled' if self._cancelled else 'done'}")
+
+    async def _worker(self, broadcast_id: int, text: str, queue: asyncio.Queue):
+        while (row := await queue.get()) is not None:
+            if self._cancelled:
+                continue
+            status, error, attempts = await self._send_one(row.telegram_id, text, row.attempts)
+            self._results.setdefault(broadcast_id, []).append({
+                "id": row.id,
+                "status": status,
+                "attempts": attempts,
+                "error": error,
+                "sent_at": now_local() if status == "sent" else None,
+            })
+
+    async def _send_one(self, chat_id: int, text: str, attempts: int) -> tuple[str, Optional[str], int]:
+        loop = asyncio.get_running_loop()
+        while True:
+            pause = self._resume_at - loop.time()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self._bucket.acquire()
+            wait = self._chat_next.get(chat_id, 0.0) - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self._chat_next[chat_id] = loop.time() + self.chat_interval
+
+            attempts += 1
+            try:
+                await self._send(chat_id, text)
+                metrics.incr("broadcast.sent")
+                return "sent", None, attempts
+            except TelegramRetryAfter as e:
+                # flood control is global: every worker backs off
+                metrics.incr("broadcast.retry_after")
+                self._resume_at = max(self._resume_at, loop.time() + e.retry_after)
+                attempts -= 1
+            except (TelegramForbiddenError, TelegramBadRequest) as e:
+                metrics.incr("broadcast.failed")
+                return "failed", str(e)[:255], attempts
+            except Exception as e:
+                if attempts >= self.max_attempts:
+                    metrics.incr("broadcast.failed")
+                    return "failed", str(e)[:255], attempts
+                await asyncio.sleep(2 ** attempts)
+
+    async def _flush_loop(self, broadcast_id: int):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush(broadcast_id)
+            # cancel may have come through another worker process
+            async with async_session() as session:
+                status = await session.scalar(select(Broadcast.status).where(Broadcast.id == broadcast_id))
+            if status == "cancelled":
+                self._cancelled = True
+
+    async def _flush(self, broadcast_id: int) -> bool:
+        """Persist the broadcast's finished sends and bump its counters; False if that failed."""
+        results = self._results.pop(broadcast_id, None)
+        if not results:
+            return True
+        sent = sum(1 for r in results if r["status"] == "sent")
+        try:
+            async with async_session() as session:
+                await session.execute(update(BroadcastRecipient), results)
+                await session.execute(
+                    update(Broadcast)
+                    .where(Broadcast.id == broadcast_id)
+                    .values(sent=Broadcast.sent + sent, failed=Broadcast.failed + len(results) - sent)
+                )
+                await session.commit()
+        except Exception as e:
+            self._results[broadcast_id] = results + self._results.get(broadcast_id, [])
+            logger.error(f"Broadcast progress write error ({len(results)} results pending): {e}")
+            return False
+        return True
+
+
+broadcaster = Broadcaster(
+    rate=settings.broadcast_rate,
+    chat_interval=settings.broadcast_chat_interval,
+    concurrency=settings.broadcast_concurrency,
+    max_attempts=settings.broadcast_max_attempts,
+)
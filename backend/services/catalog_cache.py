@@ -0,0 +1,74 @@
+"""In-process cache for catalog data (items, perks, traders, attributes).
+
+The catalog only changes when an admin edits it, so reads are served from
+memory. Every key carries a version that is bumped on invalidation; a load
+that started before an invalidation is returned to its caller but not
+stored. The TTL bounds staleness across workers, which do not see each
+other's invalidations.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable
+
+from config.settings import settings
+from utils.metrics import metrics
+
+
+CATALOG_KEYS = ("items", "perks", "traders", "attributes")
+
+
+class CatalogCache:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._versions: dict[str, int] = {}
+        self._entries: dict[str, tuple[int, float, Any]] = {}
+        self._locks: dict[str, asyncio.Lock] = {}
+
+    def _lookup(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        version, expires_at, value = entry
+        if version != self._versions.get(key, 0) or expires_at <= time.monotonic():
+            return None
+        return entry
+
+    async def get(self, key: str, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Return cached value for key, calling loader on a miss."""
+        entry = self._lookup(key)
+        if entry is not None:
+            metrics.incr(f"catalog_cache.{key}.hits")
+            return entry[2]
+
+        # one loader per key at a time, concurrent misses wait for it
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._lookup(key)
+            if entry is not None:
+                metrics.incr(f"catalog_cache.{key}.hits")
+                return entry[2]
+
+            metrics.incr(f"catalog_cache.{key}.misses")
+            version = self._versions.get(key, 0)
+            value = await loader()
+            if self.ttl > 0 and version == self._versions.get(key, 0):
+                self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            return value
+
+    def invalidate(self, *keys: str):
+        """Drop the given keys, or the whole catalog if none are given."""
+        for key in keys or CATALOG_KEYS:
+            self._versions[key] = self._versions.get(key, 0) + 1
+            self._entries.pop(key, None)
+        metrics.incr("catalog_cache.invalidations")
+
+    def stats(self) -> dict:
+        return {
+            "ttl": self.ttl,
+            "versions": dict(self._versions),
+            "cached": sorted(key for key in self._entries if self._lookup(key)),
+        }
+
+
+catalog_cache = CatalogCache(ttl=settings.catalog_cache_ttl)
@@ -1,19 +1,93 @@
 """Database service - replaces SheetsService."""
 
+import base64
+import hashlib
 import json
+import logging
 import uuid
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import AsyncIterator, Callable, Optional
 
-from sqlalchemy import select, desc
+from sqlalchemy import (
+    JSON, case, delete, desc, event, func, insert, literal, literal_column, null, select, true, tuple_, update,
+)
+from sqlalchemy.dialects.postgresql import aggregate_order_by, insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import Session, selectinload
 
 from models import (
-    User, Attribute, Item, ActiveEffect, Perk, UserPerk, Trader, Transaction,
-    async_session
+    User, Attribute, Item, ActiveEffect, Perk, UserPerk, Trader, Transaction, IdempotencyKey,
+    async_session, engine
 )
+from config.settings import settings
 from models.base import now_local
+from services.catalog_cache import catalog_cache
+from services.effects import effect_expiry
+from services.events import event_bus
+from utils.metrics import incr_request, metrics
+
+
+logger = logging.getLogger(__name__)
+
+# session bound to the current request by the request_session dependency
+_request_session: ContextVar[Optional[AsyncSession]] = ContextVar("request_session", default=None)
+
+
+@event.listens_for(engine.sync_engine, "checkout")
+def _count_checkout(dbapi_connection, connection_record, connection_proxy):
+    metrics.incr("db.checkouts")
+    incr_request("db.checkouts")
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session):
+    metrics.incr("db.commits")
+    incr_request("db.commits")
+    for callback in session.info.pop("on_commit", []):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"After-commit callback error: {e}")
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("on_commit", None)
+
+
+async def request_session() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency: unit of work with one session and one commit per request.
+
+    While the request runs, every DatabaseService method reuses this session
+    and only flushes; the commit happens once the endpoint returns, and any
+    exception (including HTTPException) rolls the whole request back.
+    """
+    async with async_session() as session:
+        token = _request_session.set(session)
+        try:
+            yield session
+            await session.commit()
+        except Exception:
+            await session.rollback()
+            raise
+        finally:
+            _request_session.reset(token)
+
+
+def _encode_cursor(timestamp: datetime, tx_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{tx_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, tx_id = raw.split("|")
+        return datetime.fromisoformat(timestamp), int(tx_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
 
 
 class DatabaseService:
@@ -22,9 +96,34 @@ class DatabaseService:
     async def get_session(self) -> AsyncSession:
         return async_session()
 
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[AsyncSession]:
+        """Reuse the request session if there is one, otherwise open a new one."""
+        session = _request_session.get()
+        if session is not None:
+            yield session
+            return
+        async with async_session() as session:
+            yield session
+
+    async def _commit(self, session: AsyncSession):
+        """Commit an own session; inside a unit of work only flush."""
+        if session is _request_session.get():
+            await session.flush()
+        else:
+            await session.commit()
+
+    def _on_commit(self, session: AsyncSession, callback: Callable[[], None]):
+        """Run callback after the session's transaction commits, drop it on rollback."""
+        session.sync_session.info.setdefault("on_commit", []).append(callback)
+
+    def _publish(self, session: AsyncSession, player_uuid: str, event: dict):
+        """Push an event to the player's stream once the transaction commits."""
+        self._on_commit(session, lambda: event_bus.publish(player_uuid, event))
+
     # User methods
     async def get_user_by_telegram_id(self, user_id: int) -> Optional[dict]:
-        async with async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(User).where(User.telegram_id == user_id)
             )
@@ -32,18 +131,24 @@ class DatabaseService:
             return user.to_dict() if user else None
 
     async def get_user_by_uuid(self, player_uuid: str) -> Optional[dict]:
-        async with async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(User).where(User.player_uuid == player_uuid)
             )
             user = result.scalar_one_or_none()
             return user.to_dict() if user else None
 
+    async def get_user_by_id(self, user_id: int) -> Optional[dict]:
+        """User by primary key, e.g. from a session token."""
+        async with self._session() as session:
+            user = await session.get(User, user_id)
+            return user.to_dict() if user else None
+
     async def create_user(self, user_id: int, name: str) -> dict:
         player_uuid = str(uuid.uuid4())[:8].upper()
         default_attrs = await self._get_default_attributes()
 
-        async with async_session() as session:
+        async with self._session() as session:
             user = User(
                 telegram_id=user_id,
                 player_uuid=player_uuid,
@@ -52,7 +157,7 @@ class DatabaseService:
                 attributes=default_attrs,
             )
             session.add(user)
-            await session.commit()
+            await self._commit(session)
             await session.refresh(user)
             return user.to_dict()
 
@@ -75,19 +180,20 @@ class DatabaseService:
             }
 
     async def update_balance(self, player_uuid: str, new_balance: int) -> bool:
-        async with async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(User).where(User.player_uuid == player_uuid)
             )
             user = result.scalar_one_or_none()
             if user:
                 user.balance = new_balance
-                await session.commit()
+                self._publish(session, player_uuid, {"type": "balance", "balance": new_balance})
+                await self._commit(session)
                 return True
             return False
 
     async def link_telegram_to_player(self, telegram_id: int, player_uuid: str) -> bool:
-        async with async_session() as session:
+        async with self._session() as session:
             # clear existing link
             result = await session.execute(
                 select(User).where(User.telegram_id == telegram_id)
@@ -103,45 +209,87 @@ class DatabaseService:
             user = result.scalar_one_or_none()
             if user:
                 user.telegram_id = telegram_id
-                await session.commit()
+                await self._commit(session)
                 return True
             return False
 
     async def unlink_telegram(self, telegram_id: int) -> bool:
-        async with async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(User).where(User.telegram_id == telegram_id)
             )
             user = result.scalar_one_or_none()
             if user:
                 user.telegram_id = None
-                await session.commit()
+                await self._commit(session)
                 return True
             return False
 
     async def get_attribute_config(self) -> list[dict]:
-        async with async_session() as session:
+        config = await catalog_cache.get("attributes", self._load_attribute_config)
+        return [dict(attr) for attr in config]
+
+    async def _load_attribute_config(self) -> list[dict]:
+        async with self._session() as session:
             result = await session.execute(select(Attribute))
             return [attr.to_dict() for attr in result.scalars().all()]
 
-    async def get_user_stats(self, player_uuid: str) -> Optional[dict]:
-        user = await self.get_user_by_uuid(player_uuid)
-        if not user:
+    async def get_user_stats(self, player_uuid: Optional[str] = None, user_id: Optional[int] = None) -> Optional[dict]:
+        """User attributes with effect bonuses, by player_uuid or primary key.
+
+        One statement: the user row joined to a per-effect_type aggregate of
+        non-expired effects. The attribute config comes from the catalog cache.
+        """
+        now = now_local()
+        effects = (
+            select(
+                ActiveEffect.effect_type,
+                func.sum(ActiveEffect.effect_value).label("bonus"),
+                func.json_agg(aggregate_order_by(
+                    func.json_build_object(
+                        literal_column("'item_name'"), Item.name,
+                        literal_column("'effect_type'"), ActiveEffect.effect_type,
+                        literal_column("'effect_value'"), ActiveEffect.effect_value,
+                        literal_column("'expires_at'"), ActiveEffect.expires_at,
+                    ),
+                    ActiveEffect.expires_at,
+                ), type_=JSON).label("effects"),
+            )
+            .join(Item, Item.id == ActiveEffect.item_id)
+            .where(ActiveEffect.user_id == User.id)
+            .where(ActiveEffect.expires_at > now)
+            .group_by(ActiveEffect.effect_type)
+            .lateral("effects")
+        )
+        async with self._session() as session:
+            result = await session.execute(
+                select(
+                    User.player_uuid, User.name, User.profession, User.band, User.attributes,
+                    effects.c.effect_type, effects.c.bonus, effects.c.effects,
+                )
+                .outerjoin(effects, true())
+                .where(User.id == user_id if user_id is not None else User.player_uuid == player_uuid)
+            )
+            rows = result.all()
+        if not rows:
             return None
 
+        user = rows[0]
         config = await self.get_attribute_config()
         attributes = []
 
         # attributes should be dict from JSONB column
-        user_attrs = user.get("attributes") or {}
+        user_attrs = user.attributes or {}
 
-        # get active effects for temporary bonuses
-        active_effects = await self.get_user_active_effects(player_uuid)
+        # temporary bonuses, already summed per effect type
+        active_effects = []
         effect_bonuses = {}
-        for effect in active_effects:
-            if effect["effect_type"].startswith("attr_"):
-                attr_name = effect["effect_type"][5:]
-                effect_bonuses[attr_name] = effect_bonuses.get(attr_name, 0) + effect["effect_value"]
+        for row in rows:
+            if row.effect_type is None:
+                continue
+            active_effects.extend(row.effects)
+            if row.effect_type.startswith("attr_"):
+                effect_bonuses[row.effect_type[5:]] = int(row.bonus)
 
         for attr_config in config:
             attr_name = attr_config["attribute_name"]
@@ -160,46 +308,47 @@ class DatabaseService:
             })
 
         return {
-            "player_uuid": user["player_uuid"],
-            "name": user["name"],
-            "profession": user.get("profession", ""),
-            "band": user.get("band", ""),
+            "player_uuid": user.player_uuid,
+            "name": user.name,
+            "profession": user.profession or "",
+            "band": user.band or "",
             "attributes": attributes,
             "active_effects": active_effects,
         }
 
     async def _update_user_attributes(self, player_uuid: str, attributes: dict) -> bool:
-        async with async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(User).where(User.player_uuid == player_uuid)
             )
             user = result.scalar_one_or_none()
             if user:
                 user.attributes = attributes
-                await session.commit()
+                await self._commit(session)
                 return True
             return False
 
     # Items methods
     async def get_item_by_id(self, item_id: str) -> Optional[dict]:
-        async with async_session() as session:
-            result = await session.execute(
-                select(Item).options(selectinload(Item.trader)).where(Item.item_id == item_id)
-            )
-            item = result.scalar_one_or_none()
-            return item.to_dict() if item else None
+        items = await catalog_cache.get("items", self._load_items)
+        item = items.get(item_id)
+        return dict(item) if item else None
 
     async def get_all_items(self) -> list[dict]:
-        async with async_session() as session:
+        items = await catalog_cache.get("items", self._load_items)
+        return [dict(item) for item in items.values()]
+
+    async def _load_items(self) -> dict[str, dict]:
+        async with self._session() as session:
             result = await session.execute(
                 select(Item).options(selectinload(Item.trader))
             )
-            return [item.to_dict() for item in result.scalars().all()]
+            return {item.item_id: item.to_dict() for item in result.scalars().all()}
 
     # Active effects methods
     async def has_active_effect(self, player_uuid: str, item_id: str) -> bool:
         """Check if user has active effect from this item."""
-        async with async_session() as session:
+        async with self._session() as session:
             now = now_local()
             result = await session.execute(
                 select(ActiveEffect)
@@ -213,7 +362,7 @@ class DatabaseService:
 
     async def apply_item_effect(self, player_uuid: str, item_id: str) -> bool:
         """Apply temporary effect from item. Returns True if effect was applied."""
-        async with async_session() as session:
+        async with self._session() as session:
             user_result = await session.execute(
                 select(User).where(User.player_uuid == player_uuid)
             )
@@ -249,12 +398,18 @@ class DatabaseService:
                 expires_at=expires_at
             )
             session.add(effect)
-            await session.commit()
+            await session.flush()
+            effect_id = effect.id
+            self._on_commit(session, lambda: effect_expiry.schedule(effect_id, expires_at))
+            self._publish(session, player_uuid, {
+                "type": "effect", "action": "added", "item_id": item_id, "expires_at": expires_at.isoformat(),
+            })
+            await self._commit(session)
             return True
 
     async def get_user_active_effects(self, player_uuid: str) -> list[dict]:
         """Get all active effects for user."""
-        async with async_session() as session:
+        async with self._session() as session:
             now = now_local()
             result = await session.execute(
                 select(ActiveEffect)
@@ -275,21 +430,22 @@ class DatabaseService:
 
     # Perks methods
     async def get_perk_by_id(self, perk_id: str) -> Optional[dict]:
-        async with async_session() as session:
-            result = await session.execute(
-                select(Perk).where(Perk.perk_id == perk_id)
-            )
-            perk = result.scalar_one_or_none()
-            return perk.to_dict() if perk else None
+        perks = await catalog_cache.get("perks", self._load_perks)
+        perk = perks.get(perk_id)
+        return dict(perk) if perk else None
 
     async def get_all_perks(self) -> list[dict]:
-        async with async_session() as session:
+        perks = await catalog_cache.get("perks", self._load_perks)
+        return [dict(perk) for perk in perks.values()]
+
+    async def _load_perks(self) -> dict[str, dict]:
+        async with self._session() as session:
             result = await session.execute(select(Perk))
-            return [perk.to_dict() for perk in result.scalars().all()]
+            return {perk.perk_id: perk.to_dict() for perk in result.scalars().all()}
 
     async def has_user_perk(self, player_uuid: str, perk_id: str) -> bool:
         """Check if specific user has this perk."""
-        async with async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(UserPerk)
                 .join(User)
@@ -301,7 +457,7 @@ class DatabaseService:
 
     async def is_perk_taken(self, perk_id: str) -> bool:
         """Check if any user has this perk (for unique perks)."""
-        async with async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(UserPerk)
                 .join(Perk)
@@ -327,7 +483,7 @@ class DatabaseService:
         if not user:
             return False, "user_not_found"
 
-        async with async_session() as session:
+        async with self._session() as session:
             # get user and perk objects
             user_result = await session.execute(
                 select(User).where(User.player_uuid == player_uuid)
@@ -357,18 +513,24 @@ class DatabaseService:
                 perk_id=perk_obj.id,
             )
             session.add(user_perk)
-            await session.commit()
+            self._publish(session, player_uuid, {
+                "type": "perk",
+                "perk_id": perk_id,
+                "balance": user_obj.balance,
+            })
+            await self._commit(session)
 
         return True, ""
 
-    async def get_user_perks(self, player_uuid: str) -> list[dict]:
-        async with async_session() as session:
-            result = await session.execute(
-                select(UserPerk)
-                .options(selectinload(UserPerk.perk))
-                .join(User)
-                .where(User.player_uuid == player_uuid)
-            )
+    async def get_user_perks(self, player_uuid: Optional[str] = None, user_id: Optional[int] = None) -> list[dict]:
+        """Perks applied to a user, by player_uuid or primary key (no join to users)."""
+        query = select(UserPerk).options(selectinload(UserPerk.perk))
+        if user_id is not None:
+            query = query.where(UserPerk.user_id == user_id)
+        else:
+            query = query.join(User).where(User.player_uuid == player_uuid)
+        async with self._session() as session:
+            result = await session.execute(query)
             perks = []
             for user_perk in result.scalars().all():
                 perk_dict = user_perk.perk.to_dict()
@@ -376,9 +538,68 @@ class DatabaseService:
                 perks.append(perk_dict)
             return perks
 
+    # QR scan context
+    async def get_scan_context(
+        self,
+        player_uuid: Optional[str],
+        user_uuids: list[str],
+        item_ids: list[str],
+        perk_ids: list[str],
+    ) -> dict:
+        """Everything needed to confirm a batch of scans, in one round trip.
+
+        Each part is a scalar subquery of a single SELECT: the scanned users,
+        the scanning player's balance, which scanned items already have an
+        active effect on the player, which scanned perks the player has and
+        which are taken by anyone.
+        """
+        parts = {}
+        if user_uuids:
+            parts["users"] = select(
+                func.json_agg(func.json_build_object(
+                    literal_column("'player_uuid'"), User.player_uuid,
+                    literal_column("'name'"), User.name,
+                ), type_=JSON)
+            ).where(User.player_uuid.in_(user_uuids)).scalar_subquery()
+        if perk_ids:
+            parts["taken_perk_ids"] = select(func.array_agg(func.distinct(Perk.perk_id))).select_from(
+                UserPerk
+            ).join(Perk).where(Perk.perk_id.in_(perk_ids)).scalar_subquery()
+        if player_uuid:
+            parts["balance"] = select(User.balance).where(User.player_uuid == player_uuid).scalar_subquery()
+            if item_ids:
+                parts["active_item_ids"] = select(func.array_agg(func.distinct(Item.item_id))).select_from(
+                    ActiveEffect
+                ).join(Item).join(User).where(
+                    User.player_uuid == player_uuid,
+                    Item.item_id.in_(item_ids),
+                    ActiveEffect.expires_at > now_local(),
+                ).scalar_subquery()
+            if perk_ids:
+                parts["applied_perk_ids"] = select(func.array_agg(Perk.perk_id)).select_from(
+                    UserPerk
+                ).join(Perk).join(User).where(
+                    User.player_uuid == player_uuid,
+                    Perk.perk_id.in_(perk_ids),
+                ).scalar_subquery()
+
+        row = {}
+        if parts:
+            async with self._session() as session:
+                result = await session.execute(select(*(query.label(name) for name, query in parts.items())))
+                row = result.mappings().one()
+
+        return {
+            "users": {u["player_uuid"]: u for u in row.get("users") or []},
+            "balance": row.get("balance"),
+            "active_item_ids": set(row.get("active_item_ids") or []),
+            "applied_perk_ids": set(row.get("applied_perk_ids") or []),
+            "taken_perk_ids": set(row.get("taken_perk_ids") or []),
+        }
+
     # Traders methods
     async def get_trader_by_id(self, trader_id: str) -> Optional[dict]:
-        async with async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(Trader).where(Trader.trader_id == trader_id)
             )
@@ -386,22 +607,238 @@ class DatabaseService:
             return trader.to_dict() if trader else None
 
     async def get_all_traders(self) -> list[dict]:
-        async with async_session() as session:
+        traders = await catalog_cache.get("traders", self._load_traders)
+        return [dict(trader) for trader in traders]
+
+    async def _load_traders(self) -> list[dict]:
+        async with self._session() as session:
             result = await session.execute(select(Trader))
             return [trader.to_dict() for trader in result.scalars().all()]
 
     async def update_trader_balance(self, trader_id: str, new_balance: int) -> bool:
-        async with async_session() as session:
+        async with self._session() as session:
             result = await session.execute(
                 select(Trader).where(Trader.trader_id == trader_id)
             )
             trader = result.scalar_one_or_none()
             if trader:
                 trader.balance = new_balance
-                await session.commit()
+                self._on_commit(session, lambda: catalog_cache.invalidate("traders"))
+                await self._commit(session)
                 return True
             return False
 
+    async def transfer(
+        self,
+        from_uuid: str,
+        to_uuid: str,
+        amount: int,
+    ) -> tuple[Optional[dict], str]:
+        """Move money between players and write the ledger row in one DB transaction.
+
+        Both rows are locked in primary key order, so concurrent transfers
+        in opposite directions cannot deadlock. Returns (result, error_message).
+        """
+        async with self._session() as session:
+            result = await session.execute(
+                select(User.id, User.player_uuid, User.name, User.balance)
+                .where(User.player_uuid.in_([from_uuid, to_uuid]))
+                .order_by(User.id)
+                .with_for_update()
+            )
+            rows = {row.player_uuid: row for row in result}
+            sender = rows.get(from_uuid)
+            receiver = rows.get(to_uuid)
+
+            if not sender:
+                return None, "sender_not_found"
+            if not receiver:
+                return None, "receiver_not_found"
+            if sender.balance < amount:
+                return None, "insufficient_funds"
+
+            await session.execute(
+                update(User)
+                .where(User.id.in_([sender.id, receiver.id]))
+                .values(balance=User.balance + case(
+                    (User.id == sender.id, -amount),
+                    else_=amount,
+                ))
+                .execution_options(synchronize_session=False)
+            )
+            session.add(Transaction(
+                from_type="player",
+                from_id=from_uuid,
+                to_type="player",
+                to_id=to_uuid,
+                amount=amount,
+                tx_type="transfer",
+                description=f"{sender.name} -> {receiver.name}",
+            ))
+            self._publish(session, from_uuid, {"type": "balance", "balance": sender.balance - amount})
+            self._publish(session, to_uuid, {
+                "type": "balance",
+                "balance": receiver.balance + amount,
+                "received": amount,
+                "from_name": sender.name,
+            })
+            await self._commit(session)
+
+            return {
+                "new_balance": sender.balance - amount,
+                "transferred": amount,
+                "to_name": receiver.name,
+            }, ""
+
+    # Purchases
+    async def purchase_item(
+        self,
+        player_uuid: str,
+        item_id: str,
+        idempotency_key: Optional[str] = None,
+    ) -> tuple[Optional[dict], str, bool]:
+        """Buy an item: debit, trader credit, ledger row and effect in one DB transaction.
+
+        With an idempotency key, the result is stored with the key in the same
+        transaction, and a retry with the same key gets it back without
+        charging again. A concurrent retry blocks on the key's unique index
+        until the first attempt commits. Failed attempts charge nothing and
+        keep no key, and a key older than idempotency_key_ttl_hours counts as
+        new. Returns (result, error_message, replayed).
+        """
+        item = await self.get_item_by_id(item_id)
+        if not item:
+            return None, "item_not_found", False
+
+        async with self._session() as session:
+            key_id = None
+            if idempotency_key:
+                request_hash = hashlib.sha256(f"purchase\x00{item_id}".encode()).hexdigest()
+                now = now_local()
+                insert_key = pg_insert(IdempotencyKey).values(
+                    scope=player_uuid, key=idempotency_key, request_hash=request_hash, created_at=now,
+                )
+                key_id = (await session.execute(
+                    insert_key
+                    .on_conflict_do_update(
+                        index_elements=["scope", "key"],
+                        # an expired key, not purged yet, is taken over as a new one
+                        set_={"request_hash": request_hash, "response": null(), "created_at": now},
+                        where=IdempotencyKey.created_at < now - timedelta(hours=settings.idempotency_key_ttl_hours),
+                    )
+                    .returning(IdempotencyKey.id)
+                )).scalar()
+                if key_id is None:
+                    stored = (await session.execute(
+                        select(IdempotencyKey.request_hash, IdempotencyKey.response)
+                        .where(IdempotencyKey.scope == player_uuid, IdempotencyKey.key == idempotency_key)
+                    )).one()
+                    if stored.request_hash != request_hash:
+                        return None, "key_reused", False
+                    return stored.response, "", True
+
+            result, error = await self._purchase(session, player_uuid, item)
+
+            if key_id is not None:
+                if error:
+                    # nothing was charged, let the client retry with the same key
+                    await session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == key_id))
+                else:
+                    await session.execute(
+                        update(IdempotencyKey)
+                        .where(IdempotencyKey.id == key_id)
+                        .values(response=result)
+                    )
+            await self._commit(session)
+            return result, error, False
+
+    async def _purchase(self, session: AsyncSession, player_uuid: str, item: dict) -> tuple[Optional[dict], str]:
+        price = int(item.get("price", 0))
+
+        # conditional debit: the balance check and the write are one statement
+        debited = (await session.execute(
+            update(User)
+            .where(User.player_uuid == player_uuid, User.balance >= price)
+            .values(balance=User.balance - price)
+            .returning(User.id, User.balance)
+            .execution_options(synchronize_session=False)
+        )).first()
+        if not debited:
+            exists = (await session.execute(
+                select(User.id).where(User.player_uuid == player_uuid)
+            )).first()
+            return None, "insufficient_funds" if exists else "user_not_found"
+
+        trader_id = item.get("trader_id")
+        if trader_id:
+            await session.execute(
+                update(Trader)
+                .where(Trader.trader_id == trader_id)
+                .values(balance=Trader.balance + price)
+                .execution_options(synchronize_session=False)
+            )
+            self._on_commit(session, lambda: catalog_cache.invalidate("traders"))
+
+        session.add(Transaction(
+            from_type="player",
+            from_id=player_uuid,
+            to_type="trader" if trader_id else "system",
+            to_id=trader_id or "SYSTEM",
+            amount=price,
+            tx_type="purchase",
+            description=f"Покупка: {item.get('name', item['item_id'])}",
+        ))
+
+        effect_applied = False
+        if item.get("effect_type") and item.get("effect_duration"):
+            now = now_local()
+            expires_at = now + timedelta(minutes=item["effect_duration"])
+            already_active = select(ActiveEffect.id).where(
+                ActiveEffect.user_id == debited.id,
+                ActiveEffect.item_id == Item.id,
+                ActiveEffect.expires_at > now,
+            ).exists()
+            inserted = await session.execute(
+                insert(ActiveEffect).from_select(
+                    ["user_id", "item_id", "effect_type", "effect_value", "applied_at", "expires_at"],
+                    select(
+                        literal(debited.id),
+                        Item.id,
+                        literal(item["effect_type"]),
+                        literal(item.get("effect_value") or 0),
+                        literal(now),
+                        literal(expires_at),
+                    ).where(Item.item_id == item["item_id"], ~already_active),
+                ).returning(ActiveEffect.id)
+            )
+            effect_id = inserted.scalar()
+            if effect_id is not None:
+                effect_applied = True
+                self._on_commit(session, lambda: effect_expiry.schedule(effect_id, expires_at))
+                self._publish(session, player_uuid, {
+                    "type": "effect", "action": "added",
+                    "item_id": item["item_id"], "expires_at": expires_at.isoformat(),
+                })
+
+        self._publish(session, player_uuid, {"type": "balance", "balance": debited.balance})
+
+        return {
+            "success": True,
+            "item": item,
+            "paid": price,
+            "new_balance": debited.balance,
+            "effect_applied": effect_applied,
+        }, ""
+
+    async def purge_idempotency_keys(self, older_than: timedelta) -> int:
+        """Delete idempotency keys past their replay window."""
+        async with self._session() as session:
+            result = await session.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.created_at < now_local() - older_than)
+            )
+            await self._commit(session)
+            return result.rowcount
+
     # Transactions methods
     async def log_transaction(
         self,
@@ -413,7 +850,7 @@ class DatabaseService:
         tx_type: str,
         description: str = ""
     ) -> bool:
-        async with async_session() as session:
+        async with self._session() as session:
             tx = Transaction(
                 from_type=from_type,
                 from_id=from_id,
@@ -424,31 +861,72 @@ class DatabaseService:
                 description=description,
             )
             session.add(tx)
-            await session.commit()
+            await self._commit(session)
             return True
 
     async def get_transactions(self, limit: int = 100) -> list[dict]:
-        async with async_session() as session:
-            result = await session.execute(
-                select(Transaction).order_by(desc(Transaction.timestamp)).limit(limit)
-            )
-            return [tx.to_dict() for tx in result.scalars().all()]
+        transactions, _ = await self.get_transactions_page(limit)
+        return transactions
 
     async def get_user_transactions(self, player_uuid: str, limit: int = 50) -> list[dict]:
-        async with async_session() as session:
+        transactions, _ = await self.get_user_transactions_page(player_uuid, limit)
+        return transactions
+
+    async def get_transactions_page(
+        self, limit: int = 100, cursor: Optional[str] = None
+    ) -> tuple[list[dict], Optional[str]]:
+        """Ledger newest-first. Returns (transactions, next_cursor)."""
+        return await self._transactions_page(select(Transaction), limit, cursor)
+
+    async def get_user_transactions_page(
+        self, player_uuid: str, limit: int = 50, cursor: Optional[str] = None
+    ) -> tuple[list[dict], Optional[str]]:
+        """Player history newest-first. Returns (transactions, next_cursor)."""
+        query = select(Transaction).where(
+            # type filters match the partial indexes on transactions
+            ((Transaction.from_type == "player") & (Transaction.from_id == player_uuid)) |
+            ((Transaction.to_type == "player") & (Transaction.to_id == player_uuid))
+        )
+        return await self._transactions_page(query, limit, cursor)
+
+    async def _transactions_page(self, query, limit: int, cursor: Optional[str]):
+        """Keyset page on (timestamp, id); raises ValueError on a bad cursor."""
+        if cursor:
+            timestamp, tx_id = _decode_cursor(cursor)
+            query = query.where(
+                tuple_(Transaction.timestamp, Transaction.id) < tuple_(timestamp, tx_id)
+            )
+        async with self._session() as session:
             result = await session.execute(
-                select(Transaction)
-                .where(
-                    (Transaction.from_id == player_uuid) |
-                    (Transaction.to_id == player_uuid)
-                )
-                .order_by(desc(Transaction.timestamp))
-                .limit(limit)
+                query
+                .order_by(desc(Transaction.timestamp), desc(Transaction.id))
+                .limit(limit + 1)
             )
-            return [tx.to_dict() for tx in result.scalars().all()]
+            rows = result.scalars().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_cursor(rows[-1].timestamp, rows[-1].id)
+        return [tx.to_dict() for tx in rows], next_cursor
+
+    async def stream_transactions(self, batch_size: int = 1000) -> AsyncIterator[dict]:
+        """Yield the whole ledger oldest-first from a server-side cursor."""
+        columns = Transaction.__table__.c
+        async with engine.connect() as conn:
+            result = await conn.stream(
+                select(columns)
+                .order_by(columns.timestamp, columns.id)
+                .execution_options(yield_per=batch_size)
+            )
+            async for row in result:
+                tx = dict(row._mapping)
+                tx["timestamp"] = tx["timestamp"].isoformat()
+                tx["description"] = tx["description"] or ""
+                yield tx
 
     async def update_entity_image(self, entity_type: str, entity_id: str, image_url: str) -> bool:
-        async with async_session() as session:
+        async with self._session() as session:
             if entity_type == "item":
                 result = await session.execute(
                     select(Item).where(Item.item_id == entity_id)
@@ -464,13 +942,15 @@ class DatabaseService:
 
             if entity:
                 entity.image_url = image_url
-                await session.commit()
+                # covers /set-image-url, /generate-image and /upload-image-base64
+                self._on_commit(session, lambda: catalog_cache.invalidate(f"{entity_type}s"))
+                await self._commit(session)
                 return True
             return False
 
     # Admin methods for getting all users
     async def get_all_users(self) -> list[dict]:
-        async with async_session() as session:
+        async with self._session() as session:
             result = await session.execute(select(User))
             return [
                 {
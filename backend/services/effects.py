@@ -0,0 +1,242 @@
+"""Active effect expiry: sweep expired effects and tell players.
+
+A background task keeps a min-heap of upcoming expirations (reloaded every
+effect_reload_interval seconds, plus effects scheduled as purchases commit)
+and sleeps until the earliest one. When it is due, expired rows are moved
+out of active_effects in batches: archived to expired_effects or deleted,
+depending on effect_expiry_mode. Players get an event on their push stream
+and, with a linked Telegram account, an "effect ended" message. Archived
+rows older than expired_effect_retention_days are purged once an hour.
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import delete, func, insert, select
+
+from config.settings import settings
+from models import async_session, ActiveEffect, ExpiredEffect, Item, User
+from models.base import now_local
+from services.events import event_bus
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Notify = Callable[[int, str], Awaitable]
+
+PURGE_INTERVAL = 3600  # seconds between expired_effects retention purges
+
+
+class EffectExpiryScheduler:
+    def __init__(self, mode: str, batch_size: int, reload_interval: int, retention_days: int):
+        self.archive = mode == "archive"
+        self.batch_size = batch_size
+        self.reload_interval = reload_interval
+        self.retention_days = retention_days
+        self._heap: list[tuple[datetime, int]] = []
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._notify: Optional[Notify] = None
+
+    def start(self, notify: Optional[Notify] = None):
+        """Start the scheduler; notify(telegram_id, text) sends "effect ended" messages."""
+        self._notify = notify
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Effect expiry scheduler started (mode: {'archive' if self.archive else 'delete'})")
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def schedule(self, effect_id: int, expires_at: datetime):
+        """Track a new effect; wakes the scheduler if it expires before everything else."""
+        if self._wake is None:
+            return
+        # beyond the reload window the next reload picks it up
+        if expires_at - now_local() > timedelta(seconds=self.reload_interval):
+            return
+        heapq.heappush(self._heap, (expires_at, effect_id))
+        if self._heap[0][1] == effect_id:
+            self._wake.set()
+
+    async def _reload(self):
+        horizon = now_local() + timedelta(seconds=self.reload_interval)
+        async with async_session() as session:
+            result = await session.execute(
+                select(ActiveEffect.expires_at, ActiveEffect.id)
+                .where(ActiveEffect.expires_at <= horizon)
+                .order_by(ActiveEffect.expires_at)
+            )
+            self._heap = [tuple(row) for row in result]
+        heapq.heapify(self._heap)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_reload = next_purge = 0.0
+        while True:
+            try:
+                if loop.time() >= next_reload:
+                    await self._reload()
+                    next_reload = loop.time() + self.reload_interval
+                if self.retention_days and loop.time() >= next_purge:
+                    next_purge = loop.time() + PURGE_INTERVAL
+                    await self.purge_archive()
+
+                if self._heap and self._heap[0][0] <= now_local():
+                    await self.sweep()
+                    now = now_local()
+                    while self._heap and self._heap[0][0] <= now:
+                        heapq.heappop(self._heap)
+
+                timeout = next_reload - loop.time()
+                if self._heap:
+                    due_in = (self._heap[0][0] - now_local()).total_seconds()
+                    timeout = min(timeout, due_in)
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), max(timeout, 0.05))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Effect expiry error: {e}")
+                self._heap = []
+                next_reload = loop.time() + 5
+
+    async def sweep(self) -> int:
+        """Move every expired effect out of active_effects, batch by batch."""
+        started = time.perf_counter()
+        expired = []
+        while True:
+            batch = await self._sweep_batch()
+            expired.extend(batch)
+            if len(batch) < self.batch_size:
+                break
+
+        metrics.observe("effects.sweep_ms", (time.perf_counter() - started) * 1000)
+        metrics.incr("effects.expired", len(expired))
+        await self._record_table_size()
+
+        if expired and self._notify:
+            await self._send_notifications(expired)
+        return len(expired)
+
+    async def _sweep_batch(self) -> list[dict]:
+        async with async_session() as session:
+            due = (
+                select(ActiveEffect.id)
+                .where(ActiveEffect.expires_at <= now_local())
+                .order_by(ActiveEffect.expires_at)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)  # other workers take other rows
+            )
+            moved = (
+                delete(ActiveEffect)
+                .where(ActiveEffect.id.in_(due))
+                .returning(
+                    ActiveEffect.id, ActiveEffect.user_id, ActiveEffect.item_id,
+                    ActiveEffect.effect_type, ActiveEffect.effect_value,
+                    ActiveEffect.applied_at, ActiveEffect.expires_at,
+                )
+                .cte("moved")
+            )
+            result = await session.execute(
+                select(moved, User.player_uuid, User.telegram_id, Item.name.label("item_name"))
+                .select_from(
+                    moved.outerjoin(User, User.id == moved.c.user_id)
+                    .outerjoin(Item, Item.id == moved.c.item_id)
+                )
+            )
+            rows = [dict(row) for row in result.mappings()]
+
+            if rows and self.archive:
+                await session.execute(insert(ExpiredEffect), [
+                    {
+                        "effect_id": row["id"],
+                        "user_id": row["user_id"],
+                        "item_id": row["item_id"],
+                        "effect_type": row["effect_type"],
+                        "effect_value": row["effect_value"],
+                        "applied_at": row["applied_at"],
+                        "expires_at": row["expires_at"],
+                        "expired_at": now_local(),
+                    }
+                    for row in rows
+                ])
+            await session.commit()
+
+        for row in rows:
+            if row["player_uuid"]:
+                event_bus.publish(row["player_uuid"], {
+                    "type": "effect", "action": "expired", "item_name": row["item_name"],
+                })
+        return rows
+
+    async def purge_archive(self) -> int:
+        """Delete archived effects older than retention_days, batch by batch."""
+        cutoff = now_local() - timedelta(days=self.retention_days)
+        purged = 0
+        while True:
+            async with async_session() as session:
+                old = (
+                    select(ExpiredEffect.id)
+                    .where(ExpiredEffect.expired_at < cutoff)
+                    .limit(self.batch_size)
+                    .with_for_update(skip_locked=True)
+                )
+                result = await session.execute(delete(ExpiredEffect).where(ExpiredEffect.id.in_(old)))
+                await session.commit()
+            purged += result.rowcount
+            if result.rowcount < self.batch_size:
+                break
+        if purged:
+            metrics.incr("effects.archive_purged", purged)
+            logger.info(f"Purged {purged} archived effects older than {self.retention_days} days")
+        return purged
+
+    async def _record_table_size(self):
+        async with async_session() as session:
+            rows, size = (await session.execute(
+                select(func.count(ActiveEffect.id), func.pg_total_relation_size(ActiveEffect.__tablename__))
+            )).one()
+        metrics.set_gauge("effects.active_rows", rows)
+        metrics.set_gauge("effects.table_bytes", size)
+
+    async def _send_notifications(self, expired: list[dict]):
+        by_player: dict[int, list[dict]] = {}
+        for row in expired:
+            if row["telegram_id"]:
+                by_player.setdefault(row["telegram_id"], []).append(row)
+
+        for telegram_id, rows in by_player.items():
+            lines = [
+                f"• {row['item_name'] or row['effect_type']} "
+                f"({row['effect_value']:+} {row['effect_type'].replace('attr_', '').upper()})"
+                for row in rows
+            ]
+            try:
+                await self._notify(telegram_id, "⌛ Действие эффекта закончилось:\n" + "\n".join(lines))
+                metrics.incr("effects.notified")
+            except Exception as e:
+                metrics.incr("effects.notify_failed")
+                logger.warning(f"Effect notification to {telegram_id} failed: {e}")
+
+
+effect_expiry = EffectExpiryScheduler(
+    mode=settings.effect_expiry_mode,
+    batch_size=settings.effect_sweep_batch_size,
+    reload_interval=settings.effect_reload_interval,
+    retention_days=settings.expired_effect_retention_days,
+)
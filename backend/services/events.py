@@ -0,0 +1,152 @@
+"""Player event pub/sub for the push stream.
+
+DatabaseService publishes balance, perk and effect changes once their
+transaction commits; /api/stream/ subscribers receive them.
+With events_backend = "memory" events stay in this process. With "postgres"
+they go through NOTIFY on a channel every worker LISTENs on, so a player
+connected to one uvicorn worker sees changes made by another.
+
+If the LISTEN connection is lost (database restart, failover, idle
+connection killed) it is reopened with backoff; until then events are
+delivered in this process only, so the worker that made a change still
+pushes it.
+"""
+
+import asyncio
+import json
+import logging
+from typing import Optional
+
+import asyncpg
+
+from config.settings import settings
+from models.base import get_sync_url
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "player_events"
+RECONNECT_MAX_DELAY = 30.0  # seconds
+
+
+class EventBus:
+    def __init__(self, backend: str, queue_size: int):
+        self.backend = backend
+        self.queue_size = queue_size
+        self._subscribers: dict[str, set[asyncio.Queue]] = {}
+        self._conn: Optional[asyncpg.Connection] = None
+        self._notify_lock = asyncio.Lock()
+        self._pending: set[asyncio.Task] = set()
+        self._reconnect_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.backend != "postgres":
+            return
+        await self._connect()
+        logger.info(f"Event bus listening on '{CHANNEL}'")
+
+    async def stop(self):
+        if self._reconnect_task:
+            self._reconnect_task.cancel()
+            self._reconnect_task = None
+        if self._pending:
+            await asyncio.wait(self._pending, timeout=5)
+        conn, self._conn = self._conn, None  # before close: not a lost connection
+        if conn:
+            await conn.close()
+
+    async def _connect(self):
+        conn = await asyncpg.connect(get_sync_url(settings.database_url))
+        try:
+            await conn.add_listener(CHANNEL, self._on_notify)
+        except BaseException:
+            await conn.close()
+            raise
+        conn.add_termination_listener(self._on_terminated)
+        self._conn = conn
+
+    def _on_terminated(self, connection):
+        if connection is self._conn:
+            self._connection_lost()
+
+    def _connection_lost(self):
+        self._conn = None
+        if self._reconnect_task is None:
+            metrics.incr("events.disconnected")
+            logger.error("Event bus connection lost, delivering locally until it is back")
+            self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 1.0
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self._connect()
+            except Exception as e:
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                logger.error(f"Event bus reconnect failed, retrying in {delay:.0f}s: {e}")
+                continue
+            self._reconnect_task = None
+            metrics.incr("events.reconnected")
+            logger.info(f"Event bus listening on '{CHANNEL}' again")
+            return
+
+    def subscribe(self, player_uuid: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(player_uuid, set()).add(queue)
+        metrics.set_gauge("events.subscribers", self.subscriber_count())
+        return queue
+
+    def unsubscribe(self, player_uuid: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(player_uuid)
+        if queues:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[player_uuid]
+        metrics.set_gauge("events.subscribers", self.subscriber_count())
+
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+    def publish(self, player_uuid: str, event: dict):
+        """Send an event to the player's subscribers; call after commit."""
+        metrics.incr("events.published")
+        if self._conn is None:
+            self._deliver(player_uuid, event)
+            return
+        task = asyncio.get_running_loop().create_task(self._notify(player_uuid, event))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _notify(self, player_uuid: str, event: dict):
+        payload = json.dumps({"player_uuid": player_uuid, "event": event}, ensure_ascii=False)
+        try:
+            # one connection, one statement at a time
+            async with self._notify_lock:
+                conn = self._conn
+                if conn is None:  # lost while this was queued
+                    raise asyncpg.InterfaceError("event bus connection is closed")
+                await conn.execute("SELECT pg_notify($1, $2)", CHANNEL, payload)
+        except Exception as e:
+            metrics.incr("events.notify_failed")
+            logger.error(f"Event NOTIFY error: {e}")
+            if self._conn is not None and self._conn.is_closed():
+                self._connection_lost()
+            # the other workers miss it, but this worker's subscribers still get it
+            self._deliver(player_uuid, event)
+
+    def _on_notify(self, connection, pid, channel, payload: str):
+        message = json.loads(payload)
+        self._deliver(message["player_uuid"], message["event"])
+
+    def _deliver(self, player_uuid: str, event: dict):
+        for queue in self._subscribers.get(player_uuid, ()):
+            try:
+                queue.put_nowait(event)
+                metrics.incr("events.delivered")
+            except asyncio.QueueFull:
+                # a stalled client loses events rather than growing memory
+                metrics.incr("events.dropped")
+
+
+event_bus = EventBus(backend=settings.events_backend, queue_size=settings.events_queue_size)
@@ -0,0 +1,163 @@
+"""Content-addressed store for item and perk pictures.
+
+An image is kept under the sha256 of its bytes in IMAGE_STORE_DIR, so the
+same picture uploaded twice is stored once, and a stored file never
+changes: it is served with a strong ETag and an immutable Cache-Control.
+Next to each original, WebP thumbnails in THUMB_SIZES are made when it is
+stored, so lists never download full-size pictures.
+
+    <dir>/ab/<sha256>.png          original, as uploaded
+    <dir>/ab/<sha256>-128.webp     thumbnail fitting 128x128
+
+Served at /api/images/<sha256>.png and /api/images/<sha256>/128.webp.
+"""
+
+import asyncio
+import hashlib
+import io
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from PIL import Image, UnidentifiedImageError
+
+from config.settings import settings
+from services.qr import write_atomic
+from utils.metrics import metrics
+
+# 32px perk icons, 60px admin thumbnails, 200px item/perk cards; at 2x
+THUMB_SIZES = (64, 128, 400)
+FORMATS = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp", "GIF": "gif"}
+MEDIA_TYPES = {"png": "image/png", "jpg": "image/jpeg", "webp": "image/webp", "gif": "image/gif"}
+URL_PREFIX = "/api/images"
+
+_URL_RE = re.compile(rf"^{URL_PREFIX}/([0-9a-f]{{64}})\.(\w+)$")
+
+
+class ImageStoreError(ValueError):
+    pass
+
+
+@dataclass
+class StoredImage:
+    digest: str
+    ext: str
+    size: int  # bytes
+    width: int
+    height: int
+    created: bool  # False when the same image was already stored
+
+    @property
+    def url(self) -> str:
+        return f"{URL_PREFIX}/{self.digest}.{self.ext}"
+
+    def to_dict(self) -> dict:
+        return {
+            "url": self.url,
+            "digest": self.digest,
+            "size": self.size,
+            "width": self.width,
+            "height": self.height,
+            "thumbnails": {size: thumbnail_url(self.url, size) for size in THUMB_SIZES},
+            "deduplicated": not self.created,
+        }
+
+
+def thumbnail_url(url: Optional[str], size: int) -> Optional[str]:
+    """The thumbnail URL for an image in the store; any other URL unchanged."""
+    match = _URL_RE.match(url or "")
+    if not match:
+        return url
+    return f"{URL_PREFIX}/{match.group(1)}/{size}.webp"
+
+
+def _shrink(image: Image.Image, size: int) -> Image.Image:
+    thumb = image.copy()
+    thumb.thumbnail((size, size), Image.LANCZOS)  # only ever shrinks
+    return thumb
+
+
+def _webp(image: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, "WEBP", quality=80, method=4)
+    return buffer.getvalue()
+
+
+def _open(data: bytes) -> Image.Image:
+    """Read the header only; pixels are decoded by _thumbnail_source."""
+    try:
+        image = Image.open(io.BytesIO(data))
+    except UnidentifiedImageError:
+        raise ImageStoreError("Not a supported image")
+    except Image.DecompressionBombError as e:
+        raise ImageStoreError(str(e))
+    if image.format not in FORMATS:
+        raise ImageStoreError(f"Unsupported image format: {image.format}")
+    return image
+
+
+def _thumbnail_source(image: Image.Image) -> Image.Image:
+    try:
+        image.load()  # first frame of an animation
+    except OSError as e:
+        raise ImageStoreError(f"Broken image: {e}")
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+
+class ImageStore:
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path(self, digest: str, ext: str) -> Path:
+        return self.root / digest[:2] / f"{digest}.{ext}"
+
+    def thumbnail_path(self, digest: str, size: int) -> Path:
+        return self.root / digest[:2] / f"{digest}-{size}.webp"
+
+    def put(self, data: bytes) -> StoredImage:
+        """Store an image and its thumbnails; blocking, see put_async."""
+        digest = hashlib.sha256(data).hexdigest()
+        image = _open(data)
+        ext = FORMATS[image.format]
+        stored = StoredImage(digest, ext, len(data), image.width, image.height, created=False)
+
+        path = self.path(digest, ext)
+        if path.exists():
+            metrics.incr("image_store.deduplicated")
+            return stored
+
+        # thumbnails first: an original on disk means its thumbnails are there too
+        # largest first, each smaller one scaled down from the last
+        thumb = _thumbnail_source(image)
+        for size in sorted(THUMB_SIZES, reverse=True):
+            thumb = _shrink(thumb, size)
+            write_atomic(self.thumbnail_path(digest, size), _webp(thumb))
+        write_atomic(path, data)
+        stored.created = True
+        metrics.incr("image_store.stored")
+        return stored
+
+    async def put_async(self, data: bytes) -> StoredImage:
+        """put off the event loop; decoding and resizing are CPU-bound."""
+        return await asyncio.to_thread(self.put, data)
+
+    def find(self, digest: str, ext: str) -> Optional[Path]:
+        path = self.path(digest, ext)
+        return path if path.exists() else None
+
+    def find_thumbnail(self, digest: str, size: int) -> Optional[Path]:
+        """A thumbnail, made now if the original predates this size."""
+        path = self.thumbnail_path(digest, size)
+        if path.exists():
+            return path
+        original = next((p for ext in FORMATS.values() if (p := self.path(digest, ext)).exists()), None)
+        if original is None:
+            return None
+        image = _thumbnail_source(_open(original.read_bytes()))
+        write_atomic(path, _webp(_shrink(image, size)))
+        return path
+
+
+image_store = ImageStore(settings.image_store_dir)
@@ -1,92 +1,351 @@
-"""Image generation service using OpenRouter."""
+"""Image generation via OpenRouter, kept in the local image store.
 
-import httpx
+Generation runs as jobs off the request path: submit() returns a job at
+once and image_gen_concurrency workers generate, store and save the URL
+with the save callback (db_service.update_entity_image). All requests share
+one pooled httpx.AsyncClient. With image_catbox_mirror on, images are also
+uploaded to catbox.moe.
+
+Identical prompts (same model, whitespace-normalized text) are generated
+once: a prompt already queued or running gets the new job attached to it,
+and a finished one is answered from an LRU of image URLs keyed by the
+prompt hash.
+
+Jobs, prompt groups and the cache live in this process, so image jobs run
+in one uvicorn worker only: the first worker to start takes a Postgres
+advisory lock (claim) and runs the queue; the others answer the image job
+endpoints with 503 instead of 404s for jobs another worker holds.
+"""
+
+import asyncio
 import base64
-from typing import Optional
+import hashlib
+import logging
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+import asyncpg
+import httpx
 
 from config.settings import settings
+from models.base import get_sync_url, now_local
+from services.database import db_service
+from services.image_store import ImageStoreError, StoredImage, image_store
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Save = Callable[[str, str, str], Awaitable[bool]]  # (entity_type, entity_id, image_url) -> saved
+
+WORKER_LOCK = 0x696D616765  # pg advisory lock key held by the worker running the queue
+
+# default prompts for bulk generation; same style as the QR generator page
+PROMPTS = {
+    "item": (
+        "1950s retro style game item icon, {name}: {description}, glowing green neon outline "
+        "on solid black background, no text no letters no words, simple clean vector illustration, "
+        "pip-boy terminal style"
+    ),
+    "perk": (
+        "1950s retro cartoon mascot character, stylized pip-boy style illustration showing the "
+        "ability {name}: {description}, green neon glow lines on solid black background, no text, "
+        "simple clean vector icon, game UI element"
+    ),
+}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+class ImageGenError(Exception):
+    pass
+
+
+def get_client() -> httpx.AsyncClient:
+    """The shared client for OpenRouter and catbox requests."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=settings.image_gen_timeout,
+            limits=httpx.Limits(max_connections=settings.image_gen_concurrency * 2 + 2),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
 
 
 async def upload_to_catbox(image_data: bytes) -> Optional[str]:
     """Upload image to catbox.moe and return URL."""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                "https://catbox.moe/user/api.php",
-                data={"reqtype": "fileupload"},
-                files={"fileToUpload": ("image.png", image_data, "image/png")}
-            )
-            if response.status_code == 200:
-                url = response.text.strip()
-                if url.startswith("https://"):
-                    return url
-    except Exception as e:
-        print(f"Catbox upload error: {e}")
-    return None
-
-
-async def generate_image(prompt: str) -> Optional[str]:
+        return await _upload(image_data)
+    except ImageGenError as e:
+        logger.error(f"Catbox upload error: {e}")
+        return None
+
+
+async def store_image(image_data: bytes) -> tuple[StoredImage, Optional[str]]:
     """
-    Generate image using OpenRouter's FLUX model.
-    Returns the image data URL (base64) or None if failed.
+    Save an image to the local store, and to catbox if image_catbox_mirror is on.
+    Returns the stored image and the mirror URL. Raises ImageStoreError for
+    data that is not a supported image; a failed mirror upload is only logged.
     """
-    if not settings.openrouter_api_key:
-        return None
+    stored = await image_store.put_async(image_data)
+    mirror_url = None
+    if settings.image_catbox_mirror:
+        mirror_url = await upload_to_catbox(image_data)
+    return stored, mirror_url
+
 
+async def _upload(image_data: bytes) -> str:
     try:
-        async with httpx.AsyncClient(timeout=120.0) as client:
-            response = await client.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {settings.openrouter_api_key}",
-                    "Content-Type": "application/json",
-                },
-                json={
-                    "model": "black-forest-labs/flux.2-klein-4b",
-                    "messages": [
-                        {
-                            "role": "user",
-                            "content": prompt
-                        }
-                    ],
-                    "modalities": ["image", "text"],
-                }
-            )
-
-            print(f"OpenRouter response: {response.status_code}")
-
-            if response.status_code == 200:
-                data = response.json()
-                choices = data.get("choices", [])
-                if choices:
-                    message = choices[0].get("message", {})
-
-                    # images are in message.images array
-                    images = message.get("images", [])
-                    data_url = None
-
-                    if images:
-                        img = images[0]
-                        if isinstance(img, dict):
-                            data_url = img.get("image_url", {}).get("url")
-
-                    # fallback: check content
-                    if not data_url:
-                        content = message.get("content")
-                        if isinstance(content, str) and content.startswith("data:image"):
-                            data_url = content
-
-                    # upload base64 to catbox
-                    if data_url and data_url.startswith("data:image"):
-                        # extract base64 data
-                        base64_data = data_url.split(",", 1)[1] if "," in data_url else data_url
-                        image_bytes = base64.b64decode(base64_data)
-                        hosted_url = await upload_to_catbox(image_bytes)
-                        if hosted_url:
-                            return hosted_url
-
-            print(f"OpenRouter error response: {response.text}")
-            return None
-    except Exception as e:
-        print(f"Image generation error: {e}")
-        return None
+        response = await get_client().post(
+            settings.catbox_api_url,
+            data={"reqtype": "fileupload"},
+            files={"fileToUpload": ("image.png", image_data, "image/png")},
+            timeout=30.0,
+        )
+    except httpx.HTTPError as e:
+        raise ImageGenError(f"catbox: {e.__class__.__name__}: {e}")
+    url = response.text.strip()
+    if response.status_code != 200 or not url.startswith("https://"):
+        raise ImageGenError(f"catbox answered {response.status_code}: {url[:200]}")
+    return url
+
+
+async def _generate(prompt: str) -> bytes:
+    if not settings.openrouter_api_key:
+        raise ImageGenError("OpenRouter API key not configured")
+    try:
+        response = await get_client().post(
+            f"{settings.openrouter_api_url}/chat/completions",
+            headers={"Authorization": f"Bearer {settings.openrouter_api_key}"},
+            json={
+                "model": settings.openrouter_image_model,
+                "messages": [{"role": "user", "content": prompt}],
+                "modalities": ["image", "text"],
+            },
+        )
+    except httpx.HTTPError as e:
+        raise ImageGenError(f"OpenRouter: {e.__class__.__name__}: {e}")
+    if response.status_code != 200:
+        raise ImageGenError(f"OpenRouter answered {response.status_code}: {response.text[:200]}")
+
+    choices = response.json().get("choices", [])
+    message = choices[0].get("message", {}) if choices else {}
+    data_url = None
+    # images are in message.images array
+    images = message.get("images", [])
+    if images and isinstance(images[0], dict):
+        data_url = images[0].get("image_url", {}).get("url")
+    # fallback: check content
+    if not data_url:
+        content = message.get("content")
+        if isinstance(content, str) and content.startswith("data:image"):
+            data_url = content
+    if not data_url or not data_url.startswith("data:image"):
+        raise ImageGenError("OpenRouter returned no image")
+    return base64.b64decode(data_url.split(",", 1)[1] if "," in data_url else data_url)
+
+
+def prompt_key(prompt: str) -> str:
+    normalized = " ".join(prompt.split())
+    return hashlib.sha256(f"{settings.openrouter_image_model}\n{normalized}".encode()).hexdigest()
+
+
+@dataclass
+class ImageJob:
+    entity_type: str
+    entity_id: str
+    prompt: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = "queued"  # queued, running, done, failed
+    image_url: Optional[str] = None
+    error: Optional[str] = None
+    deduplicated: bool = False  # shared another job's generation or a cached result
+    created_at: datetime = field(default_factory=now_local)
+    finished_at: Optional[datetime] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "entity_type": self.entity_type,
+            "entity_id": self.entity_id,
+            "prompt": self.prompt,
+            "status": self.status,
+            "image_url": self.image_url,
+            "error": self.error,
+            "deduplicated": self.deduplicated,
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class ImageJobQueue:
+    def __init__(self, concurrency: int, cache_size: int, max_jobs: int = 1000):
+        self.concurrency = concurrency
+        self.cache_size = cache_size
+        self.max_jobs = max_jobs
+        self._save: Optional[Save] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._groups: dict[str, list[ImageJob]] = {}  # prompt key -> jobs waiting for it
+        self._cache: OrderedDict[str, str] = OrderedDict()  # prompt key -> stored image URL
+        self._jobs: OrderedDict[str, ImageJob] = OrderedDict()
+        self._finished: deque[str] = deque()  # ids of finished jobs, oldest first; only these are evicted
+        self._pending: dict[tuple[str, str], ImageJob] = {}  # (entity_type, entity_id) -> job
+        self._lock_conn: Optional[asyncpg.Connection] = None
+
+    @property
+    def running(self) -> bool:
+        return self._queue is not None
+
+    async def claim(self) -> bool:
+        """Take the advisory lock that makes this worker the one running image jobs."""
+        conn = await asyncpg.connect(get_sync_url(settings.database_url))
+        if await conn.fetchval("SELECT pg_try_advisory_lock($1)", WORKER_LOCK):
+            self._lock_conn = conn  # the lock lasts as long as the connection
+            return True
+        await conn.close()
+        logger.warning("Image jobs run in another uvicorn worker; this one answers them with 503")
+        return False
+
+    def start(self, save: Save):
+        """Start the workers; save(entity_type, entity_id, url) stores a result."""
+        self._save = save
+        self._queue = asyncio.Queue()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+        logger.info(f"Image job queue started ({self.concurrency} workers)")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        await close_client()
+        if self._lock_conn is not None:
+            await self._lock_conn.close()
+            self._lock_conn = None
+
+    def submit(self, entity_type: str, entity_id: str, prompt: str) -> ImageJob:
+        """Queue generation for an entity; an entity already waiting keeps its job."""
+        pending = self._pending.get((entity_type, entity_id))
+        if pending is not None:
+            return pending
+        if self._queue is None:
+            raise RuntimeError("Image job queue not started")
+
+        job = ImageJob(entity_type, entity_id, prompt)
+        self._jobs[job.id] = job
+        self._evict()
+        self._pending[(entity_type, entity_id)] = job
+
+        key = prompt_key(prompt)
+        group = self._groups.get(key)
+        if group is not None:
+            job.deduplicated = True
+            group.append(job)
+            metrics.incr("imagegen.deduplicated")
+        else:
+            self._groups[key] = [job]
+            self._queue.put_nowait(key)
+        metrics.incr("imagegen.submitted")
+        return job
+
+    async def submit_missing(self, entity_types: tuple[str, ...] = ("item", "perk")) -> list[ImageJob]:
+        """Queue generation for every item/perk without an image."""
+        loaders = {"item": (db_service.get_all_items, "item_id"), "perk": (db_service.get_all_perks, "perk_id")}
+        jobs = []
+        for entity_type in entity_types:
+            load, id_key = loaders[entity_type]
+            for entity in await load():
+                if not entity.get("image_url"):
+                    prompt = PROMPTS[entity_type].format(
+                        name=entity["name"], description=entity.get("description") or entity["name"],
+                    )
+                    jobs.append(self.submit(entity_type, entity[id_key], prompt))
+        return jobs
+
+    def get(self, job_id: str) -> Optional[ImageJob]:
+        return self._jobs.get(job_id)
+
+    def recent(self, limit: int = 50) -> list[dict]:
+        return [job.to_dict() for job in list(self._jobs.values())[-limit:][::-1]]
+
+    def stats(self) -> dict:
+        statuses = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "queued_prompts": self._queue.qsize() if self._queue else 0,
+            "cached_prompts": len(self._cache),
+            "jobs": statuses,
+        }
+
+    def _evict(self):
+        """Forget the oldest finished jobs beyond max_jobs; queued and running ones stay."""
+        while len(self._jobs) > self.max_jobs and self._finished:
+            self._jobs.pop(self._finished.popleft(), None)
+
+    async def _worker(self):
+        while True:
+            key = await self._queue.get()
+            jobs = self._groups[key]
+            for job in jobs:
+                job.status = "running"
+            url, error = self._cache.get(key), None
+            if url is not None:
+                self._cache.move_to_end(key)
+                metrics.incr("imagegen.cache_hits")
+                for job in jobs:
+                    job.deduplicated = True
+            else:
+                started = asyncio.get_running_loop().time()
+                try:
+                    stored, _ = await store_image(await _generate(jobs[0].prompt))
+                    url = stored.url
+                    self._cache[key] = url
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+                    metrics.observe("imagegen.seconds", asyncio.get_running_loop().time() - started,
+                                    (1, 2, 5, 10, 20, 30, 60, 120))
+                except (ImageGenError, ImageStoreError) as e:
+                    error = str(e)
+                except Exception as e:
+                    error = f"{e.__class__.__name__}: {e}"
+                    logger.exception("Image job error")
+            # jobs submitted until now joined the group; later ones start over
+            self._groups.pop(key, None)
+            for job in jobs:
+                await self._finish(job, url, error)
+
+    async def _finish(self, job: ImageJob, url: Optional[str], error: Optional[str]):
+        if url is not None:
+            try:
+                saved = await self._save(job.entity_type, job.entity_id, url)
+                error = None if saved else "entity not found"
+            except Exception as e:
+                error = f"save failed: {e}"
+        job.image_url = url
+        job.error = error
+        job.status = "failed" if error else "done"
+        job.finished_at = now_local()
+        self._pending.pop((job.entity_type, job.entity_id), None)
+        self._finished.append(job.id)
+        self._evict()
+        metrics.incr(f"imagegen.{job.status}")
+        if error:
+            logger.warning(f"Image job {job.id} ({job.entity_type} {job.entity_id}) failed: {error}")
+
+
+image_jobs = ImageJobQueue(
+    concurrency=settings.image_gen_concurrency,
+    cache_size=settings.image_gen_cache_size,
+)
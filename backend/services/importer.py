@@ -0,0 +1,364 @@
+"""Bulk import of event data (players, items, perks, ...) from spreadsheets.
+
+Rows come from a CSV file, an XLSX workbook (one worksheet per kind, named
+like the kind: Users, Items, ...) or a worksheet of the configured Google
+Sheet, and are read as a stream. Each row is validated on its own; bad rows
+are reported with their line number and skipped. Valid rows go to Postgres
+in chunks of INSERT ... ON CONFLICT (key) DO UPDATE, one transaction per
+chunk. An empty cell means "not given": a new row gets the model default,
+an existing row keeps its value. So a players sheet without telegram ids
+does not unlink anyone, and one without balances resets nothing.
+
+Items name their trader by trader_id; the codes are resolved through a map
+of all traders loaded once per import (and again after traders themselves
+were imported), not per row.
+"""
+
+import asyncio
+import codecs
+import csv
+import io
+import json
+import logging
+import re
+import time
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Optional
+
+from sqlalchemy import literal_column, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from models import async_session, Attribute, Item, Perk, Trader, User
+from models.base import now_local
+from services.catalog_cache import catalog_cache
+from services.sheets import sheets_service
+
+logger = logging.getLogger(__name__)
+
+MAX_ERRORS = 100  # row errors kept in a report
+THOUSANDS = re.compile(r"[+-]?\d{1,3}(,\d{3})+")  # a comma is only a thousands separator
+
+
+class RowError(ValueError):
+    pass
+
+
+def _text(max_length: Optional[int] = None, required: bool = False,
+          upper: bool = False) -> Callable[[str], Optional[str]]:
+    def parse(value: str) -> Optional[str]:
+        value = value.strip().upper() if upper else value.strip()
+        if not value:
+            if required:
+                raise RowError("is required")
+            return None
+        if max_length and len(value) > max_length:
+            raise RowError(f"is longer than {max_length} characters")
+        return value
+    return parse
+
+
+def _int(required: bool = False) -> Callable[[str], Optional[int]]:
+    def parse(value: str) -> Optional[int]:
+        value = value.strip()
+        if not value:
+            if required:
+                raise RowError("is required")
+            return None
+        text = value.replace(" ", "").replace("\u00a0", "")
+        if THOUSANDS.fullmatch(text):
+            text = text.replace(",", "")  # "1,500"
+        try:
+            return int(text)
+        except ValueError:
+            pass
+        try:
+            number = float(text)  # "100.0" from numeric XLSX cells
+        except ValueError:
+            raise RowError(f"is not a number: {value!r}")
+        if not number.is_integer():
+            raise RowError(f"is not a whole number: {value!r}")
+        return int(number)
+    return parse
+
+
+def _bool(value: str) -> Optional[bool]:
+    if not value.strip():
+        return None
+    return value.strip().lower() in ("1", "true", "yes", "y", "да", "+")
+
+
+def _json_object(value: str) -> Optional[dict]:
+    if not value.strip():
+        return None
+    try:
+        parsed = json.loads(value)
+    except json.JSONDecodeError:
+        raise RowError(f"is not valid JSON: {value[:40]!r}")
+    if not isinstance(parsed, dict):
+        raise RowError("must be a JSON object")
+    return parsed
+
+
+@dataclass
+class ImportKind:
+    model: Any
+    key: str  # unique column used for ON CONFLICT
+    fields: dict[str, Callable[[str], Any]]  # model column -> parser
+    aliases: dict[str, str] = field(default_factory=dict)  # file header -> model column
+
+
+KINDS = {
+    "attributes": ImportKind(Attribute, "attribute_name", {
+        "attribute_name": _text(50, required=True),
+        "display_name": _text(100, required=True),
+        "max_value": _int(),
+        "description": _text(),
+    }),
+    "traders": ImportKind(Trader, "trader_id", {
+        "trader_id": _text(50, required=True),
+        "name": _text(100, required=True),
+        "balance": _int(),
+    }),
+    "items": ImportKind(Item, "item_id", {
+        "item_id": _text(50, required=True),
+        "name": _text(100, required=True),
+        "description": _text(),
+        "price": _int(required=True),
+        "trader_id": _text(50),  # trader code, resolved to traders.id
+        "image_url": _text(),
+        "effect_type": _text(50),
+        "effect_value": _int(),
+        "effect_duration": _int(),
+    }),
+    "perks": ImportKind(Perk, "perk_id", {
+        "perk_id": _text(50, required=True),
+        "name": _text(100, required=True),
+        "description": _text(),
+        "one_time": _bool,
+        "effect_type": _text(50),
+        "effect_value": _int(),
+        "image_url": _text(),
+    }),
+    "users": ImportKind(User, "player_uuid", {
+        "player_uuid": _text(8, required=True, upper=True),  # looked up upper-cased everywhere
+        "name": _text(100, required=True),
+        "telegram_id": _int(),
+        "profession": _text(100),
+        "band": _text(100),
+        "balance": _int(),
+        "attributes": _json_object,
+    }, aliases={"user_id": "telegram_id", "attributes_json": "attributes"}),
+}
+
+# traders first, so items can refer to traders from the same workbook
+ORDER = ["attributes", "traders", "items", "perks", "users"]
+
+
+@dataclass
+class ImportReport:
+    kind: str
+    rows: int = 0
+    inserted: int = 0
+    updated: int = 0
+    invalid: int = 0
+    failed: int = 0  # valid rows in chunks the database rejected
+    errors: list[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    def error(self, message: str):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append(message)
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "updated": self.updated,
+            "invalid": self.invalid,
+            "failed": self.failed,
+            "errors": self.errors,
+            "seconds": round(self.seconds, 3),
+            "rows_per_sec": round(self.rows / self.seconds) if self.seconds else None,
+        }
+
+
+# Readers: each yields the header row, then data rows, as lists of strings
+
+def read_csv(file: BinaryIO) -> Iterator[list[str]]:
+    """UTF-8, or cp1251 (Excel's "CSV" on Russian Windows) when the start of the file is not UTF-8."""
+    head = file.read(65536)
+    file.seek(0)
+    try:
+        codecs.getincrementaldecoder("utf-8-sig")().decode(head, final=False)
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        encoding = "cp1251"
+    text = io.TextIOWrapper(file, encoding=encoding, newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+def xlsx_sheets(file: BinaryIO) -> dict[str, Iterator[list[str]]]:
+    """Kind -> rows of each worksheet named after a kind (case-insensitive)."""
+    from openpyxl import load_workbook  # only needed for XLSX imports
+
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    return {
+        ws.title.strip().lower(): (
+            ["" if v is None else str(v) for v in row]
+            for row in ws.iter_rows(values_only=True)
+        )
+        for ws in workbook.worksheets
+        if ws.title.strip().lower() in KINDS
+    }
+
+
+def read_worksheet(title: str) -> Iterator[list[str]]:
+    """Rows of a worksheet in the configured Google Sheet."""
+    yield from sheets_service._get_spreadsheet().worksheet(title).get_all_values()
+
+
+class Importer:
+    def __init__(self, chunk_size: int = 1000):
+        self.chunk_size = chunk_size
+        self._traders: Optional[dict[str, int]] = None
+
+    async def import_sheets(self, sheets: dict[str, Iterable[list[str]]], dry_run: bool = False) -> list[ImportReport]:
+        """Import several kinds at once, in dependency order."""
+        unknown = set(sheets) - set(KINDS)
+        if unknown:
+            raise ValueError(f"Unknown kind(s): {', '.join(sorted(unknown))}")
+        return [await self.import_rows(kind, sheets[kind], dry_run) for kind in ORDER if kind in sheets]
+
+    async def import_rows(self, kind: str, rows: Iterable[list[str]], dry_run: bool = False) -> ImportReport:
+        spec = KINDS[kind]
+        report = ImportReport(kind)
+        started = time.perf_counter()
+        rows = iter(rows)
+
+        try:
+            header = await asyncio.to_thread(next, rows, None)
+        except UnicodeDecodeError as e:
+            report.error(f"Cannot read the file as {e.encoding} text")
+            return report
+        columns = [spec.aliases.get(h.strip().lower(), h.strip().lower()) for h in header or []]
+        missing = [name for name, parse in spec.fields.items()
+                   if _is_required(parse) and name not in columns]
+        if missing:
+            report.error(f"Missing column(s): {', '.join(missing)}")
+            return report
+        used = [(i, name) for i, name in enumerate(columns) if name in spec.fields]
+
+        if kind == "items" and any(name == "trader_id" for _, name in used):
+            await self._load_traders()
+
+        line = 1
+        seen = set()
+        while True:
+            # file parsing (XLSX especially) runs off the event loop
+            try:
+                chunk = await asyncio.to_thread(lambda: list(islice(rows, self.chunk_size)))
+            except UnicodeDecodeError as e:
+                report.error(f"After line {line}: cannot read the file as {e.encoding} text")
+                break
+            if not chunk:
+                break
+            records = {}
+            for raw in chunk:
+                line += 1
+                if not any(cell.strip() for cell in raw):
+                    continue  # blank line
+                report.rows += 1
+                try:
+                    record = self._parse(kind, spec, used, raw)
+                except RowError as e:
+                    report.invalid += 1
+                    report.error(f"Line {line}: {e}")
+                    continue
+                records[record[spec.key]] = record  # a repeated key: the last row wins
+            seen.update(records)
+            if records and not dry_run:
+                await self._upsert(spec, list(records.values()), report)
+
+        if kind == "traders":
+            # new codes for items imported after this; a dry run only pretends they exist
+            self._traders = None
+            if dry_run:
+                await self._load_traders()
+                self._traders.update((code, 0) for code in seen)
+        if not dry_run and report.inserted + report.updated:
+            catalog_cache.invalidate()
+        report.seconds = time.perf_counter() - started
+        logger.info(f"Imported {kind}: {report.to_dict()}")
+        return report
+
+    def _parse(self, kind: str, spec: ImportKind, used: list[tuple[int, str]], raw: list[str]) -> dict:
+        record = {}
+        for i, name in used:
+            value = raw[i] if i < len(raw) else ""
+            try:
+                parsed = spec.fields[name](value)
+            except RowError as e:
+                raise RowError(f"{name} {e}")
+            if parsed is not None:
+                record[name] = parsed
+        if kind == "items" and record.get("trader_id") is not None:
+            code = record["trader_id"]
+            if code not in self._traders:
+                raise RowError(f"unknown trader_id {code!r}")
+            record["trader_id"] = self._traders[code]
+        return record
+
+    async def _load_traders(self):
+        if self._traders is None:
+            async with async_session() as session:
+                result = await session.execute(select(Trader.trader_id, Trader.id))
+                self._traders = dict(result.all())
+
+    async def _upsert(self, spec: ImportKind, records: list[dict], report: ImportReport):
+        # one statement per set of filled columns; usually one or two per chunk
+        shapes: dict[tuple, list[dict]] = {}
+        for record in records:
+            shapes.setdefault(tuple(record), []).append(record)
+        inserted = []
+        try:
+            async with async_session() as session:
+                for shape, group in shapes.items():
+                    statement = _upsert_statement(spec, shape, group)
+                    inserted += (await session.execute(statement)).scalars().all()
+                await session.commit()
+        except Exception as e:
+            report.failed += len(records)
+            report.error(f"Chunk of {len(records)} rows rejected: {e.__class__.__name__}: {str(e).splitlines()[0]}")
+            logger.error(f"Import chunk error ({spec.model.__tablename__}): {e}")
+            return
+        report.inserted += sum(1 for new in inserted if new)
+        report.updated += sum(1 for new in inserted if not new)
+
+
+def _upsert_statement(spec: ImportKind, columns: tuple, records: list[dict]):
+    statement = pg_insert(spec.model).values(records)
+    updates = {name: statement.excluded[name] for name in columns if name != spec.key}
+    if updates and "updated_at" in spec.model.__table__.c:
+        updates["updated_at"] = now_local()  # onupdate does not fire here; the Sheets export needs it
+    if updates:
+        statement = statement.on_conflict_do_update(index_elements=[spec.key], set_=updates)
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=[spec.key])
+    # xmax is 0 for a freshly inserted row version
+    return statement.returning(literal_column("xmax = 0"))
+
+
+def _is_required(parse: Callable) -> bool:
+    try:
+        parse("")
+    except RowError:
+        return True
+    return False
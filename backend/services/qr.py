@@ -1,44 +1,81 @@
-import io
+"""QR code rendering with an in-memory LRU and an optional on-disk store.
+
+A rendered QR code depends only on (payload, box size, colors, format), so
+renders are cached under that key: first in a process-local LRU, then, if
+QR_CACHE_DIR is set, in a content-addressed directory shared by workers and
+kept across restarts.
+"""
+
+import asyncio
 import base64
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from pathlib import Path
+from typing import Optional
 
 import qrcode
 from qrcode.image.styledpil import StyledPilImage
 from qrcode.image.styles.colormasks import SolidFillColorMask
 
+from config.settings import settings
 
-def generate_qr_code(data: str) -> str:
-    """Generate QR code as base64 PNG string with Fallout-style colors."""
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(data)
-    qr.make(fit=True)
+logger = logging.getLogger(__name__)
 
-    # Fallout green on black
-    img = qr.make_image(
-        image_factory=StyledPilImage,
-        color_mask=SolidFillColorMask(
-            back_color=(10, 10, 10),  # Dark background
-            front_color=(20, 255, 0),  # Terminal green
-        ),
-    )
+# Fallout green on black
+FRONT_COLOR = (20, 255, 0)  # Terminal green
+BACK_COLOR = (10, 10, 10)  # Dark background
 
-    buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
+MEDIA_TYPES = {"PNG": "image/png", "WEBP": "image/webp", "JPEG": "image/jpeg"}
 
-    return base64.b64encode(buffer.getvalue()).decode()
+_executor = ThreadPoolExecutor(max_workers=settings.qr_render_workers, thread_name_prefix="qr")
 
 
-def generate_qr_image(data: str) -> bytes:
-    """Generate QR code as PNG bytes."""
+def qr_cache_key(
+    data: str,
+    box_size: int = 10,
+    front_color: tuple = FRONT_COLOR,
+    back_color: tuple = BACK_COLOR,
+    fmt: str = "PNG",
+) -> str:
+    """Content address of a render: sha256 of everything that affects the output."""
+    raw = f"{data}\x00{box_size}\x00{front_color}\x00{back_color}\x00{fmt}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def qr_etag(data: str, variant: str = "", **kwargs) -> str:
+    """Strong ETag for a render; variant tells apart encodings of the same image."""
+    tag = qr_cache_key(data, **kwargs)[:32]
+    return f'"{tag}-{variant}"' if variant else f'"{tag}"'
+
+
+def write_atomic(path: Path, data: bytes):
+    """Write via a uniquely named temp file and rename, so readers never see a partial file."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp", delete=False) as tmp:
+        tmp.write(data)
+    try:
+        os.replace(tmp.name, path)
+    except OSError:
+        os.unlink(tmp.name)
+        raise
+
+
+def _disk_path(key: str, fmt: str) -> Optional[Path]:
+    if not settings.qr_cache_dir:
+        return None
+    return Path(settings.qr_cache_dir) / key[:2] / f"{key}.{fmt.lower()}"
+
+
+def _render(data: str, box_size: int, front_color: tuple, back_color: tuple, fmt: str) -> bytes:
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
+        box_size=box_size,
         border=4,
     )
     qr.add_data(data)
@@ -47,13 +84,60 @@ def generate_qr_image(data: str) -> bytes:
     img = qr.make_image(
         image_factory=StyledPilImage,
         color_mask=SolidFillColorMask(
-            back_color=(10, 10, 10),
-            front_color=(20, 255, 0),
+            back_color=back_color,
+            front_color=front_color,
         ),
     )
 
     buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
-
+    img.save(buffer, format=fmt)
     return buffer.getvalue()
+
+
+@lru_cache(maxsize=settings.qr_cache_size)
+def render_qr(
+    data: str,
+    box_size: int = 10,
+    front_color: tuple = FRONT_COLOR,
+    back_color: tuple = BACK_COLOR,
+    fmt: str = "PNG",
+    persist: bool = True,
+) -> bytes:
+    """
+    Render QR code image bytes, served from cache when possible.
+    persist=False keeps the render out of the on-disk store, for arbitrary
+    payloads from public requests.
+    """
+    path = _disk_path(qr_cache_key(data, box_size, front_color, back_color, fmt), fmt) if persist else None
+    if path:
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"QR disk cache read failed: {e}")
+
+    image_bytes = _render(data, box_size, front_color, back_color, fmt)
+
+    if path:
+        try:
+            write_atomic(path, image_bytes)
+        except OSError as e:
+            logger.warning(f"QR disk cache write failed: {e}")
+    return image_bytes
+
+
+async def render_qr_async(data: str, **kwargs) -> bytes:
+    """render_qr off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, partial(render_qr, data, **kwargs))
+
+
+def generate_qr_code(data: str) -> str:
+    """Generate QR code as base64 PNG string with Fallout-style colors."""
+    return base64.b64encode(render_qr(data)).decode()
+
+
+def generate_qr_image(data: str) -> bytes:
+    """Generate QR code as PNG bytes."""
+    return render_qr(data)
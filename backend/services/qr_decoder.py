@@ -1,52 +1,190 @@
-"""QR code decoder for photos."""
+"""QR code decoder for photos.
 
+Phone photos are downscaled to grayscale once, then several preprocessing
+strategies are tried. decode_qr_from_bytes runs them one after another;
+decode_qr_async races them in a process pool and returns the first success.
+"""
+
+import asyncio
 import io
-from PIL import Image, ImageOps, ImageEnhance
-from pyzbar.pyzbar import decode
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import Optional
 
+import numpy as np
+from PIL import Image, ImageOps
+from pyzbar.pyzbar import decode
+
+from config.settings import settings
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_THRESHOLD_LUT = [255 if x > 128 else 0 for x in range(256)]
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _prepare(image_bytes: bytes) -> np.ndarray:
+    """Open, orient and downscale a photo to a grayscale array.
+
+    zbar only looks at luminance, so every strategy works on grayscale.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    max_side = settings.qr_decode_max_side
+    scale = max(image.size) / max_side
+    if scale > 1:
+        # JPEG can decode straight at 1/2, 1/4 or 1/8 scale
+        image.draft("L", (int(image.width / scale), int(image.height / scale)))
+    image = ImageOps.exif_transpose(image).convert("L")
+    image.thumbnail((max_side, max_side), Image.BILINEAR)
+    return np.asarray(image)
+
+
+def _stretch_contrast(gray: np.ndarray) -> np.ndarray:
+    """Map the 2nd..98th luminance percentiles onto 0..255 through a LUT."""
+    cdf = np.bincount(gray.ravel(), minlength=256).cumsum()
+    low, high = np.searchsorted(cdf, (cdf[-1] * 0.02, cdf[-1] * 0.98))
+    if high <= low:
+        return gray
+    lut = np.clip((np.arange(256) - low) * (255.0 / (high - low)), 0, 255).astype(np.uint8)
+    return lut[gray]
+
+
+def _adaptive_threshold(gray: np.ndarray, offset: int = 7) -> np.ndarray:
+    """Binarize against the local mean, computed from an integral image."""
+    height, width = gray.shape
+    block = max(15, (min(height, width) // 20) | 1)
+    pad = block // 2
+    # int64: an int32 integral image overflows past ~2900x2900, and qr_decode_max_side is a setting
+    padded = np.pad(gray, pad, mode="edge").astype(np.int64)
+    integral = np.pad(padded.cumsum(0).cumsum(1), ((1, 0), (1, 0)))
+    sums = (
+        integral[block:block + height, block:block + width]
+        - integral[:height, block:block + width]
+        - integral[block:block + height, :width]
+        + integral[:height, :width]
+    )
+    # gray > mean - offset, without dividing every pixel
+    return np.where(gray.astype(np.int64) * (block * block) > sums - offset * block * block, 255, 0).astype(np.uint8)
+
+
+def _strategy_grayscale(gray):
+    return Image.fromarray(gray)
+
+
+def _strategy_contrast(gray):
+    return Image.fromarray(_stretch_contrast(gray))
+
+
+def _strategy_inverted(gray):
+    # light QR on dark background
+    return Image.fromarray(255 - gray)
+
+
+def _strategy_threshold(gray):
+    return Image.fromarray(gray).point(_THRESHOLD_LUT)
+
+
+def _strategy_adaptive(gray):
+    return Image.fromarray(_adaptive_threshold(gray))
+
+
+# most likely to succeed first; the app's own codes are light on dark
+STRATEGIES = {
+    "grayscale": _strategy_grayscale,
+    "inverted": _strategy_inverted,
+    "contrast": _strategy_contrast,
+    "adaptive": _strategy_adaptive,
+    "threshold": _strategy_threshold,
+}
+
+
+def _decode_with(strategy: str, gray: np.ndarray) -> Optional[str]:
+    """Run one strategy; executed in worker processes."""
+    return _try_decode(STRATEGIES[strategy](gray))
+
 
 def decode_qr_from_bytes(image_bytes: bytes) -> Optional[str]:
     """Decode QR code from image bytes. Handles colored QR codes."""
     try:
-        image = Image.open(io.BytesIO(image_bytes))
-
-        # Try original image first
-        result = _try_decode(image)
-        if result:
-            return result
-
-        # Convert to grayscale and try again
-        grayscale = ImageOps.grayscale(image)
-        result = _try_decode(grayscale)
-        if result:
-            return result
-
-        # Try with increased contrast
-        enhancer = ImageEnhance.Contrast(grayscale)
-        high_contrast = enhancer.enhance(2.0)
-        result = _try_decode(high_contrast)
-        if result:
-            return result
-
-        # Try inverted (for light QR on dark background)
-        inverted = ImageOps.invert(grayscale)
-        result = _try_decode(inverted)
-        if result:
-            return result
-
-        # Try binary threshold
-        threshold = grayscale.point(lambda x: 255 if x > 128 else 0)
-        result = _try_decode(threshold)
-        if result:
-            return result
-
+        gray = _prepare(image_bytes)
+        for strategy in STRATEGIES:
+            result = _decode_with(strategy, gray)
+            if result:
+                return result
         return None
     except Exception as e:
-        print(f"QR decode error: {e}")
+        logger.error(f"QR decode error: {e}")
         return None
 
 
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that runs an event loop and threads is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=settings.qr_decode_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_decoder():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def decode_qr_async(image_bytes: bytes) -> tuple[Optional[str], Optional[str]]:
+    """Race all strategies in the process pool; returns (data, strategy) or (None, None)."""
+    loop = asyncio.get_running_loop()
+    pool = _get_pool()
+    started = time.perf_counter()
+    try:
+        gray = await loop.run_in_executor(pool, _prepare, image_bytes)
+    except BrokenProcessPool:
+        # a worker died (e.g. OOM on a huge image); start fresh next time
+        logger.error("QR decoder pool broken, restarting")
+        shutdown_decoder()
+        metrics.incr("qr.decode.invalid")
+        return None, None
+    except Exception as e:
+        logger.error(f"QR decode error: {e}")
+        metrics.incr("qr.decode.invalid")
+        return None, None
+
+    pending = {
+        loop.run_in_executor(pool, _decode_with, strategy, gray): strategy
+        for strategy in STRATEGIES
+    }
+    data = winner = None
+    try:
+        while pending and data is None:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                strategy = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"QR decode error ({strategy}): {e}")
+                    continue
+                if result and data is None:
+                    data, winner = result, strategy
+    finally:
+        # strategies not yet picked up by a worker are dropped
+        for future in pending:
+            future.cancel()
+
+    metrics.observe("qr.decode_ms", (time.perf_counter() - started) * 1000)
+    metrics.incr(f"qr.decode.{winner or 'miss'}")
+    return data, winner
+
+
 def _try_decode(image: Image.Image) -> Optional[str]:
     """Try to decode QR from image."""
     decoded_objects = decode(image)
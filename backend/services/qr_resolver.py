@@ -0,0 +1,141 @@
+"""QR scan resolution through a prefix handler table.
+
+QR formats:
+- LOGIN:UUID - login as user
+- PAY:ITEM_ID - pay for item
+- SEND:UUID - send money to user
+- PERK:PERK_ID - apply perk
+- UUID (no prefix) - legacy login
+
+A handler is registered per prefix with the kind of entity its value refers
+to ("user", "item" or "perk"). All scans in a batch are parsed first, their
+entity ids collected, and the player-specific context for the whole batch
+is loaded with one db_service.get_scan_context call before the handlers run.
+Items and perks come from the catalog cache.
+"""
+
+from typing import Callable, Optional
+
+from services.database import db_service
+
+_HANDLERS: dict[str, tuple[str, str, Callable]] = {}
+
+
+class QRResolveError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def qr_handler(prefix: str, result_type: str, entity: str):
+    """Register build(value, entity, context, player_uuid) -> data for a QR prefix."""
+    def register(build: Callable) -> Callable:
+        _HANDLERS[prefix] = (result_type, entity, build)
+        return build
+    return register
+
+
+def parse_payload(payload: str) -> tuple[str, str]:
+    """Split a payload into (PREFIX, value)."""
+    payload = payload.strip()
+    if ":" not in payload:
+        return "LOGIN", payload.upper()
+
+    prefix, value = payload.split(":", 1)
+    prefix = prefix.upper()
+    if prefix not in _HANDLERS:
+        raise QRResolveError(400, f"Unknown QR type: {prefix}")
+    value = value.strip()
+    if _HANDLERS[prefix][1] == "user":
+        value = value.upper()
+    return prefix, value
+
+
+@qr_handler("LOGIN", "login", "user")
+def _resolve_login(value, user, context, player_uuid):
+    return {"data": user}
+
+
+@qr_handler("SEND", "send", "user")
+def _resolve_send(value, user, context, player_uuid):
+    return {"data": user}
+
+
+@qr_handler("PAY", "pay", "item")
+def _resolve_pay(value, item, context, player_uuid):
+    result = {"data": item}
+    if context["balance"] is not None:
+        result["player"] = {
+            "balance": context["balance"],
+            "can_afford": context["balance"] >= item["price"],
+            "effect_active": value in context["active_item_ids"],
+        }
+    return result
+
+
+@qr_handler("PERK", "perk", "perk")
+def _resolve_perk(value, perk, context, player_uuid):
+    result = {"data": perk}
+    if context["balance"] is not None:
+        applied = value in context["applied_perk_ids"]
+        result["player"] = {
+            "balance": context["balance"],
+            "already_applied": applied,
+            "taken": bool(perk.get("one_time")) and not applied and value in context["taken_perk_ids"],
+        }
+    return result
+
+
+_NOT_FOUND = {"user": "User not found", "item": "Item not found", "perk": "Perk not found"}
+
+
+async def resolve_payloads(payloads: list[str], player_uuid: Optional[str] = None) -> list[dict]:
+    """Resolve scans in order.
+
+    Each result is {"payload", "type", "data"} plus "player" when player_uuid
+    is given, or {"payload", "status_code", "detail"} for a failed scan.
+    Raises QRResolveError if player_uuid is given but unknown.
+    """
+    parsed = []
+    for payload in payloads:
+        try:
+            parsed.append(parse_payload(payload))
+        except QRResolveError as e:
+            parsed.append(e)
+
+    wanted = {"user": set(), "item": set(), "perk": set()}
+    for scan in parsed:
+        if not isinstance(scan, QRResolveError):
+            prefix, value = scan
+            wanted[_HANDLERS[prefix][1]].add(value)
+
+    items = {item_id: await db_service.get_item_by_id(item_id) for item_id in wanted["item"]}
+    perks = {perk_id: await db_service.get_perk_by_id(perk_id) for perk_id in wanted["perk"]}
+    context = await db_service.get_scan_context(
+        player_uuid=player_uuid.upper() if player_uuid else None,
+        user_uuids=sorted(wanted["user"]),
+        item_ids=sorted(item_id for item_id, item in items.items() if item),
+        perk_ids=sorted(perk_id for perk_id, perk in perks.items() if perk),
+    )
+    if player_uuid and context["balance"] is None:
+        raise QRResolveError(404, "User not found")
+    entities = {"user": context["users"], "item": items, "perk": perks}
+
+    results = []
+    for payload, scan in zip(payloads, parsed):
+        if isinstance(scan, QRResolveError):
+            results.append({"payload": payload, "status_code": scan.status_code, "detail": scan.detail})
+            continue
+        prefix, value = scan
+        result_type, entity_kind, build = _HANDLERS[prefix]
+        entity = entities[entity_kind].get(value)
+        if not entity:
+            if ":" not in payload:
+                # legacy bare UUID that is not a player
+                results.append({"payload": payload, "status_code": 400, "detail": "Invalid QR code"})
+            else:
+                results.append({"payload": payload, "status_code": 404, "detail": _NOT_FOUND[entity_kind]})
+            continue
+        results.append({"payload": payload, "type": result_type, **build(value, entity, context, player_uuid)})
+    return results
@@ -0,0 +1,210 @@
+"""Bulk QR sheets for printing every player, item and perk.
+
+Codes are rendered through services.qr in a shared pool of worker
+processes, then laid out on A4 pages (multi-page PDF, or a ZIP of page
+PNGs), or packed one file per code into a ZIP. Pages are written to the
+output one at a time, so memory stays flat however many codes there are.
+"""
+
+import io
+import multiprocessing
+import os
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Iterator, Optional
+
+from PIL import Image, ImageDraw, ImageFont
+
+from services.database import db_service
+from services.qr import render_qr
+
+
+# black on white prints and scans better than the terminal theme
+PRINT_FRONT = (0, 0, 0)
+PRINT_BACK = (255, 255, 255)
+
+QR_KINDS = {
+    "login": "LOGIN",
+    "send": "SEND",
+    "pay": "PAY",
+    "perk": "PERK",
+}
+
+# A4 at 150 DPI
+PAGE_SIZE = (1240, 1754)
+PAGE_MARGIN = 60
+LABEL_HEIGHT = 56
+PAGE_DPI = 150
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+async def collect_codes(kinds: list[str]) -> list[tuple[str, str]]:
+    """(payload, label) for every entity of the requested kinds."""
+    codes = []
+    if "login" in kinds or "send" in kinds:
+        users = await db_service.get_all_users()
+        for kind in ("login", "send"):
+            if kind in kinds:
+                codes += [(f"{QR_KINDS[kind]}:{u['player_uuid']}", u["name"]) for u in users]
+    if "pay" in kinds:
+        codes += [(f"PAY:{i['item_id']}", i["name"]) for i in await db_service.get_all_items()]
+    if "perk" in kinds:
+        codes += [(f"PERK:{p['perk_id']}", p["name"]) for p in await db_service.get_all_perks()]
+    return codes
+
+
+def render_print_qr(payload: str, box_size: int = 8) -> bytes:
+    return render_qr(payload, box_size, PRINT_FRONT, PRINT_BACK, "PNG")
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process that runs an event loop and threads is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pool
+
+
+def shutdown_renderer():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def render_all(payloads: list[str], box_size: int = 8) -> list[bytes]:
+    """Render payloads in the worker pool, preserving order."""
+    workers = os.cpu_count() or 1
+    if workers == 1 or len(payloads) < 50:
+        return [render_print_qr(payload, box_size) for payload in payloads]
+
+    global _pool
+    pool = _get_pool()
+    try:
+        return list(pool.map(
+            render_print_qr, payloads, [box_size] * len(payloads),
+            chunksize=max(1, len(payloads) // (workers * 4)),
+        ))
+    except BrokenProcessPool:
+        # a worker died; start fresh next time
+        _pool = None
+        raise
+
+
+def _load_font(size: int):
+    try:
+        return ImageFont.truetype("DejaVuSans.ttf", size), True
+    except OSError:
+        # bitmap fallback has no Cyrillic, labels show the payload only
+        return ImageFont.load_default(), False
+
+
+def layout_pages(codes: list[tuple[str, str]], images: list[bytes], columns: int = 4) -> Iterator[Image.Image]:
+    """Place QR codes with labels on A4 pages, one page at a time."""
+    font, unicode_font = _load_font(18)
+    width, height = PAGE_SIZE
+    cell = (width - 2 * PAGE_MARGIN) // columns
+    qr_side = cell - 20
+    rows = (height - 2 * PAGE_MARGIN) // (cell + LABEL_HEIGHT)
+    per_page = rows * columns
+
+    if not codes:
+        yield Image.new("RGB", PAGE_SIZE, PRINT_BACK)
+    for start in range(0, len(codes), per_page):
+        page = Image.new("RGB", PAGE_SIZE, PRINT_BACK)
+        draw = ImageDraw.Draw(page)
+        for n, ((payload, label), image_bytes) in enumerate(
+            zip(codes[start:start + per_page], images[start:start + per_page])
+        ):
+            x = PAGE_MARGIN + (n % columns) * cell
+            y = PAGE_MARGIN + (n // columns) * (cell + LABEL_HEIGHT)
+            qr_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+            page.paste(qr_image.resize((qr_side, qr_side), Image.NEAREST), (x + 10, y))
+            lines = [payload, label] if unicode_font else [payload]
+            for line_no, line in enumerate(lines):
+                draw.text((x + 10, y + qr_side + 4 + line_no * 22), line[:28], fill=PRINT_FRONT, font=font)
+        yield page
+
+
+class _PdfWriter:
+    """Minimal PDF writer: one full-page image per page, written out as it comes."""
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.offsets: list[Optional[int]] = [None, None]  # objects 1 (catalog) and 2 (page tree) go last
+        self.pages: list[int] = []
+        out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _object(self, body: bytes, stream: Optional[bytes] = None, number: Optional[int] = None) -> int:
+        if number is None:
+            self.offsets.append(None)
+            number = len(self.offsets)
+        self.offsets[number - 1] = self.out.tell()
+        self.out.write(f"{number} 0 obj\n".encode() + body)
+        if stream is not None:
+            self.out.write(b"\nstream\n" + stream + b"\nendstream")
+        self.out.write(b"\nendobj\n")
+        return number
+
+    def add_page(self, page: Image.Image):
+        # lossless grayscale: QR modules stay sharp, and mostly white pages deflate well
+        gray = page.convert("L")
+        width, height = gray.size
+        data = zlib.compress(gray.tobytes(), 6)
+        image = self._object(
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} /ColorSpace /DeviceGray "
+            f"/BitsPerComponent 8 /Filter /FlateDecode /Length {len(data)} >>".encode(),
+            data,
+        )
+        page_width, page_height = f"{width * 72 / PAGE_DPI:.2f}", f"{height * 72 / PAGE_DPI:.2f}"  # points
+        content = f"q {page_width} 0 0 {page_height} 0 0 cm /Im Do Q".encode()
+        contents = self._object(f"<< /Length {len(content)} >>".encode(), content)
+        self.pages.append(self._object(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_width} {page_height}] "
+            f"/Resources << /XObject << /Im {image} 0 R >> >> /Contents {contents} 0 R >>".encode()
+        ))
+
+    def close(self):
+        kids = " ".join(f"{page} 0 R" for page in self.pages)
+        self._object(f"<< /Type /Pages /Kids [{kids}] /Count {len(self.pages)} >>".encode(), number=2)
+        self._object(b"<< /Type /Catalog /Pages 2 0 R >>", number=1)
+        xref = self.out.tell()
+        self.out.write(f"xref\n0 {len(self.offsets) + 1}\n0000000000 65535 f \n".encode())
+        self.out.write(b"".join(f"{offset:010d} 00000 n \n".encode() for offset in self.offsets))
+        self.out.write(
+            f"trailer\n<< /Size {len(self.offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+        )
+
+
+def build_sheet(codes: list[tuple[str, str]], out: BinaryIO, fmt: str = "pdf", columns: int = 4):
+    """
+    Render codes and write them to out (a seekable binary file) as "pdf",
+    "png" (ZIP of pages) or "zip" (one PNG per code).
+    """
+    images = render_all([payload for payload, _ in codes])
+
+    if fmt == "zip":
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+            for (payload, _), image_bytes in zip(codes, images):
+                archive.writestr(f"qr_{payload.replace(':', '_')}.png", image_bytes)
+        return
+
+    pages = layout_pages(codes, images, columns)
+    if fmt == "pdf":
+        writer = _PdfWriter(out)
+        for page in pages:
+            writer.add_page(page)
+        writer.close()
+        return
+
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        for page_no, page in enumerate(pages, 1):
+            page_buffer = io.BytesIO()
+            page.save(page_buffer, format="PNG")
+            archive.writestr(f"qr_page_{page_no:03d}.png", page_buffer.getvalue())
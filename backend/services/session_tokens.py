@@ -0,0 +1,89 @@
+"""Signed player session tokens.
+
+/api/auth/login issues a token carrying the user's primary key and
+player_uuid, signed with HMAC-SHA256 under a key derived from
+settings.secret_key. Player endpoints take current_player instead of a
+player_uuid parameter: the signature proves the player exists, so they skip
+the lookup and query by primary key directly.
+"""
+
+import base64
+import hashlib
+import hmac
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Header, HTTPException, Query
+
+from config.settings import settings
+
+_KEY = hashlib.sha256(f"session-token:{settings.secret_key}".encode()).digest()
+
+
+@dataclass(frozen=True)
+class SessionPlayer:
+    id: int
+    player_uuid: str
+
+
+def _b64(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload: str) -> str:
+    return _b64(hmac.new(_KEY, payload.encode(), hashlib.sha256).digest())
+
+
+def issue_token(user_id: int, player_uuid: str) -> str:
+    expires = int(time.time()) + settings.session_token_ttl_hours * 3600
+    payload = _b64(f"{user_id}:{player_uuid}:{expires}".encode())
+    return f"{payload}.{_sign(payload)}"
+
+
+def read_token(token: str) -> Optional[SessionPlayer]:
+    """The player a token was issued to, or None if it is forged or expired."""
+    payload, _, signature = token.partition(".")
+    if not signature or not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    try:
+        user_id, player_uuid, expires = _unb64(payload).decode().split(":")
+        if int(expires) < time.time():
+            return None
+        return SessionPlayer(id=int(user_id), player_uuid=player_uuid)
+    except ValueError:
+        return None
+
+
+def _from_request(authorization: Optional[str], token: Optional[str]) -> Optional[SessionPlayer]:
+    if authorization and authorization.lower().startswith("bearer "):
+        token = authorization[7:].strip()
+    if not token:
+        return None
+    player = read_token(token)
+    if player is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired session")
+    return player
+
+
+async def current_player(
+    authorization: Optional[str] = Header(default=None),
+    token: Optional[str] = Query(default=None, include_in_schema=False),
+) -> SessionPlayer:
+    """Player from the Authorization: Bearer token (or ?token= for EventSource)."""
+    player = _from_request(authorization, token)
+    if player is None:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    return player
+
+
+async def optional_player(
+    authorization: Optional[str] = Header(default=None),
+    token: Optional[str] = Query(default=None, include_in_schema=False),
+) -> Optional[SessionPlayer]:
+    """Like current_player, but anonymous requests get None."""
+    return _from_request(authorization, token)
@@ -1,12 +1,96 @@
+"""Google Sheets backend with an in-memory row index and batched writes.
+
+Each worksheet is read once with get_all_values() into a _Table: the
+records plus an index on its key columns (player_uuid, item_id, perk_id,
+...), so lookups never call the API. Every sheets_cache_ttl seconds a table
+reads only the rows appended after its last known row; every
+sheets_full_refresh seconds it reloads in full to pick up in-place edits.
+
+Writes change the cached rows at once and are queued: cell updates to the
+same cell coalesce, all of them go out in one values_batch_update, appended
+rows in one append_rows per sheet. The queue is flushed after
+sheets_flush_interval seconds, when it reaches sheets_batch_size, before a
+refresh, or by flush(). A failed flush keeps the queue, and the table keeps
+serving its cache without reloading until the queue is sent.
+"""
+
 import json
+import logging
+import re
+import threading
+import time
 import uuid
-from typing import Optional
+from datetime import datetime
+from typing import Any, Optional
 
 import gspread
 from google.oauth2.service_account import Credentials
+from gspread.utils import numericise_all, rowcol_to_a1
 
 from config.settings import settings
 
+logger = logging.getLogger(__name__)
+
+# worksheet -> columns with an index
+TABLE_KEYS = {
+    "Users": ("player_uuid", "user_id"),
+    "Attributes": ("attribute_name",),
+    "Items": ("item_id",),
+    "Perks": ("perk_id",),
+    "UserPerks": ("player_uuid",),
+    "Traders": ("trader_id",),
+    "Transactions": (),
+}
+
+
+class _Table:
+    """Cached copy of one worksheet; row i of self.rows is sheet row i + 2."""
+
+    def __init__(self, worksheet: gspread.Worksheet, keys: tuple[str, ...]):
+        self.worksheet = worksheet
+        self.keys = keys
+        self.headers: list[str] = []
+        self.rows: list[dict] = []
+        self.index: dict[str, dict[str, list[int]]] = {}
+        self.synced = 0  # rows known to exist in the sheet; the rest await append
+        self.loaded_at = 0.0
+        self.full_at = 0.0
+
+    def load(self):
+        values = self.worksheet.get_all_values()
+        self.headers = values[0] if values else []
+        self.rows = []
+        self.index = {key: {} for key in self.keys}
+        self._add(values[1:])
+        self.synced = len(self.rows)
+        self.loaded_at = self.full_at = time.monotonic()
+
+    def load_tail(self):
+        """Read rows appended by someone else since the last load; only with no appends queued."""
+        last_col = rowcol_to_a1(1, max(len(self.headers), 1))[:-1]
+        values = self.worksheet.get(f"A{self.synced + 2}:{last_col}")
+        self._add(values)
+        self.synced = len(self.rows)
+        self.loaded_at = time.monotonic()
+
+    def _add(self, values: list[list]):
+        for raw in values:
+            raw = list(raw) + [""] * (len(self.headers) - len(raw))
+            self._index(len(self.rows), dict(zip(self.headers, numericise_all(raw, default_blank=""))))
+
+    def _index(self, position: int, record: dict):
+        if position == len(self.rows):
+            self.rows.append(record)
+        for key in self.keys:
+            self.index[key].setdefault(str(record.get(key, "")), []).append(position)
+
+    def find(self, key: str, value: Any) -> list[int]:
+        return self.index[key].get(str(value), [])
+
+    def first(self, key: str, value: Any) -> Optional[dict]:
+        positions = self.find(key, value)
+        return self.rows[positions[0]] if positions else None
+
 
 class SheetsService:
     SCOPES = [
@@ -14,9 +98,17 @@ class SheetsService:
         "https://www.googleapis.com/auth/drive",
     ]
 
-    def __init__(self):
-        self._client: Optional[gspread.Client] = None
+    def __init__(self, client: Optional[gspread.Client] = None):
+        self._client = client
         self._spreadsheet: Optional[gspread.Spreadsheet] = None
+        self._tables: dict[str, _Table] = {}
+        self._cells: dict[tuple[str, int, int], Any] = {}  # (sheet, row, col) -> value
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        self.cache_ttl = settings.sheets_cache_ttl
+        self.full_refresh = settings.sheets_full_refresh
+        self.flush_interval = settings.sheets_flush_interval
+        self.batch_size = settings.sheets_batch_size
 
     def _get_client(self) -> gspread.Client:
         if self._client is None:
@@ -54,21 +146,110 @@ class SheetsService:
     def get_transactions_sheet(self) -> gspread.Worksheet:
         return self._get_spreadsheet().worksheet("Transactions")
 
+    # Cache and write queue
+    def _table(self, name: str) -> _Table:
+        """The cached worksheet, refreshed when its TTL is up."""
+        with self._lock:
+            table = self._tables.get(name)
+            if table is None:
+                table = self._tables[name] = _Table(self._get_spreadsheet().worksheet(name), TABLE_KEYS[name])
+            now = time.monotonic()
+            if table.full_at and now - table.loaded_at < self.cache_ttl:
+                return table
+            if table.full_at:
+                self.flush()
+                if self._has_queued(name):
+                    # the flush failed: a reload would drop the queued writes,
+                    # so keep serving the cache until they are sent
+                    table.loaded_at = now
+                    return table
+            if not table.full_at or now - table.full_at >= self.full_refresh:
+                table.load()
+            else:
+                table.load_tail()
+            return table
+
+    def _has_queued(self, name: str) -> bool:
+        table = self._tables[name]
+        return len(table.rows) > table.synced or any(key[0] == name for key in self._cells)
+
+    def _set(self, name: str, position: int, column: str, value: Any):
+        """Change one cell of a cached row and queue the write."""
+        with self._lock:
+            table = self._tables[name]
+            # before touching the cache: a column the sheet lacks must leave it as it was
+            column_number = table.headers.index(column) + 1
+            record = table.rows[position]
+            if column in table.keys:
+                table.find(column, record.get(column)).remove(position)
+                table.index[column].setdefault(str(value), []).append(position)
+            record[column] = value
+            # rows still waiting to be appended carry the new value along
+            if position < table.synced:
+                self._cells[(name, position + 2, column_number)] = value
+                self._queued()
+
+    def _append(self, name: str, values: list):
+        with self._lock:
+            table = self._table(name)
+            values = list(values) + [""] * (len(table.headers) - len(values))
+            table._index(len(table.rows), dict(zip(table.headers, values)))
+            self._queued()
+
+    def _queued(self):
+        pending = len(self._cells) + sum(len(t.rows) - t.synced for t in self._tables.values())
+        if pending >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """Send queued appends and cell updates; kept for the next flush on error."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            try:
+                # cells first: their rows are already in the sheet, and a reload
+                # after misplaced appends must see them
+                if self._cells:
+                    self._get_spreadsheet().values_batch_update({
+                        "valueInputOption": "USER_ENTERED",
+                        "data": [
+                            {"range": f"'{name}'!{rowcol_to_a1(row, col)}", "values": [[value]]}
+                            for (name, row, col), value in self._cells.items()
+                        ],
+                    })
+                    self._cells.clear()
+                for table in self._tables.values():
+                    if len(table.rows) > table.synced:
+                        self._flush_appends(table)
+            except Exception as e:
+                logger.error(f"Sheets flush error: {e}")
+
+    def _flush_appends(self, table: _Table):
+        rows = table.rows[table.synced:]
+        result = table.worksheet.append_rows(
+            [[record.get(h, "") for h in table.headers] for record in rows],
+            value_input_option="USER_ENTERED",
+        )
+        expected = table.synced + 2
+        table.synced = len(table.rows)
+        # someone else appended meanwhile: our row numbers are off
+        match = re.search(r"![A-Z]+(\d+)", (result or {}).get("updates", {}).get("updatedRange", ""))
+        if match and int(match.group(1)) != expected:
+            table.load()
+
+    # Users
     def get_user_by_telegram_id(self, user_id: int) -> Optional[dict]:
-        sheet = self.get_users_sheet()
-        records = sheet.get_all_records()
-        for record in records:
-            if str(record.get("user_id")) == str(user_id):
-                return self._parse_user(record)
-        return None
+        record = self._table("Users").first("user_id", user_id)
+        return self._parse_user(record) if record else None
 
     def get_user_by_uuid(self, player_uuid: str) -> Optional[dict]:
-        sheet = self.get_users_sheet()
-        records = sheet.get_all_records()
-        for record in records:
-            if record.get("player_uuid") == player_uuid:
-                return self._parse_user(record)
-        return None
+        record = self._table("Users").first("player_uuid", player_uuid)
+        return self._parse_user(record) if record else None
 
     def _parse_user(self, record: dict) -> dict:
         """Parse user record and convert attributes_json to dict."""
@@ -83,13 +264,12 @@ class SheetsService:
         return user
 
     def create_user(self, user_id: int, name: str) -> dict:
-        sheet = self.get_users_sheet()
         player_uuid = str(uuid.uuid4())[:8].upper()
 
         # Get default attributes from config
         default_attrs = self._get_default_attributes()
 
-        row = [
+        self._append("Users", [
             user_id,
             player_uuid,
             name,
@@ -97,8 +277,7 @@ class SheetsService:
             100,  # starting balance
             "",  # band
             json.dumps(default_attrs),
-        ]
-        sheet.append_row(row, value_input_option="USER_ENTERED")
+        ])
 
         return {
             "user_id": user_id,
@@ -130,56 +309,38 @@ class SheetsService:
                 "luck": 5,
             }
 
-    def update_balance(self, player_uuid: str, new_balance: int) -> bool:
-        sheet = self.get_users_sheet()
+    def _set_by_key(self, name: str, key: str, value: Any, column: str, new_value: Any) -> bool:
         try:
-            cell = sheet.find(player_uuid)
-            if cell:
-                # Balance is in column E (index 5)
-                sheet.update_cell(cell.row, 5, new_balance)
+            positions = self._table(name).find(key, value)
+            if positions:
+                self._set(name, positions[0], column, new_value)
                 return True
         except Exception:
             pass
         return False
 
+    def update_balance(self, player_uuid: str, new_balance: int) -> bool:
+        return self._set_by_key("Users", "player_uuid", player_uuid, "balance", new_balance)
+
     def link_telegram_to_player(self, telegram_id: int, player_uuid: str) -> bool:
         """Link a telegram user to a player. Clears previous links."""
-        sheet = self.get_users_sheet()
         try:
-            # First, clear any existing link for this telegram_id
-            records = sheet.get_all_records()
-            for i, record in enumerate(records):
-                if str(record.get("user_id")) == str(telegram_id):
-                    # Clear this link (row index is i+2 because of header)
-                    sheet.update_cell(i + 2, 1, "")
-
-            # Now link to the new player
-            cell = sheet.find(player_uuid)
-            if cell:
-                # user_id is in column A (index 1)
-                sheet.update_cell(cell.row, 1, telegram_id)
-                return True
+            with self._lock:
+                table = self._table("Users")
+                # First, clear any existing link for this telegram_id
+                for position in list(table.find("user_id", telegram_id)):
+                    self._set("Users", position, "user_id", "")
+                # Now link to the new player
+                return self._set_by_key("Users", "player_uuid", player_uuid, "user_id", telegram_id)
         except Exception:
-            pass
-        return False
+            return False
 
     def unlink_telegram(self, telegram_id: int) -> bool:
         """Unlink a telegram user from their current player."""
-        sheet = self.get_users_sheet()
-        try:
-            records = sheet.get_all_records()
-            for i, record in enumerate(records):
-                if str(record.get("user_id")) == str(telegram_id):
-                    # Clear this link (row index is i+2 because of header)
-                    sheet.update_cell(i + 2, 1, "")
-                    return True
-        except Exception:
-            pass
-        return False
+        return self._set_by_key("Users", "user_id", telegram_id, "user_id", "")
 
     def get_attribute_config(self) -> list[dict]:
-        sheet = self.get_attributes_sheet()
-        return sheet.get_all_records()
+        return [dict(record) for record in self._table("Attributes").rows]
 
     def get_user_stats(self, player_uuid: str) -> Optional[dict]:
         """Get user attributes with full config info."""
@@ -209,25 +370,19 @@ class SheetsService:
             "attributes": attributes,
         }
 
-
     # Items methods
     def get_item_by_id(self, item_id: str) -> Optional[dict]:
         """Get item by its ID."""
         try:
-            sheet = self.get_items_sheet()
-            records = sheet.get_all_records()
-            for record in records:
-                if record.get("item_id") == item_id:
-                    return dict(record)
+            record = self._table("Items").first("item_id", item_id)
+            return dict(record) if record else None
         except Exception:
-            pass
-        return None
+            return None
 
     def get_all_items(self) -> list[dict]:
         """Get all available items."""
         try:
-            sheet = self.get_items_sheet()
-            return sheet.get_all_records()
+            return [dict(record) for record in self._table("Items").rows]
         except Exception:
             return []
 
@@ -235,34 +390,25 @@ class SheetsService:
     def get_perk_by_id(self, perk_id: str) -> Optional[dict]:
         """Get perk by its ID."""
         try:
-            sheet = self.get_perks_sheet()
-            records = sheet.get_all_records()
-            for record in records:
-                if record.get("perk_id") == perk_id:
-                    return dict(record)
+            record = self._table("Perks").first("perk_id", perk_id)
+            return dict(record) if record else None
         except Exception:
-            pass
-        return None
+            return None
 
     def get_all_perks(self) -> list[dict]:
         """Get all available perks."""
         try:
-            sheet = self.get_perks_sheet()
-            return sheet.get_all_records()
+            return [dict(record) for record in self._table("Perks").rows]
         except Exception:
             return []
 
     def has_user_perk(self, player_uuid: str, perk_id: str) -> bool:
         """Check if user already has this perk applied."""
         try:
-            sheet = self.get_user_perks_sheet()
-            records = sheet.get_all_records()
-            for record in records:
-                if record.get("player_uuid") == player_uuid and record.get("perk_id") == perk_id:
-                    return True
+            table = self._table("UserPerks")
+            return any(table.rows[p].get("perk_id") == perk_id for p in table.find("player_uuid", player_uuid))
         except Exception:
-            pass
-        return False
+            return False
 
     def apply_perk(self, player_uuid: str, perk_id: str) -> bool:
         """Apply a perk to user. Returns False if one_time perk already applied."""
@@ -294,13 +440,7 @@ class SheetsService:
 
         # record perk application
         try:
-            from datetime import datetime
-            sheet = self.get_user_perks_sheet()
-            sheet.append_row([
-                player_uuid,
-                perk_id,
-                datetime.now().isoformat()
-            ], value_input_option="USER_ENTERED")
+            self._append("UserPerks", [player_uuid, perk_id, datetime.now().isoformat()])
         except Exception:
             pass
 
@@ -308,29 +448,19 @@ class SheetsService:
 
     def _update_user_attributes(self, player_uuid: str, attributes: dict) -> bool:
         """Update user attributes JSON."""
-        sheet = self.get_users_sheet()
-        try:
-            cell = sheet.find(player_uuid)
-            if cell:
-                # attributes_json is in column G (index 7)
-                sheet.update_cell(cell.row, 7, json.dumps(attributes))
-                return True
-        except Exception:
-            pass
-        return False
+        return self._set_by_key("Users", "player_uuid", player_uuid, "attributes_json", json.dumps(attributes))
 
     def get_user_perks(self, player_uuid: str) -> list[dict]:
         """Get all perks applied to user."""
         try:
-            sheet = self.get_user_perks_sheet()
-            records = sheet.get_all_records()
+            table = self._table("UserPerks")
             user_perks = []
-            for record in records:
-                if record.get("player_uuid") == player_uuid:
-                    perk = self.get_perk_by_id(record.get("perk_id"))
-                    if perk:
-                        perk["applied_at"] = record.get("applied_at")
-                        user_perks.append(perk)
+            for position in table.find("player_uuid", player_uuid):
+                record = table.rows[position]
+                perk = self.get_perk_by_id(record.get("perk_id"))
+                if perk:
+                    perk["applied_at"] = record.get("applied_at")
+                    user_perks.append(perk)
             return user_perks
         except Exception:
             return []
@@ -339,35 +469,21 @@ class SheetsService:
     def get_trader_by_id(self, trader_id: str) -> Optional[dict]:
         """Get trader by ID."""
         try:
-            sheet = self.get_traders_sheet()
-            records = sheet.get_all_records()
-            for record in records:
-                if record.get("trader_id") == trader_id:
-                    return dict(record)
+            record = self._table("Traders").first("trader_id", trader_id)
+            return dict(record) if record else None
         except Exception:
-            pass
-        return None
+            return None
 
     def get_all_traders(self) -> list[dict]:
         """Get all traders."""
         try:
-            sheet = self.get_traders_sheet()
-            return sheet.get_all_records()
+            return [dict(record) for record in self._table("Traders").rows]
         except Exception:
             return []
 
     def update_trader_balance(self, trader_id: str, new_balance: int) -> bool:
         """Update trader balance."""
-        sheet = self.get_traders_sheet()
-        try:
-            cell = sheet.find(trader_id)
-            if cell:
-                # balance is in column C (index 3)
-                sheet.update_cell(cell.row, 3, new_balance)
-                return True
-        except Exception:
-            pass
-        return False
+        return self._set_by_key("Traders", "trader_id", trader_id, "balance", new_balance)
 
     # Transactions methods
     def log_transaction(
@@ -382,9 +498,7 @@ class SheetsService:
     ) -> bool:
         """Log a transaction."""
         try:
-            from datetime import datetime
-            sheet = self.get_transactions_sheet()
-            sheet.append_row([
+            self._append("Transactions", [
                 datetime.now().isoformat(),
                 from_type,
                 from_id,
@@ -393,7 +507,7 @@ class SheetsService:
                 amount,
                 tx_type,
                 description
-            ], value_input_option="USER_ENTERED")
+            ])
             return True
         except Exception:
             return False
@@ -401,22 +515,18 @@ class SheetsService:
     def get_transactions(self, limit: int = 100) -> list[dict]:
         """Get recent transactions."""
         try:
-            sheet = self.get_transactions_sheet()
-            records = sheet.get_all_records()
-            return records[-limit:] if len(records) > limit else records
+            return [dict(record) for record in self._table("Transactions").rows[-limit:]]
         except Exception:
             return []
 
     def get_user_transactions(self, player_uuid: str, limit: int = 50) -> list[dict]:
         """Get transactions for a specific user."""
         try:
-            sheet = self.get_transactions_sheet()
-            records = sheet.get_all_records()
             user_txs = [
-                r for r in records
+                dict(r) for r in self._table("Transactions").rows
                 if r.get("from_id") == player_uuid or r.get("to_id") == player_uuid
             ]
-            return user_txs[-limit:] if len(user_txs) > limit else user_txs
+            return user_txs[-limit:]
         except Exception:
             return []
 
@@ -424,34 +534,23 @@ class SheetsService:
         """Update image_url for item or perk."""
         try:
             if entity_type == "item":
-                sheet = self.get_items_sheet()
-                id_col = "item_id"
+                name, id_col = "Items", "item_id"
             elif entity_type == "perk":
-                sheet = self.get_perks_sheet()
-                id_col = "perk_id"
+                name, id_col = "Perks", "perk_id"
             else:
                 return False
 
-            headers = sheet.row_values(1)
-
-            # ensure image_url column exists
-            if "image_url" not in headers:
-                col = len(headers) + 1
-                sheet.update_cell(1, col, "image_url")
-                headers.append("image_url")
-
-            image_col = headers.index("image_url") + 1
-
-            # find entity row
-            records = sheet.get_all_records()
-            for i, record in enumerate(records):
-                if record.get(id_col) == entity_id:
-                    sheet.update_cell(i + 2, image_col, image_url)
-                    return True
-
-            return False
+            with self._lock:
+                table = self._table(name)
+                # ensure image_url column exists
+                if "image_url" not in table.headers:
+                    table.headers.append("image_url")
+                    for record in table.rows:
+                        record.setdefault("image_url", "")
+                    self._cells[(name, 1, len(table.headers))] = "image_url"
+                return self._set_by_key(name, id_col, entity_id, "image_url", image_url)
         except Exception as e:
-            print(f"Update image error: {e}")
+            logger.error(f"Update image error: {e}")
             return False
 
 
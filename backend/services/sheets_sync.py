@@ -0,0 +1,392 @@
+"""Incremental Postgres -> Google Sheets export.
+
+Each exported table has a db_* worksheet and a cursor column. Append-only
+tables (transactions, user_perks) export rows with an id above the highest
+id already in the sheet; mutable tables (users, traders) export rows whose
+(updated_at, key) comes after the newest pair in the sheet, rewriting a row
+in place when its key is already there. The key breaks ties, so a batch
+may end in the middle of rows sharing one updated_at. The cursors are read back from the
+worksheets when the exporter starts, so the sheet itself is the record of
+what has been exported.
+
+Every sheets_sync_interval seconds the changed rows go out in at most one
+values_batch_update (rows rewritten in place) and one append_rows per
+worksheet (new rows). Rows younger than sheets_sync_settle seconds are
+looked at again next time: a transaction that commits late can carry an
+earlier id or timestamp than rows already exported. Quota (429) and server
+errors back off exponentially up to sheets_sync_max_backoff; after anything
+but a 429 the cursors are re-read from the sheet before the next attempt.
+
+Only one process exports at a time: the first to take a Postgres advisory
+lock keeps it, on one pooled connection, until shutdown.
+"""
+
+import asyncio
+import json
+import logging
+import random
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import rowcol_to_a1
+from sqlalchemy import Select, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from config.settings import settings
+from models import engine, async_session, Perk, Trader, Transaction, User, UserPerk
+from models.base import now_local
+from services.sheets import sheets_service
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SYNC_LOCK = 0x73796E63  # pg advisory lock key held by the exporting process
+
+
+@dataclass
+class SyncTable:
+    worksheet: str
+    query: Select  # columns in the order of headers
+    headers: list[str]
+    cursor: Any  # id column (append-only) or updated_at column (upsert)
+    key: Optional[str] = None  # header identifying a row; None for append-only tables
+    settle: Any = None  # append-only: timestamp column that must be older than the settle window
+
+    @property
+    def append_only(self) -> bool:
+        return self.key is None
+
+
+@dataclass
+class _SheetState:
+    last_id: int = 0  # append-only: highest exported id
+    mark: str = ""  # upsert: newest exported updated_at (isoformat)
+    mark_key: str = ""  # upsert: greatest key exported with that updated_at
+    rows: dict[str, tuple[int, str]] = field(default_factory=dict)  # key -> (sheet row, updated_at)
+
+
+TABLES = [
+    SyncTable(
+        worksheet="db_users",
+        query=select(
+            User.id, User.player_uuid, User.telegram_id, User.name, User.profession, User.band,
+            User.balance, User.attributes, User.created_at, User.updated_at,
+        ),
+        headers=["id", "player_uuid", "telegram_id", "name", "profession", "band",
+                 "balance", "attributes", "created_at", "updated_at"],
+        cursor=User.updated_at,
+        key="player_uuid",
+    ),
+    SyncTable(
+        worksheet="db_traders",
+        query=select(Trader.trader_id, Trader.name, Trader.balance, Trader.updated_at),
+        headers=["trader_id", "name", "balance", "updated_at"],
+        cursor=Trader.updated_at,
+        key="trader_id",
+    ),
+    SyncTable(
+        worksheet="db_transactions",
+        query=select(
+            Transaction.id, Transaction.timestamp, Transaction.from_type, Transaction.from_id,
+            Transaction.to_type, Transaction.to_id, Transaction.amount, Transaction.tx_type,
+            Transaction.description,
+        ),
+        headers=["id", "timestamp", "from_type", "from_id", "to_type", "to_id",
+                 "amount", "tx_type", "description"],
+        cursor=Transaction.id,
+        settle=Transaction.timestamp,
+    ),
+    SyncTable(
+        worksheet="db_user_perks",
+        query=select(UserPerk.id, User.player_uuid, Perk.perk_id, UserPerk.applied_at)
+        .join(User, User.id == UserPerk.user_id)
+        .join(Perk, Perk.id == UserPerk.perk_id),
+        headers=["id", "player_uuid", "perk_id", "applied_at"],
+        cursor=UserPerk.id,
+        settle=UserPerk.applied_at,
+    ),
+]
+
+
+def _cell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+
+class SheetsSync:
+    def __init__(self, interval: float, batch_size: int, settle: float, max_backoff: float,
+                 tables: list[SyncTable] = TABLES, client=None):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.settle = settle
+        self.max_backoff = max_backoff
+        self.tables = tables
+        self._client = client
+        self._spreadsheet = None
+        self._worksheets: dict[str, Any] = {}
+        self._state: dict[str, _SheetState] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock_conn: Optional[AsyncConnection] = None
+        self._failures = 0
+        self.last_sync: Optional[datetime] = None
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        if self.interval <= 0 or not settings.google_sheet_id:
+            logger.info("Sheets sync disabled")
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Sheets sync started (every {self.interval}s)")
+
+    async def stop(self):
+        if not self._task:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._release_lock()
+
+    def status(self) -> dict:
+        return {
+            "enabled": self._task is not None,
+            "exporting": self._lock_conn is not None,
+            "last_sync": self.last_sync.isoformat() if self.last_sync else None,
+            "last_error": self.last_error,
+            "failures": self._failures,
+            "tables": {
+                table.worksheet: (
+                    {"last_id": state.last_id} if table.append_only
+                    else {"mark": state.mark, "rows": len(state.rows)}
+                )
+                for table in self.tables
+                if (state := self._state.get(table.worksheet))
+            },
+        }
+
+    async def _run(self):
+        while True:
+            delay = self.interval
+            try:
+                if await self._hold_lock():
+                    while await self.sync_once():
+                        pass  # a full batch: more rows are waiting
+                self._failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._failures += 1
+                self.last_error = f"{type(e).__name__}: {e}"
+                metrics.incr("sheets_sync.errors")
+                if not _is_rate_limited(e):
+                    # a write may have landed before the error: trust the sheet, not memory
+                    self._state.clear()
+                delay = min(self.interval * 2 ** self._failures, self.max_backoff)
+                delay += random.uniform(0, delay / 10)
+                logger.error(f"Sheets sync error, retrying in {delay:.0f}s: {e}")
+            await asyncio.sleep(delay)
+
+    async def _hold_lock(self) -> bool:
+        """Whether this process is the exporter; takes the lock if it is free."""
+        if self._lock_conn is not None:
+            try:
+                await self._lock_conn.scalar(select(1))
+                await self._lock_conn.commit()
+                return True
+            except Exception:
+                # the connection (and with it the lock) is gone; someone else may export now
+                logger.warning("Sheets sync lost its lock connection")
+                await self._release_lock()
+        conn = await engine.connect()
+        try:
+            locked = await conn.scalar(select(func.pg_try_advisory_lock(SYNC_LOCK)))
+            await conn.commit()  # session-level lock, no transaction held open
+        except Exception:
+            await conn.close()
+            raise
+        if not locked:
+            await conn.close()
+            return False
+        self._lock_conn = conn
+        self._state.clear()  # another process may have exported meanwhile
+        return True
+
+    async def _release_lock(self):
+        if self._lock_conn is None:
+            return
+        try:
+            await self._lock_conn.scalar(select(func.pg_advisory_unlock(SYNC_LOCK)))
+            await self._lock_conn.commit()
+        except Exception:
+            pass  # closing the connection releases it anyway
+        try:
+            await self._lock_conn.close()
+        except Exception:
+            pass
+        self._lock_conn = None
+
+    async def sync_once(self) -> bool:
+        """Export one batch per table; True if some table had a full batch."""
+        started = time.perf_counter()
+        if len(self._state) < len(self.tables):
+            await asyncio.to_thread(self._load_state)
+
+        changes = {}
+        for table in self.tables:
+            changes[table.worksheet] = await self._changed_rows(table, self._state[table.worksheet])
+
+        written = await asyncio.to_thread(self._write, changes)
+        self.last_sync = now_local()
+        self.last_error = None
+        if written:
+            metrics.incr("sheets_sync.rows", written)
+            metrics.observe("sheets_sync.duration_ms", (time.perf_counter() - started) * 1000)
+        return written > 0 and any(len(rows) >= self.batch_size for rows in changes.values())
+
+    async def _changed_rows(self, table: SyncTable, state: _SheetState) -> list[list]:
+        settled = now_local() - timedelta(seconds=self.settle)
+        query = table.query
+        if table.append_only:
+            query = query.where(table.cursor > state.last_id, table.settle <= settled)
+            order = [table.cursor]
+        else:
+            # rows can share an updated_at (an import chunk, the migration backfill),
+            # so the cursor is (updated_at, key); "C" makes the key order match Python's
+            key = query.selected_columns[table.headers.index(table.key)].collate("C")
+            order = [table.cursor, key]
+            if state.mark:
+                mark = datetime.fromisoformat(state.mark)
+                if settled < mark:
+                    # re-read the settle window for late commits; rows already written are dropped
+                    query = query.where(table.cursor > settled)
+                else:
+                    query = query.where(tuple_(table.cursor, key) > tuple_(mark, state.mark_key))
+        async with async_session() as session:
+            result = await session.execute(query.order_by(*order).limit(self.batch_size))
+            return [[_cell(v) for v in row] for row in result]
+
+    # gspread calls below run in a worker thread
+
+    def _get_spreadsheet(self):
+        if self._spreadsheet is None:
+            client = self._client or sheets_service._get_client()
+            self._spreadsheet = client.open_by_key(settings.google_sheet_id)
+        return self._spreadsheet
+
+    def _worksheet(self, table: SyncTable):
+        if table.worksheet not in self._worksheets:
+            spreadsheet = self._get_spreadsheet()
+            try:
+                worksheet = spreadsheet.worksheet(table.worksheet)
+            except WorksheetNotFound:
+                worksheet = spreadsheet.add_worksheet(table.worksheet, rows=1000, cols=len(table.headers))
+                worksheet.append_rows([table.headers], value_input_option="RAW")
+            self._worksheets[table.worksheet] = worksheet
+        return self._worksheets[table.worksheet]
+
+    def _load_state(self):
+        """Read each worksheet's cursor (and row positions) back from the sheet."""
+        for table in self.tables:
+            if table.worksheet in self._state:
+                continue
+            worksheet = self._worksheet(table)
+            state = _SheetState()
+            if table.append_only:
+                ids = worksheet.col_values(1)[1:]
+                state.last_id = max((int(v) for v in ids if v.isdigit()), default=0)
+            else:
+                values = worksheet.get_all_values()
+                if values and values[0] != table.headers:
+                    raise ValueError(f"Worksheet {table.worksheet} has unexpected headers {values[0]}")
+                key_col = table.headers.index(table.key)
+                mark_col = table.headers.index("updated_at")
+                for number, row in enumerate(values[1:], start=2):
+                    row = row + [""] * (len(table.headers) - len(row))
+                    state.rows[row[key_col]] = (number, row[mark_col])
+                    state.mark, state.mark_key = max((state.mark, state.mark_key), (row[mark_col], row[key_col]))
+            self._state[table.worksheet] = state
+
+    def _write(self, changes: dict[str, list[list]]) -> int:
+        updates = []  # value ranges rewritten in place, all in one request
+        appends: dict[str, list[list]] = {}
+        for table in self.tables:
+            rows = changes[table.worksheet]
+            state = self._state[table.worksheet]
+            if table.append_only:
+                appends[table.worksheet] = rows
+                continue
+            key_col = table.headers.index(table.key)
+            mark_col = table.headers.index("updated_at")
+            new = []
+            for row in rows:
+                known = state.rows.get(str(row[key_col]))
+                if known is None:
+                    new.append(row)
+                elif known[1] != row[mark_col]:
+                    last = rowcol_to_a1(known[0], len(table.headers))
+                    updates.append({"range": f"'{table.worksheet}'!A{known[0]}:{last}", "values": [row]})
+            appends[table.worksheet] = new
+
+        if updates:
+            self._get_spreadsheet().values_batch_update({"valueInputOption": "RAW", "data": updates})
+            for table in self.tables:
+                if not table.append_only:
+                    self._track(table, [u["values"][0] for u in updates
+                                        if u["range"].startswith(f"'{table.worksheet}'!")])
+
+        written = len(updates)
+        for table in self.tables:
+            rows = appends[table.worksheet]
+            if not rows:
+                continue
+            result = self._worksheet(table).append_rows(rows, value_input_option="RAW")
+            first_row = _first_row(result)
+            if first_row is None and not table.append_only:
+                self._state.pop(table.worksheet)  # positions unknown: re-read next time
+            else:
+                self._track(table, rows, first_row)
+            written += len(rows)
+        return written
+
+    def _track(self, table: SyncTable, rows: list[list], first_row: Optional[int] = None):
+        """Move the worksheet's cursor past rows that are now in the sheet."""
+        state = self._state[table.worksheet]
+        if table.append_only:
+            state.last_id = max(state.last_id, *(row[0] for row in rows))
+            return
+        key_col = table.headers.index(table.key)
+        mark_col = table.headers.index("updated_at")
+        for i, row in enumerate(rows):
+            key = str(row[key_col])
+            number = first_row + i if first_row is not None else state.rows[key][0]
+            state.rows[key] = (number, row[mark_col])
+            state.mark, state.mark_key = max((state.mark, state.mark_key), (row[mark_col], key))
+
+
+def _first_row(result: dict) -> Optional[int]:
+    match = re.search(r"![A-Z]+(\d+)", (result or {}).get("updates", {}).get("updatedRange", ""))
+    return int(match.group(1)) if match else None
+
+
+def _is_rate_limited(error: Exception) -> bool:
+    """A 429 is rejected before anything is written."""
+    return isinstance(error, APIError) and getattr(error.response, "status_code", 0) == 429
+
+
+sheets_sync = SheetsSync(
+    interval=settings.sheets_sync_interval,
+    batch_size=settings.sheets_sync_batch,
+    settle=settings.sheets_sync_settle,
+    max_backoff=settings.sheets_sync_max_backoff,
+)
@@ -0,0 +1,125 @@
+"""Telegram WebApp initData verification.
+
+The HMAC secret is derived from the bot token once, at import. Verified
+initData is cached in a small LRU keyed by its hash for
+telegram_auth_cache_ttl seconds, so a Mini App that sends the same initData
+with every request pays for the parse and HMAC once. auth_date older than
+telegram_auth_max_age is rejected, cached or not.
+
+telegram_user is the FastAPI dependency: initData comes from the
+X-Telegram-Init-Data header (or an init_data query parameter, for
+EventSource which cannot set headers).
+"""
+
+import hashlib
+import hmac
+import json
+import time
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Header, HTTPException, Query
+
+from config.settings import settings
+from utils.metrics import metrics
+
+CLOCK_SKEW = 60  # seconds an auth_date may lie in the future
+
+
+@dataclass(frozen=True)
+class WebAppUser:
+    telegram_id: Optional[int]
+    auth_date: int
+    data: dict  # all initData fields except hash
+
+
+class WebAppAuth:
+    def __init__(self, bot_token: str, max_age: int, cache_ttl: int, cache_size: int = 4096):
+        self.secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+        self.max_age = max_age
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, tuple[float, str, WebAppUser]] = OrderedDict()
+
+    def validate(self, init_data: str) -> Optional[WebAppUser]:
+        """Verified, fresh initData as a WebAppUser, or None."""
+        user = self._verify(init_data)
+        if user is None:
+            metrics.incr("webapp_auth.rejected")
+            return None
+        now = time.time()
+        if (self.max_age and now - user.auth_date > self.max_age) or user.auth_date - now > CLOCK_SKEW:
+            metrics.incr("webapp_auth.expired")
+            return None
+        return user
+
+    def _verify(self, init_data: str) -> Optional[WebAppUser]:
+        received_hash = _hash_param(init_data)
+        if not received_hash:
+            return None
+
+        cached = self._cache.get(received_hash)
+        if cached and cached[1] == init_data and cached[0] > time.monotonic():
+            self._cache.move_to_end(received_hash)
+            metrics.incr("webapp_auth.cache_hits")
+            return cached[2]
+
+        metrics.incr("webapp_auth.cache_misses")
+        try:
+            parsed = dict(urllib.parse.parse_qsl(init_data, strict_parsing=True))
+        except ValueError:
+            return None
+        parsed.pop("hash", None)
+        data_check_string = "\n".join(f"{k}={v}" for k, v in sorted(parsed.items()))
+        calculated_hash = hmac.new(self.secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(calculated_hash, received_hash):
+            return None
+
+        try:
+            auth_date = int(parsed.get("auth_date", 0))
+            telegram_id = json.loads(parsed["user"]).get("id") if "user" in parsed else None
+        except (ValueError, AttributeError):
+            return None
+        user = WebAppUser(telegram_id=telegram_id, auth_date=auth_date, data=parsed)
+
+        self._cache[received_hash] = (time.monotonic() + self.cache_ttl, init_data, user)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return user
+
+
+def _hash_param(init_data: str) -> Optional[str]:
+    for part in init_data.split("&"):
+        if part.startswith("hash="):
+            return part[5:]
+    return None
+
+
+webapp_auth = WebAppAuth(
+    bot_token=settings.bot_token,
+    max_age=settings.telegram_auth_max_age,
+    cache_ttl=settings.telegram_auth_cache_ttl,
+)
+
+
+async def telegram_user(
+    x_telegram_init_data: Optional[str] = Header(default=None),
+    init_data: Optional[str] = Query(default=None, include_in_schema=False),
+) -> Optional[WebAppUser]:
+    """
+    The Telegram user behind the request, or None outside Telegram.
+
+    Invalid or expired initData is a 401. Without initData the request is
+    anonymous, unless settings.require_telegram_auth is on.
+    """
+    raw = x_telegram_init_data or init_data
+    if not raw:
+        if settings.require_telegram_auth:
+            raise HTTPException(status_code=401, detail="Telegram authentication required")
+        return None
+    user = webapp_auth.validate(raw)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired Telegram initData")
+    return user
@@ -0,0 +1,105 @@
+"""In-process metrics: counters, gauges, histograms and per-request counters."""
+
+import bisect
+import threading
+from contextvars import ContextVar
+from typing import Optional
+
+
+# latency buckets in milliseconds
+MS_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# small integer counts (queries, checkouts, commits per request)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+
+
+class Histogram:
+    """Fixed-bucket histogram."""
+
+    def __init__(self, buckets: tuple = MS_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self) -> dict:
+        labels = [f"le_{b}" for b in self.buckets] + ["le_inf"]
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else 0,
+            "max": round(self.max, 3),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class Metrics:
+    """Thread-safe registry (SQLAdmin runs on the sync engine in a threadpool)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[str, int] = {}
+        self.gauges: dict[str, float] = {}
+        self.histograms: dict[str, Histogram] = {}
+
+    def incr(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name: str, value: float, buckets: tuple = MS_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self.counters.get(name, 0)
+
+    def histogram(self, name: str) -> Optional[dict]:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            return histogram.to_dict() if histogram else None
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": dict(sorted(self.gauges.items())),
+                "histograms": {
+                    name: histogram.to_dict()
+                    for name, histogram in sorted(self.histograms.items())
+                },
+            }
+
+
+metrics = Metrics()
+
+
+# per-request counters, set up by the HTTP middleware in main.py
+_request_counters: ContextVar[Optional[dict]] = ContextVar("request_counters", default=None)
+
+
+def start_request_counters() -> dict:
+    """Start counting for the current request. Returns the live counters dict."""
+    counters: dict[str, int] = {}
+    _request_counters.set(counters)
+    return counters
+
+
+def incr_request(name: str, value: int = 1):
+    """Increment a counter of the current request (no-op outside a request)."""
+    counters = _request_counters.get()
+    if counters is not None:
+        counters[name] = counters.get(name, 0) + value
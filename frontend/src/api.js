@@ -3,10 +3,18 @@ const BASE_URL = '/api';
 class ApiClient {
   constructor() {
     this.playerUuid = null;
+    this.token = null;
   }
 
-  setPlayerUuid(uuid) {
+  // token from /auth/login identifies the player on every other endpoint
+  setSession(uuid, token) {
     this.playerUuid = uuid;
+    this.token = token;
+  }
+
+  // Telegram WebApp initData, verified by the backend on every request
+  get initData() {
+    return window.Telegram?.WebApp?.initData || '';
   }
 
   async request(endpoint, options = {}) {
@@ -15,6 +23,8 @@ class ApiClient {
       ...options,
       headers: {
         'Content-Type': 'application/json',
+        ...(this.initData ? { 'X-Telegram-Init-Data': this.initData } : {}),
+        ...(this.token ? { Authorization: `Bearer ${this.token}` } : {}),
         ...options.headers,
       },
     });
@@ -43,15 +53,15 @@ class ApiClient {
   }
 
   async getMe() {
-    return this.request(`/users/me?player_uuid=${this.playerUuid}`);
+    return this.request('/users/me');
   }
 
   async getStats() {
-    return this.request(`/users/stats?player_uuid=${this.playerUuid}`);
+    return this.request('/users/stats');
   }
 
   async getQR(format = 'base64') {
-    return this.request(`/users/qr?player_uuid=${this.playerUuid}&format=${format}`);
+    return this.request(`/users/qr?format=${format}`);
   }
 
   async lookupUser(uuid) {
@@ -62,7 +72,6 @@ class ApiClient {
     return this.request('/transfer/send', {
       method: 'POST',
       body: JSON.stringify({
-        from_uuid: this.playerUuid,
         to_uuid: toUuid,
         amount: amount,
       }),
@@ -77,16 +86,25 @@ class ApiClient {
     });
   }
 
+  // Resolve a scan with player context (balance, active effects, perk state)
+  async resolveQR(data) {
+    return this.request('/qr/resolve', {
+      method: 'POST',
+      body: JSON.stringify({ data }),
+    });
+  }
+
   // Items
   async getItem(itemId) {
     return this.request(`/items/${itemId}`);
   }
 
-  async purchaseItem(itemId) {
+  // idempotencyKey: same key for retries of one purchase, so a double tap charges once
+  async purchaseItem(itemId, idempotencyKey) {
     return this.request('/items/purchase', {
       method: 'POST',
+      headers: idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {},
       body: JSON.stringify({
-        player_uuid: this.playerUuid,
         item_id: itemId,
       }),
     });
@@ -101,15 +119,33 @@ class ApiClient {
     return this.request('/perks/apply', {
       method: 'POST',
       body: JSON.stringify({
-        player_uuid: this.playerUuid,
         perk_id: perkId,
       }),
     });
   }
 
   async getMyPerks() {
-    return this.request(`/perks/user/${this.playerUuid}`);
+    return this.request('/perks/user/me');
+  }
+
+  // Push stream: balance, perk and effect changes. Returns the EventSource; close() it when done.
+  subscribe(onEvent) {
+    // EventSource cannot send headers, token and initData go in the query instead
+    const params = new URLSearchParams({ token: this.token });
+    if (this.initData) params.set('init_data', this.initData);
+    const source = new EventSource(`${BASE_URL}/stream/?${params}`);
+    for (const type of ['balance', 'perk', 'effect']) {
+      source.addEventListener(type, (e) => onEvent(type, JSON.parse(e.data)));
+    }
+    return source;
   }
 }
 
 export const api = new ApiClient();
+
+// Thumbnail of an image from the local store (/api/images/<sha256>.<ext>); other URLs unchanged.
+// Sizes: 64, 128, 400
+export function thumbnail(url, size) {
+  const match = /^\/api\/images\/([0-9a-f]{64})\.\w+$/.exec(url || '');
+  return match ? `${BASE_URL}/images/${match[1]}/${size}.webp` : url;
+}
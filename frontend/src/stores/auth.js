@@ -17,8 +17,11 @@ function createAuthStore() {
         name: userData.name,
         balance: userData.balance,
       });
-      // Save to localStorage for persistence
+      // Save to localStorage for persistence; /users/me responses carry no token
       localStorage.setItem('rpg_player_uuid', userData.player_uuid);
+      if (userData.token) {
+        localStorage.setItem('rpg_session_token', userData.token);
+      }
     },
     logout: () => {
       set({
@@ -28,14 +31,16 @@ function createAuthStore() {
         balance: 0,
       });
       localStorage.removeItem('rpg_player_uuid');
+      localStorage.removeItem('rpg_session_token');
     },
     updateBalance: (newBalance) => {
       update(state => ({ ...state, balance: newBalance }));
     },
     restore: () => {
       const uuid = localStorage.getItem('rpg_player_uuid');
-      if (uuid) {
-        return uuid;
+      const token = localStorage.getItem('rpg_session_token');
+      if (uuid && token) {
+        return { uuid, token };
       }
       return null;
     }
@@ -1,7 +1,9 @@
 """Seed Google Sheets with initial data."""
 
 import sys
-sys.path.insert(0, '/home/karmanov/projects/rpg-app/backend')
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
 
 import gspread
 from google.oauth2.service_account import Credentials